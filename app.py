@@ -1,9 +1,31 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, session, g, Blueprint
+from flask import Flask, render_template, request, redirect, url_for, flash, session, g, Blueprint, current_app, jsonify, Response, abort, stream_with_context, has_app_context, has_request_context, make_response
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, or_
-from datetime import datetime
+from sqlalchemy import func, or_, case, update, insert, tuple_, event
+from sqlalchemy.exc import IntegrityError, OperationalError
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from datetime import date, datetime, timedelta
+from array import array
+from collections import Counter, OrderedDict, namedtuple
+from types import SimpleNamespace
+import base64
+import bisect
+import csv
 import functools
+import hashlib
+import heapq
+import io
+import itertools
+import json
+import math
 import os
+import queue
+import random
+import threading
+import time
+import click
+from flask.cli import with_appcontext
+from jinja2.utils import htmlsafe_json_dumps
+from markupsafe import Markup, escape
 
 db = SQLAlchemy()
 
@@ -11,7 +33,11 @@ db = SQLAlchemy()
 
 class User(db.Model):
     __tablename__ = 'users'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_users_role_status', 'role', 'status'),
+        db.Index('ix_users_online_partners', 'current_area_id', sqlite_where=db.text("role = 'partner' AND is_online = 1")),
+        {'extend_existing': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
     password_hash = db.Column(db.String(120), nullable=False) 
@@ -42,7 +68,10 @@ class Area(db.Model):
 
 class Charge(db.Model):
     __tablename__ = 'charges'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ux_charges_from_to', 'from_area_id', 'to_area_id', unique=True),
+        {'extend_existing': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     from_area_id = db.Column(db.Integer, db.ForeignKey('areas.id'), nullable=False)
     to_area_id = db.Column(db.Integer, db.ForeignKey('areas.id'), nullable=False)
@@ -51,9 +80,18 @@ class Charge(db.Model):
     from_area = db.relationship('Area', foreign_keys=[from_area_id])
     to_area = db.relationship('Area', foreign_keys=[to_area_id])
 
+ACTIVE_ORDER_STATUSES = ('accepted', 'picked_up', 'arrived')
+
 class Order(db.Model):
     __tablename__ = 'orders'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        db.Index('ix_orders_pending_pickup', 'pickup_area_id', 'created_at', sqlite_where=db.text("status = 'pending'")),
+        db.Index('ix_orders_partner_status', 'partner_id', 'status', 'created_at'),
+        # A partner can hold at most one active order, enforced by the database
+        db.Index('ux_orders_partner_active', 'partner_id', unique=True, sqlite_where=db.text("status IN ('accepted', 'picked_up', 'arrived')")),
+        db.Index('ix_orders_customer_status', 'customer_id', 'status', 'created_at'),
+        {'extend_existing': True},
+    )
     id = db.Column(db.Integer, primary_key=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     partner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
@@ -70,6 +108,31 @@ class Order(db.Model):
     rating_comment = db.Column(db.String(200), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+class OrderArchive(db.Model):
+    # Cold storage for completed, rated orders past ORDER_ARCHIVE_AFTER_DAYS; same columns and
+    # ids as Order, moved by archive_orders() so the live table stays small
+    __tablename__ = 'orders_archive'
+    __table_args__ = (
+        db.Index('ix_orders_archive_customer', 'customer_id', 'created_at'),
+        db.Index('ix_orders_archive_partner', 'partner_id', 'created_at'),
+        {'extend_existing': True},
+    )
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    customer_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    partner_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
+    pickup_area_id = db.Column(db.Integer, db.ForeignKey('areas.id'), nullable=False)
+    drop_area_id = db.Column(db.Integer, db.ForeignKey('areas.id'), nullable=False)
+    pickup_area = db.relationship('Area', foreign_keys=[pickup_area_id])
+    drop_area = db.relationship('Area', foreign_keys=[drop_area_id])
+    pickup_address = db.Column(db.String(200), nullable=False)
+    drop_address = db.Column(db.String(200), nullable=False)
+    status = db.Column(db.String(20), default='completed')
+    amount = db.Column(db.Float, nullable=False)
+    commission = db.Column(db.Float, default=0.0)
+    rating = db.Column(db.Integer, nullable=True)
+    rating_comment = db.Column(db.String(200), nullable=True)
+    created_at = db.Column(db.DateTime)
+
 class Setting(db.Model):
     __tablename__ = 'settings'
     __table_args__ = {'extend_existing': True}
@@ -77,6 +140,1092 @@ class Setting(db.Model):
     key = db.Column(db.String(50), unique=True, nullable=False)
     value = db.Column(db.String(200), nullable=False)
 
+class AdminStats(db.Model):
+    # Single-row snapshot (id=1) of the admin dashboard totals
+    __tablename__ = 'admin_stats'
+    __table_args__ = {'extend_existing': True}
+    id = db.Column(db.Integer, primary_key=True)
+    total_orders = db.Column(db.Integer, default=0, nullable=False)
+    total_earnings = db.Column(db.Float, default=0.0, nullable=False)
+
+class PartnerStats(db.Model):
+    __tablename__ = 'partner_stats'
+    __table_args__ = {'extend_existing': True}
+    partner_id = db.Column(db.Integer, primary_key=True)
+    completed_orders = db.Column(db.Integer, default=0, nullable=False)
+    rating_total = db.Column(db.Integer, default=0, nullable=False)
+    rating_count = db.Column(db.Integer, default=0, nullable=False)
+
+    @property
+    def rating_avg(self):
+        return self.rating_total / self.rating_count if self.rating_count else None
+
+class DailyRouteStats(db.Model):
+    # Per-day rollup keyed by the order's creation day; completed columns only count completed orders
+    __tablename__ = 'daily_route_stats'
+    __table_args__ = {'extend_existing': True}
+    day = db.Column(db.Date, primary_key=True)
+    pickup_area_id = db.Column(db.Integer, primary_key=True)
+    drop_area_id = db.Column(db.Integer, primary_key=True)
+    orders_created = db.Column(db.Integer, default=0, nullable=False)
+    orders_completed = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    commission = db.Column(db.Float, default=0.0, nullable=False)
+
+class DailyPartnerStats(db.Model):
+    __tablename__ = 'daily_partner_stats'
+    __table_args__ = {'extend_existing': True}
+    day = db.Column(db.Date, primary_key=True)
+    partner_id = db.Column(db.Integer, primary_key=True)
+    deliveries = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(db.Float, default=0.0, nullable=False)
+    commission = db.Column(db.Float, default=0.0, nullable=False)
+    rating_total = db.Column(db.Integer, default=0, nullable=False)
+    rating_count = db.Column(db.Integer, default=0, nullable=False)
+
+class WalletEntry(db.Model):
+    # Append-only partner ledger in integer cents; users.wallet_balance is only a mirror
+    __tablename__ = 'wallet_entries'
+    __table_args__ = (
+        db.Index('ix_wallet_entries_partner', 'partner_id', 'id'),
+        {'extend_existing': True},
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    partner_id = db.Column(db.Integer, nullable=False)
+    order_id = db.Column(db.Integer, unique=True, nullable=True)
+    kind = db.Column(db.String(20), nullable=False, default='delivery')
+    amount_minor = db.Column(db.Integer, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class WalletBalance(db.Model):
+    # Ledger folded through last_entry_id; newer entries are added on read
+    __tablename__ = 'wallet_balances'
+    __table_args__ = {'extend_existing': True}
+    partner_id = db.Column(db.Integer, primary_key=True)
+    balance_minor = db.Column(db.Integer, nullable=False, default=0)
+    last_entry_id = db.Column(db.Integer, nullable=False, default=0)
+
+class DataVersion(db.Model):
+    # Monotonic counters other workers compare against to detect stale in-process caches
+    __tablename__ = 'data_versions'
+    __table_args__ = {'extend_existing': True}
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, default=0, nullable=False)
+
+def get_version(name):
+    return db.session.query(DataVersion.version).filter_by(name=name).scalar() or 0
+
+def bump_version(*names):
+    if not names: return
+    table = DataVersion.__table__
+    stmt = sqlite_insert(table).on_conflict_do_update(index_elements=[table.c.name], set_={'version': table.c.version + 1})
+    db.session.execute(stmt, [{'name': name, 'version': 1} for name in names])
+
+# ================= STORAGE =================
+
+SQLITE_PROFILES = {
+    # Stock pysqlite/SQLAlchemy behaviour: rollback journal, full fsync, 5s busy wait
+    'default': {'pragmas': {}, 'engine_options': {}},
+    # Concurrent writers: WAL lets dashboards keep reading while an order commits, and
+    # synchronous=NORMAL is durable across app crashes in WAL mode (fsync per checkpoint)
+    'tuned': {
+        'pragmas': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 10000,
+            'mmap_size': 256 * 1024 * 1024,
+            'cache_size': -64 * 1024,
+            'foreign_keys': 'ON',
+            'temp_store': 'MEMORY',
+        },
+        'engine_options': {'pool_size': 5, 'max_overflow': 10, 'pool_timeout': 30, 'connect_args': {'timeout': 10}},
+    },
+}
+
+def is_sqlite_file(uri):
+    return uri.startswith('sqlite') and ':memory:' not in uri and uri not in ('sqlite://', 'sqlite:///')
+
+def apply_sqlite_pragmas(pragmas, dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+# ================= ARCHIVE =================
+
+def all_orders():
+    # Live and archived orders as one Order-shaped entity (UNION ALL), for aggregates and
+    # exports that must cover the whole history. Hot paths query Order directly.
+    names = [column.name for column in Order.__table__.c]
+    union = db.union_all(db.select(*[Order.__table__.c[name] for name in names]), db.select(*[OrderArchive.__table__.c[name] for name in names]))
+    return db.aliased(Order, union.subquery('all_orders'), name='all_orders')
+
+def archive_orders(older_than_days, batch=5000):
+    # Moves completed, rated orders created before the cutoff into orders_archive, one
+    # transaction per batch (copy + delete over the same id range). The newest order always
+    # stays, so SQLite never hands an archived id to a new order.
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days)
+    newest = db.session.query(func.max(Order.id)).scalar() or 0
+    names = [column.name for column in Order.__table__.c]
+    cold = (Order.status == 'completed', Order.rating.isnot(None), Order.created_at < cutoff, Order.id < newest)
+    moved, last_id = 0, 0
+    while True:
+        ids = db.session.scalars(db.select(Order.id).where(*cold, Order.id > last_id).order_by(Order.id).limit(batch)).all()
+        if not ids: return moved
+        in_batch = (*cold, Order.id >= ids[0], Order.id <= ids[-1])
+        db.session.execute(insert(OrderArchive).from_select(names, db.select(*[Order.__table__.c[name] for name in names]).where(*in_batch)))
+        db.session.execute(db.delete(Order).where(*in_batch))
+        db.session.commit()
+        moved, last_id = moved + len(ids), ids[-1]
+
+# ================= STATS =================
+
+def rebuild_admin_stats():
+    # One GROUP BY pass over live and archived orders rebuilds the whole snapshot
+    orders = all_orders()
+    rows = db.session.query(
+        orders.partner_id,
+        func.count(orders.id),
+        func.sum(case((orders.status == 'completed', 1), else_=0)),
+        func.sum(case((orders.status == 'completed', orders.commission), else_=0.0)),
+        func.sum(orders.rating),
+        func.count(orders.rating),
+    ).group_by(orders.partner_id).all()
+    total_orders, total_earnings = 0, 0.0
+    db.session.query(PartnerStats).delete()
+    for partner_id, order_count, completed, earnings, rating_total, rating_count in rows:
+        total_orders += order_count
+        total_earnings += earnings or 0.0
+        if partner_id is not None:
+            db.session.add(PartnerStats(partner_id=partner_id, completed_orders=completed or 0, rating_total=rating_total or 0, rating_count=rating_count))
+    stats = db.session.get(AdminStats, 1) or AdminStats(id=1)
+    stats.total_orders = total_orders
+    stats.total_earnings = total_earnings
+    db.session.add(stats)
+    db.session.commit()
+    return stats
+
+def bump_admin_stats(**deltas):
+    # Relative UPDATE so concurrent requests never lose increments
+    table = AdminStats.__table__
+    db.session.execute(update(table).where(table.c.id == 1).values({k: table.c[k] + v for k, v in deltas.items()}))
+
+def bump_partner_stats(partner_id, **deltas):
+    table = PartnerStats.__table__
+    stmt = sqlite_insert(table).values(partner_id=partner_id, **deltas)
+    stmt = stmt.on_conflict_do_update(index_elements=[table.c.partner_id], set_={k: table.c[k] + v for k, v in deltas.items()})
+    db.session.execute(stmt)
+
+def bump_rollups(model, rows):
+    # rows: dicts with the model's primary key columns plus deltas, all with the same keys.
+    # One executemany upsert that adds the deltas to whatever is already there.
+    if not rows: return
+    table = model.__table__
+    keys = [column.name for column in table.primary_key]
+    stmt = sqlite_insert(table)
+    stmt = stmt.on_conflict_do_update(index_elements=keys, set_={k: table.c[k] + stmt.excluded[k] for k in rows[0] if k not in keys})
+    db.session.execute(stmt, rows)
+
+def rollup_order_completed(order):
+    day = order.created_at.date()
+    bump_rollups(DailyRouteStats, [{'day': day, 'pickup_area_id': order.pickup_area_id, 'drop_area_id': order.drop_area_id, 'orders_completed': 1, 'revenue': order.amount, 'commission': order.commission}])
+    bump_rollups(DailyPartnerStats, [{'day': day, 'partner_id': order.partner_id, 'deliveries': 1, 'revenue': order.amount, 'commission': order.commission}])
+
+def rebuild_rollups(chunk=100000):
+    # Backfill from live and archived history in order id ranges, one transaction each;
+    # days spanning two ranges (or both tables) are summed by the upsert
+    db.session.query(DailyRouteStats).delete()
+    db.session.query(DailyPartnerStats).delete()
+    db.session.commit()
+    max_ids = []
+    for model in (Order, OrderArchive):
+        max_id = db.session.query(func.max(model.id)).scalar() or 0
+        day = func.date(model.created_at)
+        completed = model.status == 'completed'
+        for low in range(0, max_id, chunk):
+            in_range = (model.id > low, model.id <= low + chunk)
+            routes = db.session.query(day, model.pickup_area_id, model.drop_area_id, func.count(model.id), func.sum(case((completed, 1), else_=0)),
+                                      func.sum(case((completed, model.amount), else_=0.0)), func.sum(case((completed, model.commission), else_=0.0))
+                                      ).filter(*in_range).group_by(day, model.pickup_area_id, model.drop_area_id).all()
+            partners = db.session.query(day, model.partner_id, func.count(model.id), func.sum(model.amount), func.sum(model.commission), func.coalesce(func.sum(model.rating), 0), func.count(model.rating)
+                                        ).filter(*in_range, completed, model.partner_id.isnot(None)).group_by(day, model.partner_id).all()
+            bump_rollups(DailyRouteStats, [{'day': date.fromisoformat(d), 'pickup_area_id': p, 'drop_area_id': q, 'orders_created': n, 'orders_completed': c, 'revenue': r, 'commission': m} for d, p, q, n, c, r, m in routes])
+            bump_rollups(DailyPartnerStats, [{'day': date.fromisoformat(d), 'partner_id': p, 'deliveries': n, 'revenue': r, 'commission': m, 'rating_total': t, 'rating_count': c} for d, p, n, r, m, t, c in partners])
+            db.session.commit()
+        max_ids.append(max_id)
+    return max(max_ids)
+
+# ================= WALLET =================
+
+def to_minor(amount):
+    return int(round(amount * 100))
+
+def credit_delivery(order):
+    # Partner earning for a completed order; order_id is unique so it can only be credited once
+    db.session.add(WalletEntry(partner_id=order.partner_id, order_id=order.id, kind='delivery', amount_minor=to_minor(order.amount) - to_minor(order.commission)))
+
+def wallet_balance_minor(partner_id):
+    # Fast path: folded balance plus the (short) tail of entries since the last fold. A partner
+    # that was never folded starts from the legacy float balance, as fold_wallets() would open it.
+    folded = db.session.query(WalletBalance.balance_minor, WalletBalance.last_entry_id).filter_by(partner_id=partner_id).first()
+    if folded:
+        balance_minor, last_entry_id = folded
+    else:
+        balance_minor, last_entry_id = to_minor(db.session.query(User.wallet_balance).filter_by(id=partner_id).scalar() or 0.0), 0
+    tail = db.session.query(func.coalesce(func.sum(WalletEntry.amount_minor), 0)).filter(WalletEntry.partner_id == partner_id, WalletEntry.id > last_entry_id).scalar()
+    return balance_minor + tail
+
+def fold_wallets():
+    # Batch fold of every unfolded ledger entry into wallet_balances, mirrored to users.wallet_balance.
+    # Partners that were never folded first get an 'opening' entry for their legacy float balance.
+    opening = db.session.query(User.id, User.wallet_balance).outerjoin(WalletBalance, WalletBalance.partner_id == User.id).filter(User.role == 'partner', WalletBalance.partner_id.is_(None), User.wallet_balance != 0).all()
+    for partner_id, legacy_balance in opening:
+        db.session.add(WalletEntry(partner_id=partner_id, kind='opening', amount_minor=to_minor(legacy_balance)))
+    db.session.flush()
+    upto = db.session.query(func.max(WalletEntry.id)).scalar()
+    if upto is None:
+        db.session.commit()
+        return 0
+    tails = db.session.query(WalletEntry.partner_id, func.sum(WalletEntry.amount_minor)).outerjoin(WalletBalance, WalletBalance.partner_id == WalletEntry.partner_id).filter(
+        WalletEntry.id > func.coalesce(WalletBalance.last_entry_id, 0), WalletEntry.id <= upto).group_by(WalletEntry.partner_id).all()
+    table = WalletBalance.__table__
+    for partner_id, amount_minor in tails:
+        stmt = sqlite_insert(table).values(partner_id=partner_id, balance_minor=amount_minor, last_entry_id=upto)
+        db.session.execute(stmt.on_conflict_do_update(index_elements=[table.c.partner_id], set_={'balance_minor': table.c.balance_minor + amount_minor, 'last_entry_id': upto}))
+    if tails:
+        db.session.execute(update(User.__table__).where(User.__table__.c.id == db.bindparam('partner')).values(wallet_balance=db.bindparam('balance')),
+                           [{'partner': partner_id, 'balance': balance / 100.0} for partner_id, balance in db.session.query(WalletBalance.partner_id, WalletBalance.balance_minor).filter(WalletBalance.partner_id.in_([t[0] for t in tails]))])
+    db.session.commit()
+    return len(tails)
+
+def reconcile_wallets(chunk=10000):
+    # One streaming pass over completed orders vs the ledger and the materialized balances.
+    # Returns {partner_id: (expected, ledger, materialized)} for every mismatch, in cents.
+    expected = {}
+    orders = all_orders()
+    stream = db.session.execute(db.select(orders.partner_id, orders.amount, orders.commission).where(orders.status == 'completed', orders.partner_id.isnot(None)).execution_options(yield_per=chunk))
+    for partner_id, amount, commission in stream:
+        expected[partner_id] = expected.get(partner_id, 0) + to_minor(amount) - to_minor(commission or 0.0)
+    ledger = dict(db.session.query(WalletEntry.partner_id, func.sum(WalletEntry.amount_minor)).group_by(WalletEntry.partner_id).all())
+    materialized = dict(db.session.query(WalletBalance.partner_id, WalletBalance.balance_minor).all())
+    tails = dict(db.session.query(WalletEntry.partner_id, func.sum(WalletEntry.amount_minor)).join(WalletBalance, WalletBalance.partner_id == WalletEntry.partner_id).filter(WalletEntry.id > WalletBalance.last_entry_id).group_by(WalletEntry.partner_id).all())
+    mismatches = {}
+    for partner_id in set(expected) | set(ledger) | set(materialized):
+        want, have = expected.get(partner_id, 0), ledger.get(partner_id, 0)
+        folded = materialized.get(partner_id, 0) + tails.get(partner_id, 0) if partner_id in materialized else have
+        if want != have or have != folded:
+            mismatches[partner_id] = (want, have, folded)
+    return mismatches
+
+# ================= IDENTITY =================
+
+IDENTITY_FIELDS = ('id', 'username', 'role', 'status', 'is_online', 'current_area_id', 'wallet_balance')
+
+class Identity(namedtuple('Identity', IDENTITY_FIELDS)):
+    # Read-only stand-in for the logged-in User
+    __slots__ = ()
+
+    @property
+    def is_authenticated(self):
+        return True
+
+class IdentityCache:
+    # user_id -> Identity with a TTL. Routes that change these fields call invalidate();
+    # other worker processes see the change once their entry expires.
+    def __init__(self, ttl=10.0, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = {}
+
+    def load(self, user_id):
+        row = db.session.query(*[getattr(User, field) for field in IDENTITY_FIELDS]).filter(User.id == user_id).first()
+        if not row: return None
+        identity = Identity(*row)
+        if identity.role == 'partner':
+            identity = identity._replace(wallet_balance=wallet_balance_minor(identity.id) / 100.0)
+        return identity
+
+    def get(self, user_id):
+        if self.ttl <= 0: return self.load(user_id)
+        now = time.monotonic()
+        entry = self.entries.get(user_id)
+        if entry and entry[0] > now: return entry[1]
+        identity = self.load(user_id)
+        if identity:
+            with self.lock:
+                if len(self.entries) >= self.max_entries:
+                    self.entries = {uid: e for uid, e in self.entries.items() if e[0] > now}
+                self.entries[user_id] = (now + self.ttl, identity)
+        return identity
+
+    def invalidate(self, user_id):
+        with self.lock:
+            self.entries.pop(user_id, None)
+
+def identity_cache():
+    return current_app.extensions['identity_cache']
+
+# ================= PRICING =================
+
+class FareEngine:
+    # Process-local copy of the charge matrix, stored densely as n*n amounts indexed by
+    # area position (NaN = no route), plus the commission rate. The whole snapshot is
+    # swapped in one assignment so quotes never need a lock.
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self.checked_at = 0.0
+        self.snapshot = None  # (version, area_index, size, matrix, commission_rate)
+
+    def load(self):
+        version = get_version('pricing')
+        area_ids = [area_id for (area_id,) in db.session.query(Area.id).order_by(Area.id)]
+        area_index = {area_id: i for i, area_id in enumerate(area_ids)}
+        size = len(area_ids)
+        matrix = array('d', [math.nan]) * (size * size)
+        for from_id, to_id, amount in db.session.query(Charge.from_area_id, Charge.to_area_id, Charge.amount):
+            if from_id in area_index and to_id in area_index:
+                matrix[area_index[from_id] * size + area_index[to_id]] = amount
+        commission_setting = Setting.query.filter_by(key='commission_percentage').first()
+        commission_rate = float(commission_setting.value) if commission_setting else 10.0
+        self.snapshot = (version, area_index, size, matrix, commission_rate)
+        return self.snapshot
+
+    def invalidate(self):
+        self.snapshot = None
+
+    def current(self):
+        # Only compare against the shared version counter every check_interval seconds
+        snapshot, now = self.snapshot, time.monotonic()
+        if snapshot is None:
+            snapshot = self.load()
+            self.checked_at = now
+        elif now - self.checked_at >= self.check_interval:
+            self.checked_at = now
+            if get_version('pricing') != snapshot[0]:
+                snapshot = self.load()
+        return snapshot
+
+    def quote(self, from_area_id, to_area_id):
+        version, area_index, size, matrix, commission_rate = self.current()
+        i, j = area_index.get(from_area_id), area_index.get(to_area_id)
+        if i is None or j is None: return None
+        amount = matrix[i * size + j]
+        if math.isnan(amount): return None
+        return amount, amount * (commission_rate / 100.0)
+
+CHARGE_TILE_SIZE = 50
+
+def fare_engine():
+    return current_app.extensions['fare_engine']
+
+def pricing_changed():
+    # Call before committing any change to areas, charges or the commission rate. The version
+    # bump commits with the change; this process drops its snapshot only once the commit lands,
+    # so a quote served in between cannot reload and keep the old matrix until the next check.
+    bump_version('pricing')
+    engine = fare_engine()
+    event.listen(db.session(), 'after_commit', lambda session: engine.invalidate(), once=True)
+
+def upsert_charges(cells):
+    # cells: (from_area_id, to_area_id, amount); an amount of None removes the route.
+    # One executemany per kind on ux_charges_from_to; the caller commits after pricing_changed().
+    table = Charge.__table__
+    upserts = [{'from_area_id': f, 'to_area_id': t, 'amount': amount} for f, t, amount in cells if amount is not None]
+    removals = [{'from_id': f, 'to_id': t} for f, t, amount in cells if amount is None]
+    # Counts are rows actually written: the conflict WHERE skips unchanged amounts and
+    # removing a route that does not exist deletes nothing
+    updated = removed = 0
+    if upserts:
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=[table.c.from_area_id, table.c.to_area_id], set_={'amount': stmt.excluded.amount}, where=table.c.amount != stmt.excluded.amount)
+        updated = db.session.execute(stmt, upserts).rowcount
+    if removals:
+        removed = db.session.execute(table.delete().where(table.c.from_area_id == db.bindparam('from_id'), table.c.to_area_id == db.bindparam('to_id')), removals).rowcount
+    return updated, removed
+
+def parse_charge_cells(data, area_ids):
+    # Either a full matrix {"area_ids": [...], "amounts": [[...], ...]} or a sparse diff
+    # {"charges": [{"from_area_id", "to_area_id", "amount"}, ...]}; null amounts remove a route
+    if not isinstance(data, dict): raise ValueError('Expected a JSON object')
+    if 'amounts' in data:
+        ids, amounts = data.get('area_ids'), data['amounts']
+        if not isinstance(ids, list) or not isinstance(amounts, list) or len(amounts) != len(ids) or any(not isinstance(row, list) or len(row) != len(ids) for row in amounts):
+            raise ValueError('amounts must be a square matrix matching area_ids')
+        cells = [(f, t, amount) for f, row in zip(ids, amounts) for t, amount in zip(ids, row)]
+    elif isinstance(data.get('charges'), list):
+        try:
+            cells = [(c['from_area_id'], c['to_area_id'], c['amount']) for c in data['charges']]
+        except (KeyError, TypeError):
+            raise ValueError('Each charge needs from_area_id, to_area_id and amount')
+    else:
+        raise ValueError('Send either area_ids and amounts, or charges')
+    for f, t, amount in cells:
+        if f not in area_ids or t not in area_ids: raise ValueError(f'Unknown area in pair {f} -> {t}')
+        if amount is not None and (isinstance(amount, bool) or not isinstance(amount, (int, float)) or amount < 0 or math.isnan(amount)):
+            raise ValueError(f'Invalid amount for {f} -> {t}')
+    return cells
+
+# ================= ORDER FEED =================
+
+class OrderFeedHub:
+    # In-process pub/sub keyed by pickup area. A publish formats the SSE message once
+    # and hands it to every subscriber queue for that area; no queries are involved.
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def subscribe(self, area_id, q=None):
+        # q: anything with queue.Queue's put_nowait/get_nowait/empty (the ASGI gateway's FeedQueue)
+        q = queue.Queue(self.max_queue) if q is None else q
+        with self.lock:
+            self.subscribers.setdefault(area_id, set()).add(q)
+        return q
+
+    def unsubscribe(self, area_id, q):
+        with self.lock:
+            area_subscribers = self.subscribers.get(area_id)
+            if area_subscribers:
+                area_subscribers.discard(q)
+                if not area_subscribers: del self.subscribers[area_id]
+
+    def subscriber_count(self, area_id=None):
+        with self.lock:
+            if area_id is not None: return len(self.subscribers.get(area_id, ()))
+            return sum(len(subs) for subs in self.subscribers.values())
+
+    def publish(self, area_id, event, payload):
+        with self.lock:
+            targets = list(self.subscribers.get(area_id, ()))
+        if not targets: return 0
+        message = f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+        for q in targets:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                # Slow client fell behind: drop its backlog and tell it to reload
+                while not q.empty():
+                    try: q.get_nowait()
+                    except queue.Empty: break
+                try: q.put_nowait("event: resync\ndata: {}\n\n")
+                except queue.Full: pass
+        return len(targets)
+
+def order_feed():
+    return current_app.extensions['order_feed']
+
+def publish_order_event(event, order):
+    # Call after the commit so subscribers never see uncommitted orders
+    payload = {'id': order.id}
+    if event != 'order_claimed':
+        payload.update(pickup_area_id=order.pickup_area_id, drop_area_id=order.drop_area_id, pickup_address=order.pickup_address, drop_address=order.drop_address, amount=order.amount)
+    order_feed().publish(order.pickup_area_id, event, payload)
+
+# ================= BULK INGESTION =================
+
+ORDER_IMPORT_FIELDS = ('pickup_area_id', 'drop_area_id', 'pickup_address', 'drop_address')
+
+def parse_order_rows(text_stream, fmt):
+    # Yields (row_number, record) one line at a time; record is None if the line is unparseable
+    if fmt == 'csv':
+        for row_number, record in enumerate(csv.DictReader(text_stream), 1):
+            yield row_number, record
+    else:
+        row_number = 0
+        for line in text_stream:
+            if not line.strip(): continue
+            row_number += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            yield row_number, record if isinstance(record, dict) else None
+
+def ingest_orders(rows, customer_id, chunk_size=5000):
+    # Prices every row against one fare matrix snapshot, then inserts accepted rows with
+    # executemany, one transaction per chunk. Yields a report dict per input row: rejections
+    # as soon as the row is read, acceptances once their chunk commits.
+    _, area_index, size, matrix, commission_rate = fare_engine().current()
+    batch, batch_rows = [], []
+    for row_number, record in rows:
+        try:
+            pickup_area_id, drop_area_id = int(record['pickup_area_id']), int(record['drop_area_id'])
+            pickup_address, drop_address = record['pickup_address'], record['drop_address']
+            # A JSON null, or a field missing from a short CSV row (DictReader fills in None), is no address
+            if not isinstance(pickup_address, str) or not isinstance(drop_address, str): raise TypeError
+            pickup_address, drop_address = pickup_address.strip(), drop_address.strip()
+            if not pickup_address or not drop_address: raise ValueError
+        except (KeyError, TypeError, ValueError):
+            yield {'row': row_number, 'status': 'rejected', 'error': 'Row needs ' + ', '.join(ORDER_IMPORT_FIELDS)}
+            continue
+        i, j = area_index.get(pickup_area_id), area_index.get(drop_area_id)
+        amount = matrix[i * size + j] if i is not None and j is not None else math.nan
+        if math.isnan(amount):
+            yield {'row': row_number, 'status': 'rejected', 'error': 'Delivery not available between these areas.'}
+            continue
+        batch.append({'customer_id': customer_id, 'pickup_area_id': pickup_area_id, 'drop_area_id': drop_area_id, 'pickup_address': pickup_address, 'drop_address': drop_address,
+                      'amount': amount, 'commission': amount * (commission_rate / 100.0), 'status': 'pending', 'created_at': datetime.utcnow()})
+        batch_rows.append(row_number)
+        if len(batch) >= chunk_size:
+            yield from insert_order_chunk(batch, batch_rows)
+            batch, batch_rows = [], []
+    if batch:
+        yield from insert_order_chunk(batch, batch_rows)
+
+def insert_order_chunk(batch, batch_rows):
+    order_ids = db.session.execute(insert(Order).returning(Order.id, sort_by_parameter_order=True), batch).scalars().all()
+    bump_admin_stats(total_orders=len(batch))
+    routes = Counter((values['created_at'].date(), values['pickup_area_id'], values['drop_area_id']) for values in batch)
+    bump_rollups(DailyRouteStats, [{'day': d, 'pickup_area_id': p, 'drop_area_id': q, 'orders_created': n} for (d, p, q), n in routes.items()])
+    dashboard_changed(customers=[values['customer_id'] for values in batch], areas=[p for _, p, _ in routes])
+    db.session.commit()
+    for order_id, values in zip(order_ids, batch):
+        order = SimpleNamespace(id=order_id, **values)
+        dispatch_index().add_order(order_id, order.pickup_area_id)
+        publish_order_event('order_created', order)
+    for row_number, order_id in zip(batch_rows, order_ids):
+        yield {'row': row_number, 'status': 'accepted', 'order_id': order_id}
+
+# ================= EXPORT =================
+
+EXPORT_GROUPINGS = ('order', 'partner', 'day')
+
+def order_export_statement(group='order', start=None, end=None, area_id=None, status='completed'):
+    # Plain column tuples, never ORM objects; end is an inclusive date. Covers live and
+    # archived orders: per-order rows are one SELECT per table merged by the top-level
+    # ORDER BY (each side streams in id order), grouped exports aggregate over all_orders().
+    def filtered(stmt, orders):
+        if start: stmt = stmt.where(orders.created_at >= start)
+        if end: stmt = stmt.where(orders.created_at < end + timedelta(days=1))
+        if area_id: stmt = stmt.where(or_(orders.pickup_area_id == area_id, orders.drop_area_id == area_id))
+        if status: stmt = stmt.where(orders.status == status)
+        return stmt
+
+    if group == 'order':
+        return db.union_all(*[filtered(db.select(orders.id.label('order_id'), orders.created_at, orders.status, orders.customer_id, orders.partner_id, orders.pickup_area_id, orders.drop_area_id,
+                                                 orders.amount, orders.commission, (orders.amount - orders.commission).label('partner_payout')), orders)
+                              for orders in (Order, OrderArchive)]).order_by('order_id')
+    orders = all_orders()
+    day = func.date(orders.created_at)
+    totals = (func.count(orders.id).label('orders'), func.round(func.sum(orders.amount), 2).label('amount'),
+              func.round(func.sum(orders.commission), 2).label('commission'), func.round(func.sum(orders.amount - orders.commission), 2).label('partner_payout'))
+    if group == 'partner':
+        stmt = db.select(orders.partner_id, User.username.label('partner'), *totals).outerjoin(User, User.id == orders.partner_id).group_by(orders.partner_id, User.username).order_by(orders.partner_id)
+    else:
+        stmt = db.select(day.label('day'), *totals).group_by(day).order_by(day)
+    return filtered(stmt, orders)
+
+def export_csv(stmt, chunk=10000, flush_bytes=65536):
+    # Streams rows off the cursor chunk by chunk; memory is bounded by chunk, not the table
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    result = db.session.execute(stmt.execution_options(yield_per=chunk))
+    writer.writerow(result.keys())
+    for partition in result.partitions():
+        writer.writerows(partition)
+        if buffer.tell() >= flush_bytes:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+# ================= DISPATCH =================
+
+class DispatchIndex:
+    # Per-area view of who can take work and what is waiting: online, idle partners
+    # and a FIFO of pending orders. Routes keep it current after each commit; rebuild()
+    # reloads it from the database (at startup, or when another process changed state).
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.partners = {}  # partner_id -> [area_id, is_online, is_busy]
+        self.idle = {}  # area_id -> set of idle online partner ids
+        self.pending = {}  # area_id -> OrderedDict of pending order ids, oldest first
+        self.order_areas = {}  # pending order id -> area_id
+
+    def rebuild(self):
+        partners = db.session.query(User.id, User.current_area_id, User.is_online).filter(User.role == 'partner', User.status == 'active').all()
+        busy = {partner_id for (partner_id,) in db.session.query(Order.partner_id).filter(Order.status.in_(ACTIVE_ORDER_STATUSES))}
+        pending = db.session.query(Order.id, Order.pickup_area_id).filter(Order.status == 'pending').order_by(Order.created_at, Order.id).all()
+        with self.lock:
+            self.partners, self.idle, self.pending, self.order_areas = {}, {}, {}, {}
+            for partner_id, area_id, is_online in partners:
+                self._set_partner(partner_id, area_id, bool(is_online), partner_id in busy)
+            for order_id, area_id in pending:
+                self._add_order(order_id, area_id)
+
+    def _set_partner(self, partner_id, area_id, is_online, is_busy):
+        old = self.partners.get(partner_id)
+        if old and old[1] and not old[2]:
+            self.idle.get(old[0], set()).discard(partner_id)
+        self.partners[partner_id] = [area_id, is_online, is_busy]
+        if area_id is not None and is_online and not is_busy:
+            self.idle.setdefault(area_id, set()).add(partner_id)
+
+    def _add_order(self, order_id, area_id, oldest=False):
+        fifo = self.pending.setdefault(area_id, OrderedDict())
+        fifo[order_id] = None
+        if oldest: fifo.move_to_end(order_id, last=False)
+        self.order_areas[order_id] = area_id
+
+    def update_partner(self, partner_id, **changes):
+        # changes: any of area_id, is_online, is_busy
+        with self.lock:
+            area_id, is_online, is_busy = self.partners.get(partner_id, [None, False, False])
+            self._set_partner(partner_id, changes.get('area_id', area_id), changes.get('is_online', is_online), changes.get('is_busy', is_busy))
+
+    def remove_partner(self, partner_id):
+        with self.lock:
+            old = self.partners.pop(partner_id, None)
+            if old: self.idle.get(old[0], set()).discard(partner_id)
+
+    def add_order(self, order_id, area_id, oldest=False):
+        # oldest=True puts a declined order back at the head of its area queue
+        with self.lock:
+            self._add_order(order_id, area_id, oldest)
+
+    def remove_order(self, order_id):
+        with self.lock:
+            area_id = self.order_areas.pop(order_id, None)
+            if area_id is not None: self.pending[area_id].pop(order_id, None)
+
+    # Readers take the lock too and hand back copies: rebuild() swaps the dicts and
+    # writers mutate the sets and FIFOs in place from other threads
+
+    def partner_state(self, partner_id):
+        with self.lock:
+            state = self.partners.get(partner_id)
+            return tuple(state) if state else None
+
+    def next_pending_order(self, area_id):
+        with self.lock:
+            fifo = self.pending.get(area_id)
+            return next(iter(fifo), None) if fifo else None
+
+    def pending_orders(self, area_id):
+        with self.lock:
+            return list(self.pending.get(area_id, ()))
+
+    def pending_count(self, area_id):
+        with self.lock:
+            return len(self.pending.get(area_id, ()))
+
+    def idle_partners(self, area_id):
+        with self.lock:
+            return frozenset(self.idle.get(area_id, ()))
+
+    def idle_count(self, area_id):
+        with self.lock:
+            return len(self.idle.get(area_id, ()))
+
+def dispatch_index():
+    return current_app.extensions['dispatch_index']
+
+def partner_dispatch_scores(partner_ids):
+    # One score per idle partner: average rating (unrated partners count as 3 stars) minus
+    # today's deliveries relative to the busiest candidate, weighted by DISPATCH_RATING_WEIGHT
+    # and DISPATCH_LOAD_WEIGHT. Two IN queries for the whole tick, however many areas.
+    ratings = {partner_id: total / count for partner_id, total, count in db.session.query(PartnerStats.partner_id, PartnerStats.rating_total, PartnerStats.rating_count)
+               .filter(PartnerStats.partner_id.in_(partner_ids), PartnerStats.rating_count > 0)}
+    loads = dict(db.session.query(DailyPartnerStats.partner_id, DailyPartnerStats.deliveries)
+                 .filter(DailyPartnerStats.partner_id.in_(partner_ids), DailyPartnerStats.day == datetime.utcnow().date()))
+    rating_weight, load_weight = current_app.config['DISPATCH_RATING_WEIGHT'], current_app.config['DISPATCH_LOAD_WEIGHT']
+    busiest = max(loads.values(), default=0) + 1
+    return {partner_id: rating_weight * (ratings.get(partner_id, 3.0) - 1) / 4 - load_weight * loads.get(partner_id, 0) / busiest for partner_id in partner_ids}
+
+def dispatch_tick():
+    # Batch dispatch: every area's oldest pending orders go to its best-scored idle partners.
+    # Each partner takes one order, so with an age x score objective pairing the two sorted
+    # lists is the optimal assignment. All claims are one UPDATE ... FROM (a VALUES CTE) in one
+    # transaction; rows another process claimed meanwhile (or whose partner became busy)
+    # simply don't match. Returns the claimed (id, pickup_area_id, partner_id, customer_id) rows.
+    index = dispatch_index()
+    with index.lock:
+        work = [(list(itertools.islice(fifo, len(index.idle[area_id]))), list(index.idle[area_id]))
+                for area_id, fifo in index.pending.items() if fifo and index.idle.get(area_id)]
+    if not work: return []
+    scores = partner_dispatch_scores([partner_id for _, partners in work for partner_id in partners])
+    pairs = [(order_id, partner_id) for orders, partners in work for order_id, partner_id in zip(orders, sorted(partners, key=lambda p: (-scores[p], p)))]
+    assignments = db.values(db.column('order_id', db.Integer), db.column('partner_id', db.Integer), name='assignments').data(pairs).cte('assignments')
+    active = db.aliased(Order)
+    claimed = db.session.execute(
+        update(Order)
+        .where(Order.id == assignments.c.order_id, Order.status == 'pending', Order.partner_id.is_(None),
+               ~db.select(active.id).where(active.partner_id == assignments.c.partner_id, active.status.in_(ACTIVE_ORDER_STATUSES)).exists())
+        .values(partner_id=assignments.c.partner_id, status='accepted')
+        .returning(Order.id, Order.pickup_area_id, Order.partner_id, Order.customer_id)
+        .add_cte(assignments)
+        .execution_options(synchronize_session=False)
+    ).all()
+    if claimed:
+        dashboard_changed(customers=[row.customer_id for row in claimed], partners=[row.partner_id for row in claimed], areas=[row.pickup_area_id for row in claimed])
+    db.session.commit()
+    if len(claimed) < len(pairs):
+        # Another process claimed orders or busied partners this index still lists
+        index.rebuild()
+    else:
+        for row in claimed:
+            index.remove_order(row.id)
+            index.update_partner(row.partner_id, is_busy=True)
+    for row in claimed:
+        publish_order_event('order_claimed', row)
+    return claimed
+
+class BatchDispatcher:
+    # DISPATCH_MODE = 'batch': a daemon thread runs dispatch_tick() every DISPATCH_TICK_INTERVAL
+    # seconds. Partners can still accept orders themselves; both go through conditional UPDATEs.
+    def __init__(self, app, interval):
+        self.app = app
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.ticks = 0
+        self.assigned = 0
+
+    def start(self):
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            with self.app.app_context():
+                try:
+                    self.assigned += len(dispatch_tick())
+                    self.ticks += 1
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception('Dispatch tick failed, retrying next tick')
+
+# ================= PRESENCE =================
+
+class HeartbeatBuffer:
+    # Latest (area_id, is_online) per partner, coalesced in memory and written to users in
+    # one executemany UPDATE per flush window. Until then this process reads the buffered
+    # state (identity overlay, dispatch index); a crash loses at most one window of presence.
+    def __init__(self, app, flush_interval=2.0):
+        self.app = app
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = {}  # partner_id -> (area_id, is_online)
+        self.flushing = {}  # entries being written by the current flush, still served to reads
+        self.online_changed = False  # the admin partner list shows online state
+        self.received = 0
+        self.flushes = 0
+
+    def get(self, partner_id):
+        return self.pending.get(partner_id) or self.flushing.get(partner_id)
+
+    def overlay(self, identity):
+        state = self.get(identity.id)
+        return identity._replace(current_area_id=state[0], is_online=state[1]) if state else identity
+
+    def record(self, partner_id, area_id, is_online):
+        previous = dispatch_index().partner_state(partner_id)
+        with self.lock:
+            arm = not self.pending
+            self.pending[partner_id] = (area_id, is_online)
+            self.online_changed = self.online_changed or not previous or previous[1] != is_online
+            self.received += 1
+        dispatch_index().update_partner(partner_id, area_id=area_id, is_online=is_online)
+        if self.flush_interval <= 0:
+            self.flush()
+        elif arm:
+            self._arm()
+
+    def _arm(self):
+        # One timer per window, started by the first heartbeat into an empty buffer
+        timer = threading.Timer(self.flush_interval, self._flush_in_app)
+        timer.daemon = True
+        timer.start()
+
+    def _flush_in_app(self):
+        with self.app.app_context():
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception('Heartbeat flush failed, retrying next window')
+                self._arm()
+
+    def flush(self):
+        # Returns the number of partners written. If the database is busy (OperationalError)
+        # the batch goes back into the buffer unless a newer heartbeat for the same partner
+        # arrived meanwhile. Rows that can never be written (IntegrityError, e.g. an area
+        # deleted since it was buffered) are dropped one by one; the rest still land.
+        with self.flush_lock:
+            with self.lock:
+                if not self.pending: return 0
+                self.flushing, self.pending = self.pending, {}
+                online_changed, self.online_changed = self.online_changed, False
+            table = User.__table__
+            statement = (table.update().where(table.c.id == db.bindparam('partner_id'), table.c.role == 'partner')
+                         .values(current_area_id=db.bindparam('area_id'), is_online=db.bindparam('is_online')))
+            rows = [{'partner_id': partner_id, 'area_id': area_id, 'is_online': is_online} for partner_id, (area_id, is_online) in self.flushing.items()]
+            dropped = []
+            try:
+                try:
+                    db.session.execute(statement, rows)
+                except IntegrityError:
+                    db.session.rollback()
+                    for row in rows:
+                        try:
+                            db.session.execute(statement, [row])
+                            db.session.commit()
+                        except IntegrityError:
+                            db.session.rollback()
+                            dropped.append(row['partner_id'])
+                if online_changed: bump_version('partners')
+                db.session.commit()
+            except OperationalError:
+                db.session.rollback()
+                with self.lock:
+                    self.pending = {**self.flushing, **self.pending}
+                    self.online_changed = self.online_changed or online_changed
+                raise
+            except Exception:
+                db.session.rollback()
+                raise
+            finally:
+                flushed, self.flushing = self.flushing, {}
+            self.flushes += 1
+            cache = self.app.extensions['identity_cache']
+            for partner_id in flushed:
+                cache.invalidate(partner_id)
+            if dropped:
+                # The dispatch index took the rejected state on record(); put back what is stored
+                self.app.logger.warning('Dropped unwritable heartbeats for partners %s', dropped)
+                for partner_id, area_id, is_online in db.session.query(User.id, User.current_area_id, User.is_online).filter(User.id.in_(dropped)):
+                    dispatch_index().update_partner(partner_id, area_id=area_id, is_online=bool(is_online))
+            return len(flushed) - len(dropped)
+
+    def discard(self, partner_id):
+        with self.lock:
+            self.pending.pop(partner_id, None)
+
+def heartbeats():
+    return current_app.extensions['heartbeats']
+
+# ================= METRICS =================
+
+class Metrics:
+    # Process-local per-endpoint request latency histograms plus SQL statement counts and
+    # time, rendered in the Prometheus text format. Requests are timed until teardown, so
+    # stream_with_context responses (exports) include streaming and the SSE feed does not.
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, slow_query_seconds=0.1):
+        self.slow_query_seconds = slow_query_seconds
+        self.lock = threading.Lock()
+        self.endpoints = {}  # endpoint -> [per-bucket counts (last is +Inf), count, seconds, sql statements, sql seconds, slow queries]
+
+    def _stats(self, endpoint):
+        stats = self.endpoints.get(endpoint)
+        if stats is None:
+            stats = self.endpoints[endpoint] = [[0] * (len(self.BUCKETS) + 1), 0, 0.0, 0, 0.0, 0]
+        return stats
+
+    def observe_request(self, endpoint, seconds, sql_statements, sql_seconds):
+        with self.lock:
+            stats = self._stats(endpoint)
+            stats[0][bisect.bisect_left(self.BUCKETS, seconds)] += 1
+            stats[1] += 1
+            stats[2] += seconds
+            stats[3] += sql_statements
+            stats[4] += sql_seconds
+
+    def observe_slow_query(self, endpoint):
+        with self.lock:
+            self._stats(endpoint)[5] += 1
+
+    def render(self):
+        with self.lock:
+            endpoints = sorted((endpoint, [list(stats[0])] + stats[1:]) for endpoint, stats in self.endpoints.items())
+        lines = ['# HELP routex_request_duration_seconds Request latency by endpoint.', '# TYPE routex_request_duration_seconds histogram']
+        for endpoint, (buckets, count, seconds, _, _, _) in endpoints:
+            cumulative = 0
+            for bound, observed in zip(self.BUCKETS + ('+Inf',), buckets):
+                cumulative += observed
+                lines.append(f'routex_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {cumulative}')
+            lines.append(f'routex_request_duration_seconds_sum{{endpoint="{endpoint}"}} {seconds}')
+            lines.append(f'routex_request_duration_seconds_count{{endpoint="{endpoint}"}} {count}')
+        for name, index, help_text in (('routex_sql_statements_total', 3, 'SQL statements executed while serving requests.'),
+                                       ('routex_sql_duration_seconds_total', 4, 'Time spent in SQL while serving requests.'),
+                                       ('routex_slow_queries_total', 5, 'SQL statements slower than the slow query threshold.')):
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} counter']
+            lines += [f'{name}{{endpoint="{endpoint}"}} {stats[index]}' for endpoint, stats in endpoints]
+        return '\n'.join(lines) + '\n'
+
+def metrics():
+    return current_app.extensions['metrics']
+
+def metrics_endpoint():
+    if not has_request_context(): return '-'
+    return request.endpoint or 'unmatched'
+
+def start_request_metrics():
+    g.request_metrics = [time.perf_counter(), 0, 0.0]  # start, sql statements, sql seconds
+
+def finish_request_metrics(exc=None):
+    state = g.pop('request_metrics', None)
+    if state: metrics().observe_request(metrics_endpoint(), time.perf_counter() - state[0], state[1], state[2])
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None: context.metrics_started = time.perf_counter()
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, 'metrics_started', None)
+    if started is None or not has_app_context(): return
+    elapsed = time.perf_counter() - started
+    state = g.get('request_metrics') if has_request_context() else None
+    if state:
+        state[1] += 1
+        state[2] += elapsed
+    if elapsed >= metrics().slow_query_seconds:
+        metrics().observe_slow_query(metrics_endpoint())
+        current_app.logger.warning('Slow query (%.1fms) in %s: %s', elapsed * 1000, metrics_endpoint(), statement)
+
+# ================= CONDITIONAL GET =================
+# Dashboards are tagged with the data versions they render: 'pricing' (areas, charges,
+# commission), 'partners' (the admin partner lists), and per customer, partner and pickup
+# area order versions. Anything that changes what a dashboard shows bumps them before its commit.
+
+def dashboard_changed(customers=(), partners=(), areas=()):
+    bump_version(*[f'customer:{i}' for i in set(customers)], *[f'partner:{i}' for i in set(partners)], *[f'area:{i}' for i in set(areas) if i is not None])
+
+def dashboard_etag(names, *extra):
+    # One query for all versions; extra carries request-specific state (the identity, stats).
+    # The pricing version read here also keys this request's fragments.
+    versions = dict(db.session.query(DataVersion.name, DataVersion.version).filter(DataVersion.name.in_(names)))
+    g.pricing_version = versions.get('pricing', 0)
+    raw = json.dumps([[versions.get(name, 0) for name in names], *extra], default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+def not_modified(etag):
+    # 304 before any listing query runs. Pending flash messages always get a full render.
+    if '_flashes' in session or etag not in request.if_none_match: return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    return response
+
+def with_etag(body, etag):
+    response = make_response(body)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+class FragmentCache:
+    # Rendered template pieces that only change with the pricing version, shared by every
+    # request in the process. The version is the one dashboard_etag() already read, else the
+    # fare engine's, so a hit costs no query.
+    def __init__(self):
+        self.entries = {}  # name -> (pricing version, value)
+
+    def get(self, name, build):
+        version = g.get('pricing_version')
+        if version is None: version = fare_engine().current()[0]
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != version:
+            entry = self.entries[name] = (version, build())
+        return entry[1]
+
+def fragments():
+    return current_app.extensions['fragments']
+
+def area_list():
+    return fragments().get('areas', lambda: db.session.query(Area.id, Area.name).order_by(Area.id).all())
+
+def area_options(selected=None):
+    options = fragments().get('area_options', lambda: Markup(''.join(f'<option value="{area_id}">{escape(name)}</option>' for area_id, name in area_list())))
+    if selected is None: return options
+    # str.replace: Markup.replace would escape the replacement tags
+    return Markup(str(options).replace(f'<option value="{selected}">', f'<option value="{selected}" selected>', 1))
+
+def area_names_json():
+    return fragments().get('area_names_json', lambda: htmlsafe_json_dumps(dict(area_list())))
+
+# ================= QUERIES =================
+# Hot-path queries shared by the routes; each one is backed by an index on its model.
+
+def pending_orders_in_area(area_id):
+    return Order.query.filter_by(pickup_area_id=area_id, status='pending').order_by(Order.created_at)
+
+def active_orders_for_partner(partner_id):
+    return Order.query.filter(Order.partner_id == partner_id, Order.status.in_(ACTIVE_ORDER_STATUSES))
+
+def with_areas(query):
+    # Listings render pickup/drop area names; load them in the same statement
+    model = query.column_descriptions[0]['entity']
+    return query.options(db.joinedload(model.pickup_area), db.joinedload(model.drop_area))
+
+def customer_orders(customer_id, statuses):
+    return Order.query.filter(Order.customer_id == customer_id, Order.status.in_(statuses))
+
+def claim_order(order_id, partner_id):
+    # Single conditional UPDATE: only one concurrent claimer can match the pending row.
+    # Raises IntegrityError (via ux_orders_partner_active) if the partner is already busy.
+    # Returns the claimed (id, pickup_area_id, partner_id, customer_id) row, or None if someone else got there first.
+    return db.session.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.status == 'pending', Order.partner_id.is_(None))
+        .values(partner_id=partner_id, status='accepted')
+        .returning(Order.id, Order.pickup_area_id, Order.partner_id, Order.customer_id)
+    ).first()
+
+def advance_order(order_id, partner_id, status):
+    # Single conditional UPDATE, like claim_order(): only an active order of this partner moves
+    # on, so a finished order can't be reopened or completed (and credited) twice.
+    # Returns True if the order moved; the loaded Order is synchronized.
+    # Partner cancels/declines after accepting -> Reset to pending
+    values = {'status': 'pending', 'partner_id': None} if status == 'declined' else {'status': status}
+    return db.session.execute(
+        update(Order)
+        .where(Order.id == order_id, Order.partner_id == partner_id, Order.status.in_(ACTIVE_ORDER_STATUSES))
+        .values(**values)
+    ).rowcount == 1
+
+def partner_deliveries(partner_id):
+    return Order.query.filter(Order.partner_id == partner_id, Order.status == 'completed')
+
+def customer_history(customer_id):
+    # Completed orders, live and archived, for history_page()
+    return [customer_orders(customer_id, ('completed',)), OrderArchive.query.filter(OrderArchive.customer_id == customer_id)]
+
+def partner_history(partner_id):
+    return [partner_deliveries(partner_id), OrderArchive.query.filter(OrderArchive.partner_id == partner_id)]
+
+def encode_cursor(order):
+    return base64.urlsafe_b64encode(f"{order.created_at.isoformat()}|{order.id}".encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    created_at, order_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split('|')
+    return datetime.fromisoformat(created_at), int(order_id)
+
+def history_page(query, cursor=None, limit=20):
+    # Keyset pagination on (created_at, id), newest first: every page is one index range
+    # scan, so deep pages cost the same as the first one (unlike OFFSET). A list of queries
+    # (live and archive) gets one range scan each, merged; order ids are unique across them.
+    key = decode_cursor(cursor) if cursor else None
+    pages = []
+    for part in (query if isinstance(query, list) else [query]):
+        model = part.column_descriptions[0]['entity']
+        part = part.order_by(model.created_at.desc(), model.id.desc())
+        if key: part = part.filter(tuple_(model.created_at, model.id) < key)
+        pages.append(part.limit(limit + 1).all())
+    rows = list(itertools.islice(heapq.merge(*pages, key=lambda order: (order.created_at, order.id), reverse=True), limit + 1))
+    next_cursor = encode_cursor(rows[limit - 1]) if len(rows) > limit else None
+    return rows[:limit], next_cursor
+
+def history_request_page(query):
+    limit = min(request.args.get('limit', current_app.config['HISTORY_PAGE_SIZE'], type=int), 100)
+    try:
+        return history_page(query, request.args.get('cursor'), max(limit, 1))
+    except ValueError:
+        abort(400)
+
+def partners_with_status(status):
+    return User.query.filter_by(role='partner', status=status)
+
 # ================= ROUTES =================
 
 # --- ADMIN ---
@@ -108,18 +1257,21 @@ def login():
 @admin_login_required
 def dashboard():
     if g.user.role != 'admin': return redirect(url_for('auth_logout'))
-    areas = Area.query.all()
-    charges = Charge.query.all()
-    pending_partners = User.query.filter_by(role='partner', status='pending').all()
-    active_partners = User.query.filter_by(role='partner', status='active').all()
+    stats = db.session.get(AdminStats, 1) or rebuild_admin_stats()
+    etag = dashboard_etag(['pricing', 'partners'], g.user, [stats.total_orders, stats.total_earnings])
+    cached = not_modified(etag)
+    if cached: return cached
+    # Areas and charges are fetched by the page from charge_areas/charge_tile, so the
+    # render does not grow with the matrix
+    area_count = fare_engine().current()[2]
+    pending_partners = partners_with_status('pending').all()
+    active_partners = []
+    for partner, ps in db.session.query(User, PartnerStats).outerjoin(PartnerStats, PartnerStats.partner_id == User.id).filter(User.role == 'partner', User.status == 'active').all():
+        partner.rating_avg = ps.rating_avg if ps else None
+        active_partners.append(partner)
     commission_setting = Setting.query.filter_by(key='commission_percentage').first()
     current_commission = commission_setting.value if commission_setting else "10.0"
-    for partner in active_partners:
-        avg_rating = db.session.query(func.avg(Order.rating)).filter(Order.partner_id == partner.id).scalar()
-        partner.rating_avg = avg_rating
-    total_earnings = db.session.query(func.sum(Order.commission)).filter(Order.status == 'completed').scalar() or 0.0
-    total_orders = Order.query.count()
-    return render_template('admin_dashboard.html', areas=areas, charges=charges, pending_partners=pending_partners, active_partners=active_partners, total_earnings=total_earnings, current_commission=current_commission, total_orders=total_orders)
+    return with_etag(render_template('admin_dashboard.html', area_count=area_count, tile_size=CHARGE_TILE_SIZE, pending_partners=pending_partners, active_partners=active_partners, total_earnings=stats.total_earnings, current_commission=current_commission, total_orders=stats.total_orders), etag)
 
 @admin_bp.route('/set_commission', methods=['POST'])
 @admin_login_required
@@ -132,6 +1284,7 @@ def set_commission():
         else:
             setting = Setting(key='commission_percentage', value=percentage)
             db.session.add(setting)
+        pricing_changed()
         db.session.commit()
     return redirect(url_for('admin.dashboard'))
 
@@ -147,20 +1300,16 @@ def add_area():
             new_area = Area(name=name)
             db.session.add(new_area)
             db.session.flush() # Get ID
-            
-            # Local Delivery Charge
-            db.session.add(Charge(from_area_id=new_area.id, to_area_id=new_area.id, amount=float(self_charge)))
-            
-            # Charges to existing areas
-            existing_areas = Area.query.filter(Area.id != new_area.id).all()
-            for area in existing_areas:
-                dist = request.form.get(f'distance_{area.id}')
-                if dist:
-                    amount = float(dist)
-                    # Create bi-directional charges
-                    db.session.add(Charge(from_area_id=new_area.id, to_area_id=area.id, amount=amount))
-                    db.session.add(Charge(from_area_id=area.id, to_area_id=new_area.id, amount=amount))
-            
+
+            # Local charge plus both directions to every existing area with a distance given
+            existing_ids = set(db.session.scalars(db.select(Area.id).where(Area.id != new_area.id)))
+            cells = [(new_area.id, new_area.id, float(self_charge))]
+            for key, value in request.form.items():
+                area_id = key.removeprefix('distance_')
+                if key.startswith('distance_') and area_id.isdigit() and int(area_id) in existing_ids and value:
+                    cells += [(new_area.id, int(area_id), float(value)), (int(area_id), new_area.id, float(value))]
+            upsert_charges(cells)
+            pricing_changed()
             db.session.commit()
             flash('Area added successfully with charges.', 'success')
         else:
@@ -178,12 +1327,53 @@ def set_charge():
     to_id = request.form.get('to_area_id')
     amount = request.form.get('amount')
     if from_id and to_id and amount:
-        charge = Charge.query.filter_by(from_area_id=from_id, to_area_id=to_id).first()
-        if charge: charge.amount = float(amount)
-        else: db.session.add(Charge(from_area_id=from_id, to_area_id=to_id, amount=float(amount)))
+        upsert_charges([(int(from_id), int(to_id), float(amount))])
+        pricing_changed()
         db.session.commit()
     return redirect(url_for('admin.dashboard'))
 
+@admin_bp.route('/charges', methods=['POST'])
+@admin_login_required
+def set_charges():
+    # Bulk repricing: a whole matrix or a sparse diff, applied in one transaction
+    if g.user.role != 'admin': return jsonify(error='forbidden'), 403
+    try:
+        cells = parse_charge_cells(request.get_json(silent=True), set(db.session.scalars(db.select(Area.id))))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    updated, removed = upsert_charges(cells)
+    pricing_changed()
+    db.session.commit()
+    return jsonify(updated=updated, removed=removed, pricing_version=get_version('pricing'))
+
+@admin_bp.route('/charges/areas')
+@admin_login_required
+def charge_areas():
+    # Matrix axes in fare engine order, sent once; tiles refer to areas by position
+    if g.user.role != 'admin': return jsonify(error='forbidden'), 403
+    version, area_index, _, _, _ = fare_engine().current()
+    etag = f'pricing-{version}'
+    cached = not_modified(etag)
+    if cached: return cached
+    names = dict(area_list())
+    return with_etag(jsonify(version=version, tile_size=CHARGE_TILE_SIZE, areas=[[area_id, names.get(area_id, '')] for area_id in area_index]), etag)
+
+@admin_bp.route('/charges/tile')
+@admin_login_required
+def charge_tile():
+    # One CHARGE_TILE_SIZE square of the matrix, cut from the fare engine snapshot (null = no route)
+    if g.user.role != 'admin': return jsonify(error='forbidden'), 403
+    version, _, size, matrix, _ = fare_engine().current()
+    row, col = request.args.get('row', 0, type=int), request.args.get('col', 0, type=int)
+    if row < 0 or col < 0: abort(400)
+    etag = f'pricing-{version}-{row}-{col}'
+    cached = not_modified(etag)
+    if cached: return cached
+    first_col, last_col = col * CHARGE_TILE_SIZE, min(size, (col + 1) * CHARGE_TILE_SIZE)
+    amounts = [[None if math.isnan(amount) else amount for amount in matrix[i * size + first_col:i * size + last_col]]
+               for i in range(row * CHARGE_TILE_SIZE, min(size, (row + 1) * CHARGE_TILE_SIZE))]
+    return with_etag(jsonify(version=version, row=row, col=col, amounts=amounts), etag)
+
 @admin_bp.route('/approve_partner/<int:partner_id>')
 @admin_login_required
 def approve_partner(partner_id):
@@ -191,7 +1381,10 @@ def approve_partner(partner_id):
     partner = User.query.get(partner_id)
     if partner and partner.role == 'partner':
         partner.status = 'active'
+        bump_version('partners')
         db.session.commit()
+        identity_cache().invalidate(partner.id)
+        dispatch_index().update_partner(partner.id, area_id=partner.current_area_id, is_online=bool(partner.is_online), is_busy=False)
     return redirect(url_for('admin.dashboard'))
 
 @admin_bp.route('/remove_partner/<int:partner_id>')
@@ -200,10 +1393,47 @@ def remove_partner(partner_id):
     if g.user.role != 'admin': return redirect(url_for('admin.login'))
     partner = User.query.get(partner_id)
     if partner and partner.role == 'partner':
+        PartnerStats.query.filter_by(partner_id=partner.id).delete()
+        # Archived deliveries lose the partner like live ones do (Order.partner backref)
+        OrderArchive.query.filter_by(partner_id=partner.id).update({'partner_id': None})
         db.session.delete(partner)
+        bump_version('partners')
         db.session.commit()
+        identity_cache().invalidate(partner_id)
+        dispatch_index().remove_partner(partner_id)
+        heartbeats().discard(partner_id)
     return redirect(url_for('admin.dashboard'))
 
+@admin_bp.route('/analytics')
+@admin_login_required
+def analytics():
+    # Reads only the daily rollups, so cost follows days x areas, not order count
+    if g.user.role != 'admin': return redirect(url_for('admin.login'))
+    days = min(max(request.args.get('days', 30, type=int), 1), 366)
+    since = datetime.utcnow().date() - timedelta(days=days - 1)
+    daily = db.session.query(DailyRouteStats.day, func.sum(DailyRouteStats.orders_created), func.sum(DailyRouteStats.orders_completed), func.sum(DailyRouteStats.revenue), func.sum(DailyRouteStats.commission)
+                             ).filter(DailyRouteStats.day >= since).group_by(DailyRouteStats.day).order_by(DailyRouteStats.day.desc()).all()
+    area_revenue = db.session.query(Area.name, func.sum(DailyRouteStats.orders_completed), func.sum(DailyRouteStats.revenue)
+                                    ).join(Area, Area.id == DailyRouteStats.pickup_area_id).filter(DailyRouteStats.day >= since).group_by(Area.id).order_by(func.sum(DailyRouteStats.revenue).desc()).all()
+    partners = db.session.query(DailyPartnerStats.partner_id, User.username, func.sum(DailyPartnerStats.deliveries), func.sum(DailyPartnerStats.revenue - DailyPartnerStats.commission),
+                                func.sum(DailyPartnerStats.rating_total), func.sum(DailyPartnerStats.rating_count)
+                                ).outerjoin(User, User.id == DailyPartnerStats.partner_id).filter(DailyPartnerStats.day >= since).group_by(DailyPartnerStats.partner_id, User.username).order_by(func.sum(DailyPartnerStats.deliveries).desc()).all()
+    return render_template('admin_analytics.html', days=days, daily=daily, area_revenue=area_revenue, partners=partners)
+
+@admin_bp.route('/export/orders.csv')
+@admin_login_required
+def export_orders():
+    if g.user.role != 'admin': return redirect(url_for('admin.login'))
+    group = request.args.get('group', 'order')
+    if group not in EXPORT_GROUPINGS: abort(400)
+    try:
+        start, end = (datetime.strptime(request.args[key], '%Y-%m-%d') if request.args.get(key) else None for key in ('start', 'end'))
+    except ValueError:
+        abort(400)
+    status = request.args.get('status', 'completed')
+    stmt = order_export_statement(group, start, end, request.args.get('area_id', type=int), None if status == 'all' else status)
+    return Response(stream_with_context(export_csv(stmt)), mimetype='text/csv', headers={'Content-Disposition': f'attachment; filename=orders-by-{group}.csv'})
+
 # --- PARTNER ---
 partner_bp = Blueprint('partner', __name__, url_prefix='/partner')
 
@@ -224,6 +1454,7 @@ def register():
             user = User(username=username, role='partner', status='pending')
             user.set_password(password)
             db.session.add(user)
+            bump_version('partners')
             db.session.commit()
             return redirect(url_for('partner.login'))
     return render_template('register.html', role='partner')
@@ -246,52 +1477,107 @@ def login():
 @partner_login_required
 def dashboard():
     if g.user.role != 'partner': return redirect(url_for('partner.login'))
-    areas = Area.query.all()
-    my_orders = Order.query.filter_by(partner_id=g.user.id).filter(Order.status.in_(['accepted', 'picked_up', 'arrived'])).all()
+    etag = dashboard_etag(['pricing', f'partner:{g.user.id}', f'area:{g.user.current_area_id}'], g.user)
+    cached = not_modified(etag)
+    if cached: return cached
+    my_orders = with_areas(active_orders_for_partner(g.user.id)).all()
     has_active_order = len(my_orders) > 0
     current_area_name = None
     available_orders = []
     if g.user.current_area_id:
-        area = Area.query.get(g.user.current_area_id)
-        if area: current_area_name = area.name
+        current_area_name = dict(area_list()).get(g.user.current_area_id)
         if g.user.is_online and not has_active_order: # Only show available if no active order? Or show but disable? Let's hide for simplicity or filter logic here.
-             available_orders = Order.query.filter_by(pickup_area_id=g.user.current_area_id, status='pending').all()
-    return render_template('partner_dashboard.html', areas=areas, available_orders=available_orders, my_orders=my_orders, current_area_name=current_area_name, has_active_order=has_active_order)
+             available_orders = with_areas(pending_orders_in_area(g.user.current_area_id)).all()
+    return with_etag(render_template('partner_dashboard.html', available_orders=available_orders, my_orders=my_orders, current_area_name=current_area_name, has_active_order=has_active_order), etag)
+
+@partner_bp.route('/feed')
+@partner_login_required
+def feed():
+    # Server-Sent Events stream of order deltas for the partner's current area
+    if g.user.role != 'partner': return redirect(url_for('partner.login'))
+    area_id = g.user.current_area_id
+    if not area_id: return Response(status=204)
+    hub, keepalive = order_feed(), current_app.config['FEED_KEEPALIVE_INTERVAL']
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    external = request.environ.get('orderfeed.queue')
+    if external is not None:
+        # Served by the ASGI gateway (asgi.py), which streams from its own queue on the event loop
+        hub.subscribe(area_id, external)
+        request.environ['orderfeed.area_id'] = area_id
+        return Response(mimetype='text/event-stream', headers=headers)
+    q = hub.subscribe(area_id)
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try: yield q.get(timeout=keepalive)
+                except queue.Empty: yield ": keepalive\n\n"
+        finally:
+            hub.unsubscribe(area_id, q)
+
+    return Response(stream(), mimetype='text/event-stream', headers=headers)
 
 @partner_bp.route('/toggle_status')
 @partner_login_required
 def toggle_status():
     if g.user.role != 'partner': return redirect(url_for('partner.login'))
-    g.user.is_online = not g.user.is_online
-    db.session.commit()
+    # Same write path as heartbeats, flushed now so it never races a buffered one
+    heartbeats().record(g.user.id, g.user.current_area_id, not g.user.is_online)
+    heartbeats().flush()
     return redirect(url_for('partner.dashboard'))
 
 @partner_bp.route('/set_area', methods=['POST'])
 @partner_login_required
 def set_area():
     if g.user.role != 'partner': return redirect(url_for('partner.login'))
-    area_id = request.form.get('area_id')
-    if area_id:
-        g.user.current_area_id = int(area_id)
-        db.session.commit()
+    area_id = request.form.get('area_id', type=int)
+    if request.form.get('area_id'):
+        # Same check as heartbeat(): an unknown area would fail the users FK on flush
+        if area_id not in fare_engine().current()[1]: abort(400)
+        heartbeats().record(g.user.id, area_id, bool(g.user.is_online))
+        heartbeats().flush()
     return redirect(url_for('partner.dashboard'))
 
+@partner_bp.route('/heartbeat', methods=['POST'])
+@partner_login_required
+def heartbeat():
+    # JSON {"area_id": int, "is_online": bool}, either key optional. Buffered and coalesced;
+    # the users row is written at the next flush window.
+    if g.user.role != 'partner': abort(403)
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict): abort(400)
+    area_id, is_online = data.get('area_id', g.user.current_area_id), data.get('is_online', bool(g.user.is_online))
+    if not isinstance(is_online, bool) or (area_id is not None and (type(area_id) is not int or area_id not in fare_engine().current()[1])):
+        abort(400)
+    heartbeats().record(g.user.id, area_id, is_online)
+    return jsonify(area_id=area_id, is_online=is_online, flush_interval=heartbeats().flush_interval)
+
 @partner_bp.route('/accept_order/<int:order_id>')
 @partner_login_required
 def accept_order(order_id):
     if g.user.role != 'partner': return redirect(url_for('partner.login'))
     
     # Check if partner already has an active order
-    active_order = Order.query.filter_by(partner_id=g.user.id).filter(Order.status.in_(['accepted', 'picked_up', 'arrived'])).first()
+    active_order = active_orders_for_partner(g.user.id).first()
     if active_order:
         flash('You already have an active order. Please complete it first.', 'error')
         return redirect(url_for('partner.dashboard'))
 
-    order = Order.query.get(order_id)
-    if order and order.status == 'pending':
-        order.partner_id = g.user.id
-        order.status = 'accepted'
+    try:
+        claimed = claim_order(order_id, g.user.id)
+        if claimed: dashboard_changed(customers=[claimed.customer_id], partners=[g.user.id], areas=[claimed.pickup_area_id])
         db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        flash('You already have an active order. Please complete it first.', 'error')
+        return redirect(url_for('partner.dashboard'))
+    if claimed:
+        dispatch_index().remove_order(claimed.id)
+        dispatch_index().update_partner(g.user.id, is_busy=True)
+        publish_order_event('order_claimed', claimed)
+        flash('Order accepted.', 'success')
+    else: flash('This order is no longer available.', 'error')
     return redirect(url_for('partner.dashboard'))
 
 @partner_bp.route('/update_status/<int:order_id>/<status>')
@@ -301,20 +1587,32 @@ def update_status(order_id, status):
     order = Order.query.get(order_id)
     if order and order.partner_id == g.user.id:
         if status in ['picked_up', 'arrived', 'completed', 'declined']:
-             if status == 'declined':
-                 # Partner cancels/declines after accepting -> Reset to pending
-                 order.status = 'pending'
-                 order.partner_id = None
-             else:
-                 order.status = status
-                 if status == 'completed':
-                     # Credit Partner Wallet: Amount - Commission
-                     earning = order.amount - order.commission
-                     partner = User.query.get(g.user.id)
-                     partner.wallet_balance += earning
+             if not advance_order(order.id, g.user.id, status):
+                 flash('This order is no longer active.', 'error')
+                 return redirect(url_for('partner.dashboard'))
+             if status == 'completed':
+                 # Credit Partner Wallet: Amount - Commission
+                 credit_delivery(order)
+                 bump_admin_stats(total_earnings=order.commission)
+                 bump_partner_stats(order.partner_id, completed_orders=1)
+                 rollup_order_completed(order)
+             dashboard_changed(customers=[order.customer_id], partners=[g.user.id], areas=[order.pickup_area_id] if status == 'declined' else ())
              db.session.commit()
+             if status == 'declined':
+                 dispatch_index().add_order(order.id, order.pickup_area_id, oldest=True)
+                 publish_order_event('order_declined', order)
+             if status == 'completed': identity_cache().invalidate(g.user.id)
+             if status in ('declined', 'completed'):
+                 dispatch_index().update_partner(g.user.id, is_busy=False)
     return redirect(url_for('partner.dashboard'))
 
+@partner_bp.route('/orders/history')
+@partner_login_required
+def order_history():
+    if g.user.role != 'partner': return jsonify(error='forbidden'), 403
+    orders, next_cursor = history_request_page(partner_history(g.user.id))
+    return jsonify(orders=[{'id': o.id, 'created_at': o.created_at.isoformat(), 'pickup_area_id': o.pickup_area_id, 'drop_area_id': o.drop_area_id, 'earning': round(o.amount - o.commission, 2), 'rating': o.rating} for o in orders], next_cursor=next_cursor)
+
 # --- CUSTOMER ---
 customer_bp = Blueprint('customer', __name__, url_prefix='/customer')
 
@@ -356,29 +1654,33 @@ def login():
 @customer_login_required
 def dashboard():
     if g.user.role != 'customer': return redirect(url_for('customer.login'))
-    areas = Area.query.all()
-    active_orders = Order.query.filter(Order.customer_id == g.user.id, Order.status.in_(['pending', 'accepted', 'picked_up', 'arrived'])).all()
-    completed_orders = Order.query.filter(Order.customer_id == g.user.id, Order.status == 'completed').all()
-    return render_template('customer_dashboard.html', areas=areas, active_orders=active_orders, completed_orders=completed_orders)
+    etag = dashboard_etag(['pricing', f'customer:{g.user.id}'], g.user)
+    cached = not_modified(etag)
+    if cached: return cached
+    active_orders = with_areas(customer_orders(g.user.id, ('pending',) + ACTIVE_ORDER_STATUSES)).all()
+    completed_orders, next_cursor = history_page([with_areas(query) for query in customer_history(g.user.id)], limit=current_app.config['HISTORY_PAGE_SIZE'])
+    return with_etag(render_template('customer_dashboard.html', active_orders=active_orders, completed_orders=completed_orders, next_cursor=next_cursor), etag)
 
 @customer_bp.route('/create_order', methods=['POST'])
 @customer_login_required
 def create_order():
     if g.user.role != 'customer': return redirect(url_for('customer.login'))
-    pickup_area_id = request.form.get('pickup_area_id')
+    pickup_area_id = request.form.get('pickup_area_id', type=int)
     pickup_address = request.form.get('pickup_address')
-    drop_area_id = request.form.get('drop_area_id')
+    drop_area_id = request.form.get('drop_area_id', type=int)
     drop_address = request.form.get('drop_address')
     if pickup_area_id and drop_area_id:
-        charge = Charge.query.filter_by(from_area_id=pickup_area_id, to_area_id=drop_area_id).first()
-        if charge:
-            amount = charge.amount
-            commission_setting = Setting.query.filter_by(key='commission_percentage').first()
-            commission_rate = float(commission_setting.value) if commission_setting else 10.0
-            commission = amount * (commission_rate / 100.0)
-            order = Order(customer_id=g.user.id, pickup_area_id=pickup_area_id, drop_area_id=drop_area_id, pickup_address=pickup_address, drop_address=drop_address, amount=amount, commission=commission, status='pending')
+        fare = fare_engine().quote(pickup_area_id, drop_area_id)
+        if fare:
+            amount, commission = fare
+            order = Order(customer_id=g.user.id, pickup_area_id=pickup_area_id, drop_area_id=drop_area_id, pickup_address=pickup_address, drop_address=drop_address, amount=amount, commission=commission, status='pending', created_at=datetime.utcnow())
             db.session.add(order)
+            bump_admin_stats(total_orders=1)
+            bump_rollups(DailyRouteStats, [{'day': order.created_at.date(), 'pickup_area_id': pickup_area_id, 'drop_area_id': drop_area_id, 'orders_created': 1}])
+            dashboard_changed(customers=[g.user.id], areas=[pickup_area_id])
             db.session.commit()
+            dispatch_index().add_order(order.id, order.pickup_area_id)
+            publish_order_event('order_created', order)
             flash('Order placed successfully!', 'success')
         else:
             flash('Delivery not available between these areas.', 'error')
@@ -386,6 +1688,43 @@ def create_order():
         flash('Please fill all fields.', 'error')
     return redirect(url_for('customer.dashboard'))
 
+@customer_bp.route('/quote')
+@customer_login_required
+def quote():
+    if g.user.role != 'customer': return jsonify(error='forbidden'), 403
+    pickup_area_id = request.args.get('pickup_area_id', type=int)
+    drop_area_id = request.args.get('drop_area_id', type=int)
+    fare = fare_engine().quote(pickup_area_id, drop_area_id)
+    if not fare: return jsonify(error='Delivery not available between these areas.'), 404
+    return jsonify(pickup_area_id=pickup_area_id, drop_area_id=drop_area_id, amount=fare[0], commission=fare[1])
+
+@customer_bp.route('/orders/history')
+@customer_login_required
+def order_history():
+    if g.user.role != 'customer': return jsonify(error='forbidden'), 403
+    orders, next_cursor = history_request_page(customer_history(g.user.id))
+    return jsonify(orders=[{'id': o.id, 'created_at': o.created_at.isoformat(), 'pickup_area_id': o.pickup_area_id, 'drop_area_id': o.drop_area_id, 'amount': o.amount, 'rating': o.rating} for o in orders], next_cursor=next_cursor)
+
+@customer_bp.route('/orders/bulk', methods=['POST'])
+@customer_login_required
+def bulk_create_orders():
+    # Body: CSV (text/csv) or JSON Lines, one order per row. Streams back a JSON Lines
+    # report with one line per input row and a final summary line.
+    if g.user.role != 'customer': return jsonify(error='forbidden'), 403
+    fmt = request.args.get('format') or ('csv' if request.mimetype == 'text/csv' else 'jsonl')
+    if fmt not in ('csv', 'jsonl'): return jsonify(error='format must be csv or jsonl'), 400
+    customer_id = g.user.id
+    text_stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='' if fmt == 'csv' else None)
+
+    def report():
+        totals = {'accepted': 0, 'rejected': 0}
+        for result in ingest_orders(parse_order_rows(text_stream, fmt), customer_id, current_app.config['BULK_IMPORT_CHUNK_SIZE']):
+            totals[result['status']] += 1
+            yield json.dumps(result) + '\n'
+        yield json.dumps(totals) + '\n'
+
+    return Response(stream_with_context(report()), mimetype='application/x-ndjson')
+
 @customer_bp.route('/rate_order/<int:order_id>', methods=['POST'])
 @customer_login_required
 def rate_order(order_id):
@@ -394,14 +1733,284 @@ def rate_order(order_id):
     if order and order.customer_id == g.user.id and order.status == 'completed':
         rating = request.form.get('rating')
         if rating and rating.isdigit():
+            if order.partner_id:
+                rating_delta = {'rating_total': int(rating) - (order.rating or 0), 'rating_count': 0 if order.rating else 1}
+                bump_partner_stats(order.partner_id, **rating_delta)
+                bump_rollups(DailyPartnerStats, [{'day': order.created_at.date(), 'partner_id': order.partner_id, **rating_delta}])
             order.rating = int(rating)
             order.rating_comment = request.form.get('comment') # Optional comment
+            dashboard_changed(customers=[g.user.id])
+            bump_version('partners')  # admin partner list shows ratings
             db.session.commit()
             flash('Thank you for rating!', 'success')
     return redirect(url_for('customer.dashboard'))
 
+# ================= CLI =================
+
+@click.command('rebuild-stats')
+@with_appcontext
+def rebuild_stats_command():
+    stats = rebuild_admin_stats()
+    click.echo(f"Admin stats rebuilt: {stats.total_orders} orders, ${stats.total_earnings:.2f} earnings")
+
+@click.command('backfill-rollups')
+@click.option('--chunk', type=int, default=100000, help='Orders per transaction')
+@with_appcontext
+def backfill_rollups_command(chunk):
+    max_id = rebuild_rollups(chunk)
+    click.echo(f"Daily rollups rebuilt from {max_id} order ids: {DailyRouteStats.query.count()} route days, {DailyPartnerStats.query.count()} partner days")
+
+@click.command('archive-orders')
+@click.option('--days', type=int, default=None, help='Archive completed, rated orders older than this (default ORDER_ARCHIVE_AFTER_DAYS)')
+@click.option('--batch', type=int, default=5000, help='Orders moved per transaction')
+@with_appcontext
+def archive_orders_command(days, batch):
+    days = current_app.config['ORDER_ARCHIVE_AFTER_DAYS'] if days is None else days
+    moved = archive_orders(days, batch)
+    click.echo(f"Archived {moved} orders older than {days} days ({db.session.query(func.count(OrderArchive.id)).scalar()} archived, {db.session.query(func.count(Order.id)).scalar()} live)")
+
+@click.command('dispatch-tick')
+@with_appcontext
+def dispatch_tick_command():
+    # One batch dispatch pass, e.g. from cron or a worker loop when DISPATCH_MODE is 'pull'
+    claimed = dispatch_tick()
+    click.echo(f"Assigned {len(claimed)} orders in {len({row.pickup_area_id for row in claimed})} areas")
+
+def create_indexes():
+    # create_all() never touches existing tables, so add any declared index that is missing.
+    # Duplicate charge pairs (left by older add_area calls) must go before the unique index;
+    # the lowest id is the row older code priced from and set_charge updated, so it stays.
+    # Returns (duplicate charges removed, index names created).
+    removed = db.session.execute(db.text("DELETE FROM charges WHERE id NOT IN (SELECT MIN(id) FROM charges GROUP BY from_area_id, to_area_id)")).rowcount
+    db.session.commit()
+    created = []
+    inspector = db.inspect(db.engine)
+    existing = {ix['name'] for table in db.metadata.sorted_tables for ix in inspector.get_indexes(table.name)}
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.name not in existing:
+                index.create(bind=db.engine)
+                created.append(index.name)
+    with db.engine.begin() as conn:
+        conn.exec_driver_sql('ANALYZE')
+    return removed, created
+
+@click.command('create-indexes')
+@with_appcontext
+def create_indexes_command():
+    removed, created = create_indexes()
+    if removed: click.echo(f"Removed {removed} duplicate charges (kept the oldest row of each route)")
+    click.echo(f"Created indexes: {', '.join(created)}" if created else "All indexes already exist")
+
+@click.command('fold-wallets')
+@with_appcontext
+def fold_wallets_command():
+    folded = fold_wallets()
+    click.echo(f"Folded wallet ledger for {folded} partners")
+
+@click.command('reconcile-wallets')
+@with_appcontext
+def reconcile_wallets_command():
+    mismatches = reconcile_wallets()
+    for partner_id, (expected, ledger, materialized) in sorted(mismatches.items()):
+        click.echo(f"Partner {partner_id}: orders ${expected / 100:.2f}, ledger ${ledger / 100:.2f}, balance ${materialized / 100:.2f}")
+    if mismatches:
+        raise click.ClickException(f"{len(mismatches)} partner wallets do not reconcile")
+    click.echo("All partner wallets reconcile with completed orders")
+
+def zipf_cum_weights(n, exponent):
+    # Cumulative weights for bisect sampling; rank 0 is the most popular
+    cum, total = [], 0.0
+    for rank in range(n):
+        total += 1.0 / (rank + 1) ** exponent
+        cum.append(total)
+    return cum
+
+def seed_large(areas=500, partners=50000, customers=200000, orders=10000000, days=365, seed=1, chunk=100000, progress=None):
+    # Deterministic synthetic dataset on top of whatever is there. Rows go in through Core
+    # executemany on one connection with relaxed PRAGMAs and the order indexes dropped, one
+    # transaction per chunk; indexes, stats, rollups and wallets are rebuilt at the end.
+    # Area popularity, customers and partner activity are Zipf-skewed, volume grows over time
+    # with lunch and dinner peaks, and each order is priced from the charge matrix.
+    if User.query.filter(User.username.like('seed_partner_%')).first():
+        raise ValueError('This database already holds seed-large data')
+    progress = progress or (lambda message: None)
+    rng = random.Random(seed)
+    pick = lambda cum: bisect.bisect(cum, rng.random() * cum[-1])
+    started = time.perf_counter()
+
+    with db.engine.connect() as conn:
+        if conn.dialect.name == 'sqlite':
+            for pragma in ('synchronous = OFF', 'cache_size = -262144', 'temp_store = MEMORY'):
+                conn.exec_driver_sql(f'PRAGMA {pragma}')
+        for index in Order.__table__.indexes:
+            conn.exec_driver_sql(f'DROP INDEX IF EXISTS {index.name}')
+
+        conn.execute(insert(Area), [{'name': f'Seed Area {i:04d}'} for i in range(areas)])
+        area_ids = [area_id for (area_id,) in conn.execute(db.select(Area.id).order_by(Area.id))]
+        ranked_areas = area_ids[:]
+        rng.shuffle(ranked_areas)
+        area_cum = zipf_cum_weights(len(ranked_areas), 1.1)
+        position = {area_id: (rng.uniform(0, 40), rng.uniform(0, 40)) for area_id in area_ids}
+        local = {area_id: round(rng.uniform(15, 30), 2) for area_id in area_ids}
+        fares = {(f, t): local[f] if f == t else round(20 + 2.5 * math.dist(position[f], position[t]), 2) for f in area_ids for t in area_ids}
+        # Existing charges win, so orders are priced from whatever the matrix now holds
+        charges, cells = sqlite_insert(Charge).on_conflict_do_nothing(index_elements=['from_area_id', 'to_area_id']), list(fares.items())
+        for offset in range(0, len(cells), chunk):
+            conn.execute(charges, [{'from_area_id': f, 'to_area_id': t, 'amount': amount} for (f, t), amount in cells[offset:offset + chunk]])
+        fares = {(f, t): amount for f, t, amount in conn.execute(db.select(Charge.from_area_id, Charge.to_area_id, Charge.amount))}
+        setting = conn.execute(db.select(Setting.value).where(Setting.key == 'commission_percentage')).scalar()
+        commission_rate = float(setting) / 100.0 if setting else 0.1
+        conn.commit()
+        progress(f"{len(area_ids)} areas and {len(fares)} charges")
+
+        for offset in range(0, partners, chunk):
+            conn.execute(insert(User), [{'username': f'seed_partner_{i}', 'password_hash': 'password', 'role': 'partner', 'status': 'active' if rng.random() < 0.97 else 'pending',
+                                         'is_online': rng.random() < 0.3, 'current_area_id': ranked_areas[pick(area_cum)]} for i in range(offset, min(partners, offset + chunk))])
+        for offset in range(0, customers, chunk):
+            conn.execute(insert(User), [{'username': f'seed_customer_{i}', 'password_hash': 'password', 'role': 'customer', 'status': 'active'} for i in range(offset, min(customers, offset + chunk))])
+        partner_rows = conn.execute(db.select(User.id, User.is_online, User.status).where(User.username.like('seed_partner_%')).order_by(User.id)).all()
+        customer_ids = [user_id for (user_id,) in conn.execute(db.select(User.id).where(User.username.like('seed_customer_%')).order_by(User.id))]
+        conn.commit()
+        progress(f"{len(partner_rows)} partners and {len(customer_ids)} customers")
+
+        partner_ids = [partner_id for partner_id, _, status in partner_rows if status == 'active']
+        rng.shuffle(partner_ids)
+        partner_cum = zipf_cum_weights(len(partner_ids), 0.8)
+        customer_cum = zipf_cum_weights(len(customer_ids), 1.0)
+        hour_cum = list(itertools.accumulate((1, 1, 1, 1, 1, 2, 4, 6, 7, 7, 8, 11, 14, 12, 8, 7, 7, 9, 13, 15, 13, 9, 5, 2)))
+        # The newest orders are still open: a pending tail, plus one active order per idle online partner
+        online = [partner_id for partner_id, is_online, status in partner_rows if is_online and status == 'active']
+        active_partners = online[:min(len(online), orders // 2000)]
+        open_from = orders - len(active_partners) - min(orders // 1000, 5000)
+        rating_cum = list(itertools.accumulate((7, 6, 12, 25, 50)))
+        earnings = {}
+        start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        for offset in range(0, orders, chunk):
+            rows = []
+            for i in range(offset, min(orders, offset + chunk)):
+                pickup = ranked_areas[pick(area_cum)]
+                drop = pickup if rng.random() < 0.4 else ranked_areas[pick(area_cum)]
+                amount = fares[(pickup, drop)]
+                commission = round(amount * commission_rate, 2)
+                day = int(days * ((i + rng.random()) / orders) ** 0.7)
+                created_at = start + timedelta(days=min(day, days - 1), hours=bisect.bisect(hour_cum, rng.random() * hour_cum[-1]), seconds=rng.random() * 3600)
+                row = {'customer_id': customer_ids[pick(customer_cum)], 'partner_id': None, 'pickup_area_id': pickup, 'drop_area_id': drop, 'pickup_address': f'{i % 997 + 1} Seed St',
+                       'drop_address': f'{i % 991 + 1} Drop Ave', 'status': 'pending', 'amount': amount, 'commission': commission, 'rating': None, 'created_at': created_at}
+                if i < open_from:
+                    partner_id = partner_ids[pick(partner_cum)]
+                    row.update(partner_id=partner_id, status='completed', rating=bisect.bisect(rating_cum, rng.random() * rating_cum[-1]) + 1 if rng.random() < 0.6 else None)
+                    earnings[partner_id] = earnings.get(partner_id, 0) + to_minor(amount) - to_minor(commission)
+                elif i - open_from < len(active_partners):
+                    row.update(partner_id=active_partners[i - open_from], status=rng.choice(ACTIVE_ORDER_STATUSES))
+                rows.append(row)
+            conn.execute(insert(Order), rows)
+            conn.commit()
+            progress(f"{min(orders, offset + chunk)} orders ({min(orders, offset + chunk) / (time.perf_counter() - started) * 60:,.0f} rows/min)")
+
+        conn.execute(insert(WalletEntry), [{'partner_id': partner_id, 'kind': 'opening', 'amount_minor': amount_minor} for partner_id, amount_minor in earnings.items()])
+        conn.commit()
+        # Never hand the relaxed connection back to the pool
+        conn.invalidate()
+
+    create_indexes()
+    progress("indexes rebuilt")
+    rebuild_admin_stats()
+    rebuild_rollups()
+    fold_wallets()
+    pricing_changed()
+    db.session.commit()
+    progress(f"stats, rollups and wallets rebuilt in {time.perf_counter() - started:.1f}s total")
+    return len(area_ids), len(partner_rows), len(customer_ids), orders
+
+@click.command('seed-large')
+@click.option('--areas', type=int, default=500)
+@click.option('--partners', type=int, default=50000)
+@click.option('--customers', type=int, default=200000)
+@click.option('--orders', type=int, default=10000000)
+@click.option('--days', type=int, default=365, help='Order history spread over this many days before today')
+@click.option('--seed', type=int, default=1, help='Same seed, same data')
+@click.option('--chunk', type=int, default=100000, help='Rows per transaction')
+@with_appcontext
+def seed_large_command(areas, partners, customers, orders, days, seed, chunk):
+    try:
+        seed_large(areas, partners, customers, orders, days, seed, chunk, progress=click.echo)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+@click.command('import-orders')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--customer', 'username', required=True, help='Username of the customer placing the orders')
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), default=None, help='Defaults to the file extension')
+@click.option('--report', type=click.File('w'), default='-', help='Per-row JSON Lines report (default stdout)')
+@click.option('--chunk-size', type=int, default=5000)
+@with_appcontext
+def import_orders_command(path, username, fmt, report, chunk_size):
+    customer = User.query.filter_by(username=username, role='customer').first()
+    if not customer: raise click.ClickException(f"No customer named {username}")
+    fmt = fmt or ('csv' if path.endswith('.csv') else 'jsonl')
+    totals = {'accepted': 0, 'rejected': 0}
+    with open(path, encoding='utf-8', newline='' if fmt == 'csv' else None) as text_stream:
+        for result in ingest_orders(parse_order_rows(text_stream, fmt), customer.id, chunk_size):
+            totals[result['status']] += 1
+            report.write(json.dumps(result) + '\n')
+    click.echo(f"Imported {totals['accepted']} orders, rejected {totals['rejected']} rows", err=True)
+
+@click.command('export-orders')
+@click.option('--group', type=click.Choice(EXPORT_GROUPINGS), default='order', help='One row per order, or totals per partner or per day')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), default=None)
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Inclusive')
+@click.option('--area-id', type=int, default=None, help='Orders picked up or dropped in this area')
+@click.option('--status', default='completed', help="Order status, or 'all'")
+@click.option('--output', type=click.File('w'), default='-')
+@with_appcontext
+def export_orders_command(group, start, end, area_id, status, output):
+    for chunk in export_csv(order_export_statement(group, start, end, area_id, None if status == 'all' else status)):
+        output.write(chunk)
+
 # ================= APP FACTORY =================
 
+# Bump when the schema or the default seed below changes; create_app() only bootstraps a
+# database whose stored 'bootstrap' version is older
+BOOTSTRAP_VERSION = 2
+DEFAULT_USERS = (('admin', 'admin123', 'admin'), ('partner', 'partner123', 'partner'), ('customer', 'customer123', 'customer'))
+DEFAULT_AREAS = ('Area A', 'Area B')
+DEFAULT_CHARGES = (('Area A', 'Area B', 50.0), ('Area B', 'Area A', 50.0), ('Area A', 'Area A', 30.0), ('Area B', 'Area B', 30.0))
+
+def bootstrap():
+    # One SELECT on an up-to-date database. Otherwise create missing tables and insert any
+    # missing defaults in a single transaction; rows that already exist are left alone.
+    try:
+        if get_version('bootstrap') >= BOOTSTRAP_VERSION: return False
+    except OperationalError:
+        db.session.rollback()  # data_versions does not exist yet
+    upgrading = bool(db.inspect(db.engine).get_table_names())
+    db.create_all()
+    created = []
+    if upgrading:
+        # create_all() skipped the tables that already exist: dedupe charges and add their
+        # indexes before the ON CONFLICT inserts below, which need ux_charges_from_to
+        removed, indexes = create_indexes()
+        if removed: created.append(f"Removed {removed} duplicate charges")
+        if indexes: created.append(f"Created indexes: {', '.join(indexes)}")
+    passwords = {username: password for username, password, _ in DEFAULT_USERS}
+    users = [{'username': username, 'password_hash': password, 'role': role, 'status': 'active'} for username, password, role in DEFAULT_USERS]
+    stmt = sqlite_insert(User).values(users).on_conflict_do_nothing(index_elements=['username'])
+    created += [f"Default {username} created: {username}/{passwords[username]}" for (username,) in db.session.execute(stmt.returning(User.username))]
+    areas = [{'name': name} for name in DEFAULT_AREAS]
+    created += [f"Default {name} created" for (name,) in db.session.execute(sqlite_insert(Area).values(areas).on_conflict_do_nothing(index_elements=['name']).returning(Area.name))]
+    area_ids = dict(db.session.query(Area.name, Area.id).filter(Area.name.in_(DEFAULT_AREAS)))
+    charges = [{'from_area_id': area_ids[f], 'to_area_id': area_ids[t], 'amount': amount} for f, t, amount in DEFAULT_CHARGES]
+    stmt = sqlite_insert(Charge).values(charges).on_conflict_do_nothing(index_elements=['from_area_id', 'to_area_id'])
+    created += [f"Default Charge {f} -> {t} (${float(amount)}) created" for f, t, amount in db.session.execute(stmt.returning(Charge.from_area_id, Charge.to_area_id, Charge.amount))]
+    if created: bump_version('pricing')
+    table = DataVersion.__table__
+    stmt = sqlite_insert(table).values(name='bootstrap', version=BOOTSTRAP_VERSION)
+    db.session.execute(stmt.on_conflict_do_update(index_elements=[table.c.name], set_={'version': stmt.excluded.version}))
+    db.session.commit()
+    for message in created: print(message)
+    return True
+
 def create_app(test_config=None):
     app = Flask(__name__)
     if test_config is None:
@@ -416,26 +2025,80 @@ def create_app(test_config=None):
             pass
 
     # Config for Session Persistence
-    from datetime import timedelta
     app.config['PERMANENT_SESSION_LIFETIME'] = timedelta(days=7)
     
+    # Seconds a worker trusts its in-memory fare matrix before re-checking the pricing version
+    app.config['PRICING_CHECK_INTERVAL'] = 1.0
+    app.config['FEED_KEEPALIVE_INTERVAL'] = 15.0
+    # Seconds a logged-in user's identity is served from memory (0 = load on every request)
+    app.config['IDENTITY_CACHE_TTL'] = 10.0
+    # Seconds partner heartbeats are coalesced in memory before one batched UPDATE (0 = write through)
+    app.config['HEARTBEAT_FLUSH_INTERVAL'] = 2.0
+    app.config['HISTORY_PAGE_SIZE'] = 20
+    app.config['BULK_IMPORT_CHUNK_SIZE'] = 5000
+    # Completed, rated orders older than this many days move to orders_archive (flask archive-orders)
+    app.config['ORDER_ARCHIVE_AFTER_DAYS'] = 90
+    # 'pull': partners accept orders from their dashboard; 'batch': also assign pending orders
+    # to idle partners every DISPATCH_TICK_INTERVAL seconds (see dispatch_tick)
+    app.config['DISPATCH_MODE'] = 'pull'
+    app.config['DISPATCH_TICK_INTERVAL'] = 1.0
+    app.config['DISPATCH_RATING_WEIGHT'] = 1.0
+    app.config['DISPATCH_LOAD_WEIGHT'] = 1.0
+    # Worker threads the ASGI gateway (asgi.py) runs Flask views and database work on
+    app.config['ASGI_THREADS'] = 32
+    # Connection profile for file-backed SQLite, see SQLITE_PROFILES
+    app.config['SQLITE_PROFILE'] = 'tuned'
+    # Per-endpoint latency and SQL metrics on /metrics; statements slower than the threshold are logged
+    app.config['METRICS_ENABLED'] = True
+    app.config['METRICS_SLOW_QUERY_SECONDS'] = 0.1
+    
     if test_config:
         app.config.from_mapping(test_config)
 
+    sqlite_profile = SQLITE_PROFILES[app.config['SQLITE_PROFILE']] if is_sqlite_file(app.config['SQLALCHEMY_DATABASE_URI']) else None
+    if sqlite_profile:
+        engine_options = dict(sqlite_profile['engine_options'])
+        engine_options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options
+
     db.init_app(app)
+    if sqlite_profile and sqlite_profile['pragmas']:
+        with app.app_context():
+            event.listen(db.engine, 'connect', functools.partial(apply_sqlite_pragmas, sqlite_profile['pragmas']))
+    app.extensions['fare_engine'] = FareEngine(app.config['PRICING_CHECK_INTERVAL'])
+    app.extensions['order_feed'] = OrderFeedHub()
+    app.extensions['dispatch_index'] = DispatchIndex()
+    app.extensions['identity_cache'] = IdentityCache(app.config['IDENTITY_CACHE_TTL'])
+    app.extensions['heartbeats'] = HeartbeatBuffer(app, app.config['HEARTBEAT_FLUSH_INTERVAL'])
+    app.extensions['fragments'] = FragmentCache()
+    app.add_template_global(area_options)
+    app.add_template_global(area_names_json)
+
+    if app.config['METRICS_ENABLED']:
+        app.extensions['metrics'] = Metrics(app.config['METRICS_SLOW_QUERY_SECONDS'])
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+            event.listen(db.engine, 'after_cursor_execute', after_cursor_execute)
+        app.before_request(start_request_metrics)
+        app.teardown_request(finish_request_metrics)
+
+        @app.route('/metrics')
+        def prometheus_metrics():
+            return Response(metrics().render(), mimetype='text/plain; version=0.0.4')
 
     @app.before_request
     def load_logged_in_user():
         g.user = None
         if request.path.startswith('/admin'):
             user_id = session.get('admin_id')
-            if user_id: g.user = User.query.get(user_id)
+            if user_id: g.user = identity_cache().get(user_id)
         elif request.path.startswith('/partner'):
             user_id = session.get('partner_id')
-            if user_id: g.user = User.query.get(user_id)
+            if user_id: g.user = identity_cache().get(user_id)
+            if g.user: g.user = heartbeats().overlay(g.user)
         elif request.path.startswith('/customer'):
             user_id = session.get('customer_id')
-            if user_id: g.user = User.query.get(user_id)
+            if user_id: g.user = identity_cache().get(user_id)
 
     @app.context_processor
     def inject_user():
@@ -444,6 +2107,16 @@ def create_app(test_config=None):
     app.register_blueprint(admin_bp)
     app.register_blueprint(partner_bp)
     app.register_blueprint(customer_bp)
+    app.cli.add_command(rebuild_stats_command)
+    app.cli.add_command(create_indexes_command)
+    app.cli.add_command(fold_wallets_command)
+    app.cli.add_command(reconcile_wallets_command)
+    app.cli.add_command(import_orders_command)
+    app.cli.add_command(export_orders_command)
+    app.cli.add_command(backfill_rollups_command)
+    app.cli.add_command(seed_large_command)
+    app.cli.add_command(archive_orders_command)
+    app.cli.add_command(dispatch_tick_command)
 
     @app.route('/logout')
     def auth_logout():
@@ -455,60 +2128,11 @@ def create_app(test_config=None):
         return render_template('landing.html')
 
     with app.app_context():
-        db.create_all()
-        # Seed
-        if not User.query.filter_by(username='admin').first():
-            admin = User(username='admin', role='admin', status='active')
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
-            print("Default admin created: admin/admin123")
-        
-        # Seed Partner
-        if not User.query.filter_by(username='partner').first():
-            partner = User(username='partner', role='partner', status='active')
-            partner.set_password('partner123')
-            db.session.add(partner)
-            db.session.commit()
-            print("Default partner created: partner/partner123")
-
-        # Seed Customer
-        if not User.query.filter_by(username='customer').first():
-            customer = User(username='customer', role='customer', status='active')
-            customer.set_password('customer123')
-            db.session.add(customer)
-            db.session.commit()
-            print("Default customer created: customer/customer123")
-
-        # Seed Areas
-        area_a = Area.query.filter_by(name='Area A').first()
-        if not area_a:
-            area_a = Area(name='Area A')
-            db.session.add(area_a)
-            db.session.commit()
-            print("Default Area A created")
-
-        area_b = Area.query.filter_by(name='Area B').first()
-        if not area_b:
-            area_b = Area(name='Area B')
-            db.session.add(area_b)
-            db.session.commit()
-            print("Default Area B created")
-            
-        # Seed Charges
-        charges_data = [
-            (area_a.id, area_b.id, 50.0),
-            (area_b.id, area_a.id, 50.0),
-            (area_a.id, area_a.id, 30.0),
-            (area_b.id, area_b.id, 30.0),
-        ]
-        
-        for from_id, to_id, amount in charges_data:
-            charge = Charge.query.filter_by(from_area_id=from_id, to_area_id=to_id).first()
-            if not charge:
-                db.session.add(Charge(from_area_id=from_id, to_area_id=to_id, amount=amount))
-                db.session.commit()
-                print(f"Default Charge {from_id} -> {to_id} (${amount}) created")
+        bootstrap()
+        app.extensions['dispatch_index'].rebuild()
+    if app.config['DISPATCH_MODE'] == 'batch':
+        app.extensions['dispatcher'] = BatchDispatcher(app, app.config['DISPATCH_TICK_INTERVAL'])
+        app.extensions['dispatcher'].start()
 
     return app
 
@@ -0,0 +1,235 @@
+# ASGI serving mode: uvicorn --factory asgi:create_asgi_app (or python asgi.py)
+#
+# The order feed is streamed by the event loop, so an idle subscriber holds a socket and a
+# small queue instead of a worker thread. Heartbeats and quotes are read on the loop and run
+# through Flask in one hop to a bounded thread pool, where SQLAlchemy and SQLite stay
+# synchronous; every other route is forwarded to Flask on the same pool with its response
+# streamed back through asgiref's async_to_sync.
+import asyncio
+import collections
+import io
+import queue
+import sys
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import async_to_sync, sync_to_async
+
+from app import create_app, heartbeats
+
+class FeedQueue:
+    # The queue.Queue side OrderFeedHub.publish uses (from any thread), awaited by one SSE
+    # stream on the event loop. close() wakes the stream when the client disconnects.
+    def __init__(self, loop, maxsize=256):
+        self.loop = loop
+        self.maxsize = maxsize
+        self.items = collections.deque()
+        self.lock = threading.Lock()
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def put_nowait(self, item):
+        with self.lock:
+            if len(self.items) >= self.maxsize: raise queue.Full
+            self.items.append(item)
+        self.wake()
+
+    def get_nowait(self):
+        with self.lock:
+            if not self.items: raise queue.Empty
+            return self.items.popleft()
+
+    def empty(self):
+        return not self.items
+
+    def wake(self):
+        try: self.loop.call_soon_threadsafe(self.ready.set)
+        except RuntimeError: pass  # loop already closed, nobody is listening
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    async def get(self, timeout):
+        # Next message, None once closed; raises asyncio.TimeoutError after timeout seconds
+        while not self.closed:
+            self.ready.clear()
+            try: return self.get_nowait()
+            except queue.Empty: pass
+            await asyncio.wait_for(self.ready.wait(), timeout)
+        return None
+
+async def read_body(receive):
+    # Whole request body, read on the loop so slow uploads never hold a thread; None on disconnect
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect': return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'): return b''.join(chunks)
+
+async def spool_body(receive, max_size=64 * 1024):
+    # Same, for routes that may take large uploads (bulk orders): spilled to disk past max_size
+    body = tempfile.SpooledTemporaryFile(max_size=max_size)
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            body.close()
+            return None
+        body.write(message.get('body', b''))
+        if not message.get('more_body'):
+            body.seek(0)
+            return body
+
+def wsgi_environ(scope, body):
+    # PEP 3333 environ for an ASGI http scope; body is the file-like wsgi.input
+    script_name = scope.get('root_path', '').encode('utf8').decode('latin1')
+    path_info = scope['path'].encode('utf8').decode('latin1')
+    if path_info.startswith(script_name): path_info = path_info[len(script_name):]
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': script_name,
+        'PATH_INFO': path_info,
+        'QUERY_STRING': scope.get('query_string', b'').decode('ascii'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port or 0),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    if scope.get('client'): environ['REMOTE_ADDR'] = scope['client'][0]
+    for name, value in scope.get('headers', ()):
+        name, value = name.decode('latin1').lower(), value.decode('latin1')
+        key = {'content-length': 'CONTENT_LENGTH', 'content-type': 'CONTENT_TYPE'}.get(name) or 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+def asgi_headers(headers):
+    return [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers]
+
+class AsgiGateway:
+    def __init__(self, flask_app):
+        self.app = flask_app
+        self.executor = ThreadPoolExecutor(flask_app.config['ASGI_THREADS'], thread_name_prefix='asgi')
+        self.hub = flask_app.extensions['order_feed']
+        self.handlers = {
+            ('GET', '/partner/feed'): self.feed,
+            ('POST', '/partner/heartbeat'): self.respond,
+            ('GET', '/customer/quote'): self.respond,
+        }
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan': return await self.lifespan(receive, send)
+        path = scope['path'][len(scope.get('root_path', '')):] if scope['type'] == 'http' else None
+        handler = self.handlers.get((scope['method'], path)) if path is not None else None
+        if handler is None: return await self.forward(scope, receive, send)
+        body = await read_body(receive)
+        if body is not None: await handler(scope, io.BytesIO(body), receive, send)
+
+    def call_wsgi(self, environ):
+        # Pool thread: one ordinary WSGI call, response buffered (small JSON or header-only)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'], started['headers'] = int(status.split(' ', 1)[0]), headers
+
+        result = self.app(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'): result.close()
+        return started['status'], asgi_headers(started['headers']), content
+
+    def stream_wsgi(self, environ, send):
+        # Pool thread: one WSGI call whose body is sent chunk by chunk as Flask yields it
+        send = async_to_sync(send)
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and started.get('sent'): raise exc_info[1].with_traceback(exc_info[2])
+            started['message'] = {'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]), 'headers': asgi_headers(headers)}
+
+        result = self.app(environ, start_response)
+        try:
+            for chunk in result:
+                if not chunk: continue
+                if not started.get('sent'):
+                    send(started['message'])
+                    started['sent'] = True
+                send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        finally:
+            if hasattr(result, 'close'): result.close()
+        if not started.get('sent'): send(started['message'])
+        send({'type': 'http.response.body', 'body': b''})
+
+    async def forward(self, scope, receive, send):
+        # Every other route. sync_to_async's executor argument keeps the call on our bounded
+        # pool (asgiref would otherwise use one shared thread) while async_to_sync still finds this loop.
+        if scope['type'] != 'http': raise ValueError(f"Unsupported ASGI scope type {scope['type']!r}")
+        body = await spool_body(receive)
+        if body is None: return
+        with body:
+            await sync_to_async(self.stream_wsgi, thread_sensitive=False, executor=self.executor)(wsgi_environ(scope, body), send)
+
+    async def respond(self, scope, body, receive, send):
+        status, headers, content = await asyncio.get_running_loop().run_in_executor(self.executor, self.call_wsgi, wsgi_environ(scope, body))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': content})
+
+    async def feed(self, scope, body, receive, send):
+        # The Flask view authenticates and subscribes our queue (see partner.feed); the loop
+        # then streams from it until the client goes away, with no thread attached
+        loop = asyncio.get_running_loop()
+        environ = wsgi_environ(scope, body)
+        environ['orderfeed.queue'] = q = FeedQueue(loop, self.hub.max_queue)
+        status, headers, content = await loop.run_in_executor(self.executor, self.call_wsgi, environ)
+        area_id = environ.get('orderfeed.area_id')
+        if area_id is None:
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            return await send({'type': 'http.response.body', 'body': content})
+
+        async def watch_disconnect():
+            while (await receive())['type'] != 'http.disconnect': pass
+            q.close()
+
+        watcher = asyncio.ensure_future(watch_disconnect())
+        keepalive = self.app.config['FEED_KEEPALIVE_INTERVAL']
+        try:
+            await send({'type': 'http.response.start', 'status': status, 'headers': [header for header in headers if header[0] != b'content-length']})
+            await send({'type': 'http.response.body', 'body': b'retry: 3000\n\n', 'more_body': True})
+            while True:
+                try: message = await q.get(keepalive)
+                except asyncio.TimeoutError: message = ': keepalive\n\n'
+                if message is None: break
+                await send({'type': 'http.response.body', 'body': message.encode(), 'more_body': True})
+        finally:
+            watcher.cancel()
+            self.hub.unsubscribe(area_id, q)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.shutdown)
+                return await send({'type': 'lifespan.shutdown.complete'})
+
+    def shutdown(self):
+        # Buffered heartbeats would otherwise be lost with the process
+        with self.app.app_context():
+            heartbeats().flush()
+
+def create_asgi_app(test_config=None):
+    return AsgiGateway(create_app(test_config))
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(create_asgi_app(), host='0.0.0.0', port=5000)
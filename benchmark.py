@@ -0,0 +1,1292 @@
+import argparse
+import asyncio
+import functools
+import http.client
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+# Ensure we can import app
+sys.path.append(os.getcwd())
+
+from app import start_request_metrics, finish_request_metrics, before_cursor_execute, after_cursor_execute
+from app import create_app, db, User, Area, Charge, Order, pending_orders_in_area, customer_orders, history_page, encode_cursor, rebuild_admin_stats, rebuild_rollups, seed_large, pricing_changed
+from app import archive_orders, active_orders_for_partner, customer_history, dispatch_tick, dispatch_index
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, insert
+
+# ================= HELPERS =================
+
+def make_app(db_path, **config):
+    test_config = {
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path,
+        'SECRET_KEY': 'bench',
+        'SQLALCHEMY_ENGINE_OPTIONS': {'connect_args': {'timeout': 30}},
+    }
+    test_config.update(config)
+    return create_app(test_config)
+
+def login(app, role, username, password):
+    client = app.test_client()
+    client.post(f'/{role}/login', data={'username': username, 'password': password})
+    return client
+
+def pop_flashes(client):
+    with client.session_transaction() as sess:
+        return [message for _, message in sess.pop('_flashes', [])]
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered: return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def seed_partners(count, area_id=None, online=False):
+    partners = [User(username=f'bench_partner_{i}', password_hash='password', role='partner', status='active', is_online=online, current_area_id=area_id) for i in range(count)]
+    db.session.add_all(partners)
+    db.session.commit()
+    return [(p.id, p.username) for p in partners]
+
+def seed_pending_orders(count, pickup_area_id, drop_area_id):
+    customer = User.query.filter_by(username='customer').first()
+    orders = [Order(customer_id=customer.id, pickup_area_id=pickup_area_id, drop_area_id=drop_area_id, pickup_address=f'{i} Bench St', drop_address='Drop St', amount=50.0, commission=5.0, status='pending') for i in range(count)]
+    db.session.add_all(orders)
+    db.session.commit()
+    return [o.id for o in orders]
+
+def seed_order_history(count, area_ids, customer_id, partner_id, status='completed', chunk=50000, days=None):
+    # Core executemany in large transactions; ORM objects would dominate the runtime.
+    # Orders are 30s apart, or spread evenly over the last `days` days.
+    start = datetime.utcnow() - timedelta(days=days or 365)
+    spacing = days * 86400 / count if days else 30
+    for offset in range(0, count, chunk):
+        rows = [{'customer_id': customer_id, 'partner_id': partner_id, 'pickup_area_id': area_ids[i % len(area_ids)], 'drop_area_id': area_ids[(i // 7) % len(area_ids)],
+                 'pickup_address': 'History St', 'drop_address': 'Drop St', 'status': status, 'amount': 50.0, 'commission': 5.0,
+                 'created_at': start + timedelta(seconds=i * spacing)} for i in range(offset, min(count, offset + chunk))]
+        db.session.execute(insert(Order), rows)
+        db.session.commit()
+
+def count_statements(app):
+    # Returns a one-item list that counts every SQL statement the app's engine runs
+    counter = [0]
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', lambda *args: counter.__setitem__(0, counter[0] + 1))
+    return counter
+
+def time_per_call(fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations): fn()
+    return (time.perf_counter() - start) / iterations
+
+# ================= BENCHMARKS =================
+
+def stress_claims(args):
+    # Every partner races for the same pending orders through partner.accept_order
+    print(f"Claim stress: {args.partners} partners racing for {args.orders} orders...")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'claims.db'))
+        with app.app_context():
+            area = Area.query.filter_by(name='Area A').first()
+            partners = seed_partners(args.partners, area.id, online=True)
+            order_ids = seed_pending_orders(args.orders, area.id, area.id)
+        clients = [(partner_id, login(app, 'partner', username, 'password')) for partner_id, username in partners]
+
+        wins, errors, requests = [], [], [0]
+        lock = threading.Lock()
+        barrier = threading.Barrier(len(clients))
+
+        def worker(partner_id, client):
+            targets = order_ids[:]
+            random.shuffle(targets)
+            barrier.wait()
+            try:
+                for order_id in targets:
+                    client.get(f'/partner/accept_order/{order_id}')
+                    flashes = pop_flashes(client)
+                    with lock:
+                        requests[0] += 1
+                        if 'Order accepted.' in flashes:
+                            wins.append((order_id, partner_id))
+                    if 'Order accepted.' in flashes or 'You already have an active order. Please complete it first.' in flashes:
+                        return
+            except Exception as e:
+                with lock: errors.append(repr(e))
+
+        threads = [threading.Thread(target=worker, args=item) for item in clients]
+        start = time.perf_counter()
+        for t in threads: t.start()
+        for t in threads: t.join()
+        elapsed = time.perf_counter() - start
+
+        with app.app_context():
+            assigned = dict(db.session.query(Order.id, Order.partner_id).filter(Order.id.in_(order_ids), Order.status == 'accepted').all())
+        print(f"   - {requests[0]} accept requests in {elapsed:.2f}s ({requests[0] / elapsed:.0f} req/s)")
+
+    won_orders = [order_id for order_id, _ in wins]
+    won_partners = [partner_id for _, partner_id in wins]
+    if errors:
+        print(f"FAILED: {len(errors)} workers errored, e.g. {errors[0]}")
+    elif len(won_orders) != len(set(won_orders)):
+        print("FAILED: Some orders were won by more than one partner")
+    elif len(won_partners) != len(set(won_partners)):
+        print("FAILED: Some partners won more than one order")
+    elif dict(wins) != assigned or len(assigned) != len(order_ids):
+        print(f"FAILED: Reported winners do not match the database ({len(assigned)}/{len(order_ids)} orders assigned)")
+    else:
+        print(f"SUCCESS: Exactly one winner for each of {len(order_ids)} orders.")
+
+def load_feed(args):
+    # Many partners hold /partner/feed open while a customer places orders in their area
+    print(f"Feed load: {args.subscribers} SSE subscribers, {args.orders} orders...")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'feed.db'), FEED_KEEPALIVE_INTERVAL=1.0)
+        with app.app_context():
+            area_id = Area.query.filter_by(name='Area A').first().id
+            partners = seed_partners(args.subscribers, area_id, online=True)
+        clients = [login(app, 'partner', username, 'password') for _, username in partners]
+        customer = login(app, 'customer', 'customer', 'customer123')
+        hub = app.extensions['order_feed']
+
+        received, errors = [], []
+        lock = threading.Lock()
+
+        def subscriber(client):
+            response = client.get('/partner/feed', buffered=False)
+            arrivals = []
+            try:
+                for chunk in response.response:
+                    chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+                    if chunk.startswith('event: order_created'):
+                        arrivals.append(time.perf_counter())
+                        if len(arrivals) == args.orders: break
+            except Exception as e:
+                with lock: errors.append(repr(e))
+            finally:
+                response.close()
+            with lock: received.append(arrivals)
+
+        threads = [threading.Thread(target=subscriber, args=(client,), daemon=True) for client in clients]
+        for t in threads: t.start()
+        while hub.subscriber_count(area_id) < args.subscribers: time.sleep(0.01)
+
+        sent, publish_costs = [], []
+        for i in range(args.orders):
+            start = time.perf_counter()
+            sent.append(start)
+            customer.post('/customer/create_order', data={'pickup_area_id': area_id, 'pickup_address': f'{i} Feed St', 'drop_area_id': area_id, 'drop_address': 'Drop St'})
+            publish_costs.append(time.perf_counter() - start)
+        for t in threads: t.join(timeout=60)
+
+    latencies = [arrival - sent[i] for arrivals in received for i, arrival in enumerate(arrivals)]
+    delivered = sum(len(arrivals) for arrivals in received)
+    expected = args.subscribers * args.orders
+    print(f"   - create_order p50 {percentile(publish_costs, 50) * 1000:.1f}ms, p99 {percentile(publish_costs, 99) * 1000:.1f}ms")
+    print(f"   - delivery latency p50 {percentile(latencies, 50) * 1000:.1f}ms, p99 {percentile(latencies, 99) * 1000:.1f}ms")
+    if errors or delivered != expected:
+        print(f"FAILED: Delivered {delivered}/{expected} events ({len(errors)} subscriber errors)")
+    else:
+        print(f"SUCCESS: All {expected} events delivered to {args.subscribers} subscribers.")
+
+def bench_dispatch(args):
+    # Dispatch index lookups vs the equivalent indexed SQL as order history grows
+    sizes = [int(size) for size in args.history.split(',')]
+    print(f"Dispatch index: history sizes {sizes}, {args.partners} partners, {args.pending} pending orders")
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'dispatch.db'))
+        with app.app_context():
+            area_ids = [area.id for area in Area.query.all()]
+            area_id = area_ids[0]
+            customer_id = User.query.filter_by(username='customer').first().id
+            partners = seed_partners(args.partners, area_id, online=True)
+            seed_pending_orders(args.pending, area_id, area_id)
+            index = app.extensions['dispatch_index']
+            seeded = 0
+            for size in sizes:
+                seed_order_history(size - seeded, area_ids, customer_id, partners[0][0])
+                seeded = size
+                start = time.perf_counter()
+                index.rebuild()
+                rebuild = time.perf_counter() - start
+                next_order = time_per_call(lambda: index.next_pending_order(area_id), 10000)
+                idle = time_per_call(lambda: index.idle_count(area_id), 10000)
+                sql = time_per_call(lambda: pending_orders_in_area(area_id).first(), 200)
+                results.append((size, rebuild, next_order, idle, sql))
+                print(f"   - history {size:>9}: rebuild {rebuild * 1000:8.1f}ms | next order {next_order * 1e6:6.2f}us | idle partners {idle * 1e6:6.2f}us | SQL next order {sql * 1e6:8.1f}us")
+    first, last = results[0], results[-1]
+    if last[2] <= first[2] * 3 and last[3] <= first[3] * 3:
+        print(f"SUCCESS: Index lookups stay flat from {first[0]} to {last[0]} historical orders.")
+    else:
+        print("FAILED: Index lookup cost grew with order history")
+
+def run_dispatch_sim(mode, args):
+    # One simulated shift; returns per-order waits (arrival -> claim) and counters
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, f'{mode}.db'), METRICS_ENABLED=False)
+        with app.app_context():
+            # The app seeds two areas; an empty executemany would insert a row of defaults
+            missing = [{'name': f'Sim Area {i}'} for i in range(args.areas - Area.query.count())]
+            if missing: db.session.execute(insert(Area), missing)
+            area_ids = [area_id for (area_id,) in db.session.query(Area.id).order_by(Area.id)]
+            db.session.execute(insert(User), [{'username': f'sim_partner_{i}', 'password_hash': 'password', 'role': 'partner', 'status': 'active', 'is_online': True,
+                                               'current_area_id': area_ids[i % len(area_ids)]} for i in range(args.partners)])
+            db.session.commit()
+            partners = db.session.query(User.id, User.username, User.current_area_id).filter(User.username.like('sim_partner_%')).all()
+            customer_id = User.query.filter_by(username='customer').first().id
+            dispatch_index().rebuild()
+
+        created, claimed, inbox = {}, {}, {partner_id: queue.Queue() for partner_id, _, _ in partners}
+        counts = {'attempts': 0, 'completed': 0}
+        lock = threading.Lock()
+        stop = threading.Event()
+
+        def arrivals():
+            rng = random.Random(args.seed)
+            start = time.perf_counter()
+            for i in itertools.count():
+                if stop.wait(max(0.0, start + i / args.rate - time.perf_counter())): return
+                area_id = rng.choice(area_ids)
+                with app.app_context():
+                    order_id = db.session.execute(insert(Order).returning(Order.id), {'customer_id': customer_id, 'pickup_area_id': area_id, 'drop_area_id': rng.choice(area_ids),
+                                                  'pickup_address': f'{i} Sim St', 'drop_address': 'Drop St', 'amount': 50.0, 'commission': 5.0, 'status': 'pending'}).scalar()
+                    db.session.commit()
+                    created[order_id] = time.perf_counter()
+                    dispatch_index().add_order(order_id, area_id)
+
+        def ticker():
+            while not stop.wait(args.tick):
+                with app.app_context():
+                    rows = dispatch_tick()
+                now = time.perf_counter()
+                for row in rows:
+                    claimed[row.id] = now
+                    inbox[row.partner_id].put(row.id)
+
+        def partner(partner_id, username, area_id):
+            client = login(app, 'partner', username, 'password')
+            rng = random.Random(partner_id)
+            while not stop.is_set():
+                if mode == 'batch':
+                    try: order_id = inbox[partner_id].get(timeout=0.05)
+                    except queue.Empty: continue
+                else:
+                    # The dashboard lists the oldest pending orders; everyone picks from the same few
+                    with app.app_context():
+                        visible = [order_id for (order_id,) in pending_orders_in_area(area_id).with_entities(Order.id).limit(10)]
+                    if not visible:
+                        stop.wait(args.poll)
+                        continue
+                    order_id = rng.choice(visible)
+                    if stop.wait(args.browse): return
+                    client.get(f'/partner/accept_order/{order_id}')
+                    won = 'Order accepted.' in pop_flashes(client)
+                    with lock: counts['attempts'] += 1
+                    if not won: continue
+                    claimed[order_id] = time.perf_counter()
+                stop.wait(args.service)
+                client.get(f'/partner/update_status/{order_id}/completed')
+                with lock: counts['completed'] += 1
+
+        threads = [threading.Thread(target=partner, args=row) for row in partners] + [threading.Thread(target=arrivals)]
+        if mode == 'batch': threads.append(threading.Thread(target=ticker))
+        for t in threads: t.start()
+        time.sleep(args.duration)
+        stop.set()
+        for t in threads: t.join()
+        with app.app_context():
+            db.engine.dispose()
+    waits = [claimed[order_id] - created[order_id] for order_id in claimed if order_id in created]
+    return SimpleNamespace(created=len(created), claimed=len(claimed), waits=waits, **counts)
+
+def bench_dispatch_sim(args):
+    # Simulated shift: orders arrive at --rate per second spread over --areas areas and
+    # --partners partners take --service seconds per delivery. Pull: idle partners poll the
+    # oldest pending orders in their area every --poll seconds, spend --browse seconds picking
+    # a random visible one and tap accept (a lost race means browsing again). Batch:
+    # dispatch_tick() every --tick seconds and partners are handed their order.
+    print(f"Dispatch simulation: {args.partners} partners, {args.areas} areas, {args.rate} orders/s for {args.duration}s, {args.service}s per delivery, {args.browse}s to pick an order")
+    results = {}
+    for mode in ('pull', 'batch'):
+        results[mode] = result = run_dispatch_sim(mode, args)
+        wasted = f", {result.attempts - result.claimed} lost accept attempts" if mode == 'pull' else ''
+        print(f"   - {mode:<5}: {result.claimed}/{result.created} orders assigned ({result.claimed / args.duration:.1f}/s), {result.completed} delivered, "
+              f"wait p50 {percentile(result.waits, 50) * 1000:.0f}ms p95 {percentile(result.waits, 95) * 1000:.0f}ms{wasted}")
+    pull, batch = results['pull'], results['batch']
+    if batch.claimed >= pull.claimed and percentile(batch.waits, 50) < percentile(pull.waits, 50):
+        print("SUCCESS: Batch dispatch assigns at least as many orders with shorter waits and no lost accept attempts.")
+    else:
+        print(f"FAILED: Batch assigned {batch.claimed} (pull {pull.claimed}), p50 wait {percentile(batch.waits, 50):.3f}s (pull {percentile(pull.waits, 50):.3f}s)")
+
+def serve(mode, db_path, port, threads):
+    # Child process: one server in the given mode; 'wsgi' is the threaded Werkzeug server app.run uses
+    app = make_app(db_path, METRICS_ENABLED=False, ASGI_THREADS=threads)
+    if mode == 'wsgi':
+        import logging
+        from werkzeug.serving import run_simple
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        run_simple('127.0.0.1', port, app, threaded=True)
+    else:
+        import uvicorn
+        from asgi import AsgiGateway
+        uvicorn.run(AsgiGateway(app), host='127.0.0.1', port=port, log_level='warning', backlog=4096)
+
+def process_status(pid):
+    fields = dict(line.split(':', 1) for line in open(f'/proc/{pid}/status'))
+    return int(fields['Threads']), int(fields['VmRSS'].split()[0]) // 1024
+
+def http_request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    conn.request(method, path, body, headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response, data
+
+async def open_idle_feeds(port, cookie, count, timeout):
+    # Partners holding /partner/feed open; a connection counts once its SSE headers arrive
+    request = f'GET /partner/feed HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\n\r\n'.encode()
+    gate = asyncio.Semaphore(200)
+
+    async def connect():
+        async with gate:
+            try:
+                reader, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port), timeout)
+                writer.write(request)
+                head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), timeout)
+                if b' 200 ' in head.split(b'\r\n', 1)[0] and b'text/event-stream' in head: return writer
+                writer.close()
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError):
+                pass
+            return None
+
+    return [writer for writer in await asyncio.gather(*[connect() for _ in range(count)]) if writer]
+
+async def quote_load(port, cookie, workers, duration):
+    # Fresh connection per request in both modes (the Werkzeug server speaks HTTP/1.0)
+    request = f'GET /customer/quote?pickup_area_id=1&drop_area_id=2 HTTP/1.1\r\nHost: localhost\r\nCookie: {cookie}\r\nConnection: close\r\n\r\n'.encode()
+    deadline, latencies, failures = time.perf_counter() + duration, [], [0]
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                writer.write(request)
+                response = await reader.read()
+                writer.close()
+                if b' 200 ' in response.split(b'\r\n', 1)[0]: latencies.append(time.perf_counter() - start)
+                else: failures[0] += 1
+            except OSError:
+                failures[0] += 1
+
+    await asyncio.gather(*[worker() for _ in range(workers)])
+    return latencies, failures[0]
+
+def bench_asgi(args):
+    # One server process per mode: hold --idle SSE feed connections open, then measure quote
+    # throughput with them still open, plus the server's thread count and memory
+    print(f"Serving modes: {args.idle} idle /partner/feed connections, {args.workers} quote clients for {args.duration}s, ASGI pool {args.threads} threads")
+    results = {}
+    for offset, mode in enumerate(('wsgi', 'asgi')):
+        port = args.port + offset
+        with tempfile.TemporaryDirectory() as tmp:
+            server = multiprocessing.get_context('spawn').Process(target=serve, args=(mode, os.path.join(tmp, 'serve.db'), port, args.threads), daemon=True)
+            server.start()
+            deadline = time.time() + 30
+            while True:
+                try:
+                    socket.create_connection(('127.0.0.1', port), 1).close()
+                    break
+                except OSError:
+                    if time.time() > deadline: raise
+                    time.sleep(0.1)
+            form = {'Content-Type': 'application/x-www-form-urlencoded'}
+            partner = http_request(port, 'POST', '/partner/login', 'username=partner&password=partner123', form)[0].getheader('Set-Cookie').split(';')[0]
+            customer = http_request(port, 'POST', '/customer/login', 'username=customer&password=customer123', form)[0].getheader('Set-Cookie').split(';')[0]
+            http_request(port, 'POST', '/partner/heartbeat', json.dumps({'area_id': 1, 'is_online': True}), {'Content-Type': 'application/json', 'Cookie': partner})
+            threads_before, _ = process_status(server.pid)
+
+            async def run():
+                start = time.perf_counter()
+                feeds = await open_idle_feeds(port, partner, args.idle, args.timeout)
+                opened = time.perf_counter() - start
+                status = process_status(server.pid)
+                latencies, failures = await quote_load(port, customer, args.workers, args.duration)
+                for writer in feeds: writer.close()
+                return len(feeds), opened, status, latencies, failures
+
+            held, opened, (threads, rss), latencies, failures = asyncio.run(run())
+            server.terminate()
+            server.join()
+        results[mode] = SimpleNamespace(held=held, rate=len(latencies) / args.duration)
+        print(f"   - {mode}: {held}/{args.idle} feeds held (opened in {opened:.1f}s), server threads {threads_before} -> {threads}, RSS {rss}MB; "
+              f"quote {len(latencies) / args.duration:.0f} req/s, p50 {percentile(latencies, 50) * 1000:.1f}ms p99 {percentile(latencies, 99) * 1000:.1f}ms, {failures} failed")
+    wsgi, asgi = results['wsgi'], results['asgi']
+    if asgi.held == args.idle and asgi.held >= wsgi.held and asgi.rate > 0:
+        print("SUCCESS: The ASGI gateway holds every idle feed on the event loop and keeps serving requests.")
+    else:
+        print(f"FAILED: ASGI held {asgi.held}/{args.idle} feeds at {asgi.rate:.0f} req/s (WSGI {wsgi.held} at {wsgi.rate:.0f} req/s)")
+
+def bench_identity(args):
+    # /partner/dashboard throughput with the identity cache off (TTL 0) and on
+    print(f"Identity cache: {args.requests} sequential /partner/dashboard requests per mode")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, ttl in (('uncached', 0), ('cached', 10.0)):
+            app = make_app(os.path.join(tmp, f'identity_{label}.db'), IDENTITY_CACHE_TTL=ttl)
+            client = login(app, 'partner', 'partner', 'partner123')
+            statements = count_statements(app)
+            client.get('/partner/dashboard')
+            statements[0] = 0
+            start = time.perf_counter()
+            for _ in range(args.requests): client.get('/partner/dashboard')
+            elapsed = time.perf_counter() - start
+            results[label] = (args.requests / elapsed, statements[0] / args.requests)
+            print(f"   - {label:>8}: {results[label][0]:7.0f} req/s, {results[label][1]:.1f} SQL statements/request")
+    (cached_rate, cached_sql), (uncached_rate, uncached_sql) = results['cached'], results['uncached']
+    if cached_rate > uncached_rate and cached_sql < uncached_sql:
+        print(f"SUCCESS: Identity cache speedup {cached_rate / uncached_rate:.2f}x on /partner/dashboard, {uncached_sql - cached_sql:.1f} fewer statements per request.")
+    else:
+        print(f"FAILED: Cached {cached_rate:.0f} req/s at {cached_sql:.1f} statements/request vs uncached {uncached_rate:.0f} req/s at {uncached_sql:.1f}")
+
+def bench_history(args):
+    # Keyset pages vs OFFSET pages at increasing depth in one customer's history
+    page_size = 20
+    print(f"Order history: {args.orders} completed orders for one customer, {page_size} per page")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'history.db'))
+        with app.app_context():
+            area_ids = [area.id for area in Area.query.all()]
+            customer_id = User.query.filter_by(username='customer').first().id
+            partner_id = User.query.filter_by(username='partner').first().id
+            start = time.perf_counter()
+            seed_order_history(args.orders, area_ids, customer_id, partner_id)
+            print(f"   - seeded in {time.perf_counter() - start:.1f}s")
+            query = customer_orders(customer_id, ('completed',))
+            ordered = query.order_by(Order.created_at.desc(), Order.id.desc())
+            max_page = args.orders // page_size - 1
+            keyset_costs = []
+            for page in sorted({1, 10, 100, 1000, 10000, max_page}):
+                if page > max_page: continue
+                cursor = encode_cursor(ordered.offset(page * page_size - 1).first()) if page > 0 else None
+                keyset = time_per_call(lambda: history_page(query, cursor, page_size), 20)
+                offset = time_per_call(lambda: ordered.offset(page * page_size).limit(page_size).all(), 3)
+                keyset_costs.append(keyset)
+                print(f"   - page {page:>6}: keyset {keyset * 1000:7.2f}ms | OFFSET {offset * 1000:8.2f}ms")
+    if max(keyset_costs) <= min(keyset_costs) * 3:
+        print("SUCCESS: Keyset page cost is independent of page depth.")
+    else:
+        print("FAILED: Keyset page cost grows with page depth")
+
+def run_mixed_workload(app, workers, duration):
+    # workers: list of (op_name, fn) run in a tight loop by one thread each until the deadline
+    samples, errors = {}, {}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def loop(name, fn):
+        local, failed = [], 0
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                fn()
+                local.append(time.perf_counter() - start)
+            except Exception:
+                failed += 1
+        with lock:
+            samples.setdefault(name, []).extend(local)
+            errors[name] = errors.get(name, 0) + failed
+
+    threads = [threading.Thread(target=loop, args=worker) for worker in workers]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return samples, errors
+
+def bench_storage(args):
+    # Order creation, claim/decline and dashboard reads in parallel, per SQLite profile
+    print(f"Storage profiles: {args.writers} order writers, {args.claimers} claimers, {args.readers} dashboard readers, {args.duration}s each")
+    totals = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for profile in ('default', 'tuned'):
+            app = make_app(os.path.join(tmp, f'storage_{profile}.db'), SQLITE_PROFILE=profile, SQLALCHEMY_ENGINE_OPTIONS={})
+            with app.app_context():
+                area_id = Area.query.filter_by(name='Area A').first().id
+                partners = seed_partners(args.claimers + args.readers, area_id, online=True)
+                seed_pending_orders(100, area_id, area_id)
+            with app.app_context():
+                app.extensions['dispatch_index'].rebuild()
+            index = app.extensions['dispatch_index']
+
+            def create_order(client=None):
+                client.post('/customer/create_order', data={'pickup_area_id': area_id, 'pickup_address': 'Load St', 'drop_area_id': area_id, 'drop_address': 'Drop St'})
+
+            def claim_and_decline(client=None):
+                order_id = index.next_pending_order(area_id)
+                if order_id:
+                    client.get(f'/partner/accept_order/{order_id}')
+                    client.get(f'/partner/update_status/{order_id}/declined')
+
+            def read_dashboard(client=None):
+                client.get('/partner/dashboard')
+
+            workers = [('create_order', functools.partial(create_order, client=login(app, 'customer', 'customer', 'customer123'))) for _ in range(args.writers)]
+            workers += [('claim+decline', functools.partial(claim_and_decline, client=login(app, 'partner', username, 'password'))) for _, username in partners[:args.claimers]]
+            workers += [('dashboard', functools.partial(read_dashboard, client=login(app, 'partner', username, 'password'))) for _, username in partners[args.claimers:]]
+            samples, errors = run_mixed_workload(app, workers, args.duration)
+
+            print(f"   [{profile}]")
+            total, writes = 0, 0
+            for name in ('create_order', 'claim+decline', 'dashboard'):
+                latencies = samples.get(name, [])
+                total += len(latencies)
+                if name != 'dashboard': writes += len(latencies)
+                print(f"   - {name:>14}: {len(latencies) / args.duration:7.1f} ops/s | p50 {percentile(latencies, 50) * 1000:7.1f}ms | p99 {percentile(latencies, 99) * 1000:7.1f}ms | errors {errors.get(name, 0)}")
+            totals[profile] = (total / args.duration, writes / args.duration, sum(errors.values()))
+    # The profile targets contended writes (WAL, busy_timeout); reads are in the total for context
+    (default_rate, default_writes, default_errors), (tuned_rate, tuned_writes, tuned_errors) = totals['default'], totals['tuned']
+    summary = f"default {default_writes:.1f} writes/s, {default_rate:.0f} ops/s ({default_errors} errors) vs tuned {tuned_writes:.1f} writes/s, {tuned_rate:.0f} ops/s ({tuned_errors} errors)"
+    if tuned_writes > default_writes and tuned_errors <= default_errors:
+        print(f"SUCCESS: Throughput {summary}.")
+    else:
+        print(f"FAILED: Tuned profile is not ahead: {summary}")
+
+def write_import_file(path, count, area_ids, fmt):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        if fmt == 'csv': f.write('pickup_area_id,drop_area_id,pickup_address,drop_address\n')
+        for i in range(count):
+            pickup_area_id, drop_area_id = area_ids[i % len(area_ids)], area_ids[(i // 3) % len(area_ids)]
+            if fmt == 'csv':
+                f.write(f'{pickup_area_id},{drop_area_id},{i} Merchant Rd,{i} Customer Ave\n')
+            else:
+                f.write(json.dumps({'pickup_area_id': pickup_area_id, 'drop_area_id': drop_area_id, 'pickup_address': f'{i} Merchant Rd', 'drop_address': f'{i} Customer Ave'}) + '\n')
+
+def bench_ingest(args):
+    # One streamed /customer/orders/bulk upload per format vs one create_order POST per order
+    print(f"Bulk ingestion: {args.rows} orders per upload, baseline of {args.baseline} create_order posts")
+    rates = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'ingest.db'))
+        with app.app_context():
+            area_ids = [area.id for area in Area.query.all()]
+        client = login(app, 'customer', 'customer', 'customer123')
+
+        start = time.perf_counter()
+        for i in range(args.baseline):
+            client.post('/customer/create_order', data={'pickup_area_id': area_ids[i % len(area_ids)], 'pickup_address': f'{i} Form St', 'drop_area_id': area_ids[0], 'drop_address': 'Drop St'})
+        rates['create_order'] = args.baseline / (time.perf_counter() - start) * 60
+        print(f"   - {'create_order':>12}: {rates['create_order']:10.0f} orders/min")
+
+        for fmt, content_type in (('csv', 'text/csv'), ('jsonl', 'application/x-ndjson')):
+            path = os.path.join(tmp, f'orders.{fmt}')
+            write_import_file(path, args.rows, area_ids, fmt)
+            tracemalloc.start()
+            start = time.perf_counter()
+            with open(path, 'rb') as body:
+                response = client.post('/customer/orders/bulk', input_stream=body, content_length=os.path.getsize(path), content_type=content_type)
+                lines = 0
+                for chunk in response.iter_encoded():
+                    lines += chunk.count(b'\n')
+                summary = json.loads(chunk.splitlines()[-1])
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            rates[fmt] = summary['accepted'] / elapsed * 60
+            print(f"   - {'bulk ' + fmt:>12}: {rates[fmt]:10.0f} orders/min | {summary['accepted']} accepted, {summary['rejected']} rejected, {lines} report lines | peak traced memory {peak / 2**20:.1f}MB")
+    if min(rates['csv'], rates['jsonl']) >= 100000:
+        print(f"SUCCESS: Bulk ingestion sustains over 100k orders/min ({min(rates['csv'], rates['jsonl']) / rates['create_order']:.0f}x the per-order form path).")
+    else:
+        print(f"FAILED: Bulk ingestion below 100k orders/min: {rates}")
+
+def bench_export(args):
+    # Streams /admin/export/orders.csv over a large order table; memory must not grow with row count
+    print(f"Order export: {args.orders} completed orders")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'export.db'))
+        with app.app_context():
+            area_ids = [area.id for area in Area.query.all()]
+            customer_id = User.query.filter_by(username='customer').first().id
+            partner_id = User.query.filter_by(username='partner').first().id
+            start = time.perf_counter()
+            seed_order_history(args.orders, area_ids, customer_id, partner_id)
+            print(f"   - seeded in {time.perf_counter() - start:.1f}s")
+            first_day = db.session.query(func.min(Order.created_at)).scalar()
+        client = login(app, 'admin', 'admin', 'admin123')
+
+        def stream(query):
+            rows = size = 0
+            response = client.get('/admin/export/orders.csv' + query)
+            for chunk in response.iter_encoded():
+                rows += chunk.count(b'\n')
+                size += len(chunk)
+            return rows - 1, size
+
+        for group in ('order', 'partner', 'day'):
+            start = time.perf_counter()
+            rows, size = stream(f'?group={group}')
+            elapsed = time.perf_counter() - start
+            print(f"   - {'by ' + group:>10}: {rows:>9} rows, {size / 2**20:7.1f}MB in {elapsed:6.2f}s ({rows / elapsed:9.0f} rows/s)")
+
+        peaks = {}
+        tenth = first_day + timedelta(seconds=args.orders // 10 * 30)
+        for label, query in (('10% window', f'?end={tenth:%Y-%m-%d}'), ('full table', '')):
+            tracemalloc.start()
+            rows, _ = stream(query)
+            peaks[label] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"   - {label:>10}: {rows:>9} rows, peak traced memory {peaks[label] / 2**20:.1f}MB")
+    if peaks['full table'] <= peaks['10% window'] * 1.5 + 2**20:
+        print("SUCCESS: Export memory stays flat as the exported row count grows.")
+    else:
+        print(f"FAILED: Export memory grows with rows: {peaks}")
+
+def bench_analytics(args):
+    # /admin/analytics reads rollups; the same report as a GROUP BY over orders scans every row
+    sizes = [int(size) for size in args.orders.split(',')]
+    print(f"Analytics: rollup-backed view vs full order scan, {args.days}-day window, orders spread over the last year")
+    costs = []
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'analytics.db'))
+        with app.app_context():
+            area_ids = [area.id for area in Area.query.all()]
+            customer_id = User.query.filter_by(username='customer').first().id
+            partner_id = User.query.filter_by(username='partner').first().id
+        client = login(app, 'admin', 'admin', 'admin123')
+        seeded = 0
+        for size in sizes:
+            with app.app_context():
+                seed_order_history(size - seeded, area_ids, customer_id, partner_id, days=365)
+                seeded = size
+                start = time.perf_counter()
+                rebuild_rollups()
+                backfill = time.perf_counter() - start
+                since = datetime.utcnow() - timedelta(days=args.days)
+                day = func.date(Order.created_at)
+                scan = time_per_call(lambda: db.session.query(day, func.count(Order.id), func.sum(Order.amount)).filter(Order.created_at >= since).group_by(day).all(), 3)
+            view = time_per_call(lambda: client.get(f'/admin/analytics?days={args.days}'), 20)
+            costs.append(view)
+            print(f"   - {size:>8} orders: analytics view {view * 1000:7.2f}ms | order scan {scan * 1000:8.2f}ms | backfill {backfill:6.2f}s ({size / backfill:8.0f} orders/s)")
+    if costs[-1] <= costs[0] * 2:
+        print("SUCCESS: Analytics latency is independent of total order count.")
+    else:
+        print(f"FAILED: Analytics latency grows with order count: {costs}")
+
+def bench_charges(args):
+    # Full-matrix repricing through /admin/charges vs one /admin/set_charge post per cell
+    n = args.areas
+    print(f"Charge matrix: {n} areas, {n * n} cells")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'charges.db'))
+        with app.app_context():
+            missing = [{'name': f'Bench Area {i}'} for i in range(n - Area.query.count())]
+            if missing: db.session.execute(insert(Area), missing)
+            db.session.commit()
+            area_ids = [area.id for area in Area.query.order_by(Area.id)]
+        client = login(app, 'admin', 'admin', 'admin123')
+
+        for label, base in (('initial matrix', 10.0), ('full reprice', 20.0)):
+            payload = {'area_ids': area_ids, 'amounts': [[base + (i * 7 + j * 3) % 50 for j in range(n)] for i in range(n)]}
+            start = time.perf_counter()
+            response = client.post('/admin/charges', json=payload)
+            elapsed = time.perf_counter() - start
+            print(f"   - {label:>16}: {elapsed * 1000:8.1f}ms ({response.get_json()['updated']} cells)")
+
+        diff = {'charges': [{'from_area_id': area_ids[i], 'to_area_id': area_ids[(i * 13) % n], 'amount': 99.0} for i in range(n)]}
+        sparse = time_per_call(lambda: client.post('/admin/charges', json=diff), 5)
+        print(f"   - {'sparse diff':>16}: {sparse * 1000:8.1f}ms ({n} cells)")
+
+        sample = args.sample
+        start = time.perf_counter()
+        for i in range(sample):
+            client.post('/admin/set_charge', data={'from_area_id': area_ids[i % n], 'to_area_id': area_ids[(i // n) % n], 'amount': 42.0})
+        per_cell = (time.perf_counter() - start) / sample
+        print(f"   - {'set_charge/cell':>16}: {per_cell * 1000:8.2f}ms per cell, {per_cell * n * n:8.1f}s extrapolated to the full matrix")
+
+        start = time.perf_counter()
+        client.post('/admin/add_area', data={'name': 'Onboarded Area', 'self_charge': '25', **{f'distance_{area_id}': '55' for area_id in area_ids}})
+        onboard = time.perf_counter() - start
+        with app.app_context():
+            new_id = Area.query.filter_by(name='Onboarded Area').first().id
+            cells = Charge.query.filter((Charge.from_area_id == new_id) | (Charge.to_area_id == new_id)).count()
+            start = time.perf_counter()
+            quote = app.extensions['fare_engine'].quote(area_ids[0], new_id)
+            reload = time.perf_counter() - start
+        print(f"   - {'add_area':>16}: {onboard * 1000:8.1f}ms ({cells} cells); fare matrix reload {reload * 1000:.1f}ms")
+    if cells == 2 * n + 1 and quote and quote[0] == 55.0:
+        print(f"SUCCESS: Full {n}x{n} reprice in one request, {per_cell * n * n / elapsed:.0f}x faster than per-cell posts.")
+    else:
+        print(f"FAILED: add_area wrote {cells} cells (expected {2 * n + 1}), quote {quote}")
+
+def bench_matrix(args):
+    # Admin dashboard render and charge tile cost as the area count (and matrix) grows
+    sizes = [int(size) for size in args.areas.split(',')]
+    print(f"Charge matrix view: dashboard HTML and tile latency for {sizes} areas, full matrices")
+    renders = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for n in sizes:
+            app = make_app(os.path.join(tmp, f'matrix_{n}.db'))
+            with app.app_context():
+                missing = [{'name': f'Bench Area {i}'} for i in range(n - Area.query.count())]
+                if missing: db.session.execute(insert(Area), missing)
+                area_ids = [area.id for area in Area.query.order_by(Area.id)]
+                db.session.query(Charge).delete()
+                db.session.execute(insert(Charge), [{'from_area_id': f, 'to_area_id': t, 'amount': 10.0 + (f * 7 + t) % 50} for f in area_ids for t in area_ids])
+                db.session.commit()
+            client = login(app, 'admin', 'admin', 'admin123')
+            client.get('/admin/charges/tile')  # load the fare matrix once
+            size = len(client.get('/admin/dashboard').data)
+            render = time_per_call(lambda: client.get('/admin/dashboard'), 20)
+            areas_size = len(client.get('/admin/charges/areas').data)
+            tile = time_per_call(lambda: client.get('/admin/charges/tile?row=0&col=0'), 50)
+            renders.append((render, size))
+            print(f"   - {n:>5} areas: dashboard {render * 1000:6.2f}ms, {size / 1024:6.1f}KB | areas list {areas_size / 1024:7.1f}KB | tile {tile * 1000:5.2f}ms")
+    if renders[-1][1] - renders[0][1] < 64 and renders[-1][0] <= renders[0][0] * 2:
+        print("SUCCESS: Dashboard payload and render time are bounded regardless of area count.")
+    else:
+        print(f"FAILED: Dashboard grows with area count: {renders}")
+
+def bench_metrics(args):
+    # End-to-end latency with the layer on and off is interleaved in rounds (median kept), but on a
+    # noisy host the hook cost itself, times statements per request, is the reliable overhead figure
+    paths = {'customer': ['/customer/dashboard', '/customer/quote?pickup_area_id=1&drop_area_id=2'], 'partner': ['/partner/dashboard']}
+    rounds = 15
+    print(f"Metrics overhead: {args.requests} requests per endpoint, METRICS_ENABLED on vs off")
+    costs = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        apps = {enabled: make_app(os.path.join(tmp, f'metrics_{enabled}.db'), METRICS_ENABLED=enabled) for enabled in (False, True)}
+        clients = {enabled: {'customer': login(app, 'customer', 'customer', 'customer123'), 'partner': login(app, 'partner', 'partner', 'partner123')} for enabled, app in apps.items()}
+        for _ in range(rounds):
+            for role, role_paths in paths.items():
+                for path in role_paths:
+                    for enabled in (False, True):
+                        client = clients[enabled][role]
+                        costs.setdefault((path, enabled), []).append(time_per_call(lambda: client.get(path), args.requests // rounds))
+
+        app = apps[True]
+        endpoints = {endpoint: list(stats) for endpoint, stats in app.extensions['metrics'].endpoints.items()}
+        with app.test_request_context('/customer/dashboard'):
+            request_hooks = time_per_call(lambda: (start_request_metrics(), finish_request_metrics()), 20000)
+            start_request_metrics()
+            context = SimpleNamespace()
+            statement_hooks = time_per_call(lambda: (before_cursor_execute(None, None, '', None, context, False), after_cursor_execute(None, None, '', None, context, False)), 20000)
+
+    worst = 0.0
+    for role_paths in paths.values():
+        for path in role_paths:
+            off, on = percentile(costs[(path, False)], 50), percentile(costs[(path, True)], 50)
+            stats = endpoints[app.url_map.bind('').match(path.split('?')[0])[0]]
+            added = request_hooks + statement_hooks * stats[3] / stats[1]
+            worst = max(worst, added / off)
+            print(f"   - {path:>50}: off {off * 1e6:7.0f}µs | on {on * 1e6:7.0f}µs ({(on / off - 1) * 100:+5.1f}%) | hooks {added * 1e6:5.1f}µs ({stats[3] / stats[1]:.1f} statements) = {added / off * 100:.2f}%")
+    print(f"   - per request {request_hooks * 1e6:.1f}µs, per statement {statement_hooks * 1e6:.1f}µs")
+    if worst < 0.02:
+        print(f"SUCCESS: Instrumentation hooks cost under 2% of any request (worst {worst * 100:.2f}%).")
+    else:
+        print(f"FAILED: Instrumentation hooks cost up to {worst * 100:.1f}% of a request")
+
+# ================= SUITE =================
+
+def bench_heartbeat(args):
+    # Many partners reporting area/online state: set_area form posts (commit + redirect to the
+    # dashboard) vs JSON heartbeats coalesced into one batched UPDATE per flush window
+    print(f"Partner heartbeats: {args.partners} partners over {args.threads} threads for {args.duration:.0f}s per mode, flush every {args.interval}s")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for mode in ('set_area', 'heartbeat'):
+            app = make_app(os.path.join(tmp, f'{mode}.db'), HEARTBEAT_FLUSH_INTERVAL=args.interval, METRICS_ENABLED=False)
+            with app.app_context():
+                area_ids = [area.id for area in Area.query.all()]
+                partners = seed_partners(args.partners, area_ids[0], online=True)
+                app.extensions['dispatch_index'].rebuild()
+            writes = [0]
+            with app.app_context():
+                event.listen(db.engine, 'before_cursor_execute', lambda conn, cursor, statement, *rest: writes.__setitem__(0, writes[0] + 1) if statement.startswith('UPDATE users') else None)
+            latencies, lock = [], threading.Lock()
+            clients = [login(app, 'partner', username, 'password') for _, username in partners]
+            deadline = time.perf_counter() + args.duration
+
+            def loop(number):
+                mine, local = clients[number::args.threads], []
+                for beat in itertools.count():
+                    if time.perf_counter() >= deadline: break
+                    client, area_id = mine[beat % len(mine)], area_ids[beat % len(area_ids)]
+                    start = time.perf_counter()
+                    if mode == 'set_area':
+                        client.post('/partner/set_area', data={'area_id': area_id}, follow_redirects=True)
+                    else:
+                        client.post('/partner/heartbeat', json={'area_id': area_id, 'is_online': True})
+                    local.append(time.perf_counter() - start)
+                with lock:
+                    latencies.extend(local)
+
+            threads = [threading.Thread(target=loop, args=(number,)) for number in range(args.threads)]
+            for thread in threads: thread.start()
+            for thread in threads: thread.join()
+            with app.app_context():
+                app.extensions['heartbeats'].flush()
+            results[mode] = (len(latencies) / args.duration, writes[0])
+            print(f"   - {mode:>9}: {results[mode][0]:7.0f} updates/s, p50 {percentile(latencies, 50) * 1000:6.1f}ms, p95 {percentile(latencies, 95) * 1000:6.1f}ms | {len(latencies)} updates, {writes[0]} UPDATE statements")
+    if results['heartbeat'][1] <= args.duration / args.interval + 2 and results['heartbeat'][0] > results['set_area'][0]:
+        print(f"SUCCESS: Heartbeats sustain {results['heartbeat'][0] / results['set_area'][0]:.1f}x the update rate with one write per flush window instead of one per update.")
+    else:
+        print(f"FAILED: {results}")
+
+def bench_etag(args):
+    # Dashboard polls with nothing changed: full render vs If-None-Match, with many areas in the
+    # selects (fragment cache) and a pending queue and order history behind the listings
+    print(f"Conditional dashboards: {args.areas} areas, {args.orders} orders, {args.requests} polls per case")
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'etag.db'), METRICS_ENABLED=False)
+        with app.app_context():
+            db.session.execute(insert(Area), [{'name': f'Poll Area {i}'} for i in range(args.areas)])
+            pricing_changed()
+            db.session.commit()
+            area_ids = [area.id for area in Area.query.all()]
+            customer_id = User.query.filter_by(username='customer').first().id
+            partner = User.query.filter_by(username='partner').first()
+            partner.current_area_id, partner.is_online = area_ids[0], True
+            db.session.commit()
+            seed_order_history(args.orders, area_ids[:1], customer_id, None, status='pending')
+            seed_order_history(args.orders, area_ids, customer_id, partner.id)
+        statements = count_statements(app)
+        for role, password in (('customer', 'customer123'), ('partner', 'partner123'), ('admin', 'admin123')):
+            client = login(app, role, role, password)
+            path = f'/{role}/dashboard'
+            first = client.get(path)
+            etag = first.headers['ETag']
+            for label, headers in (('full render', {}), ('304', {'If-None-Match': etag})):
+                statements[0] = 0
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    response = client.get(path, headers=headers)
+                elapsed = time.perf_counter() - start
+                results[(role, label)] = (args.requests / elapsed, statements[0] / args.requests, response.status_code)
+                print(f"   - {path:>19} {label:>11}: {results[(role, label)][0]:7.0f} req/s, {results[(role, label)][1]:.1f} SQL/request, {len(response.data):7} bytes, status {response.status_code}")
+    if all(results[(role, '304')][2] == 304 and results[(role, '304')][1] <= 2 for role in ('customer', 'partner', 'admin')):
+        print(f"SUCCESS: Unchanged polls answer 304 with at most 2 statements; customer {results[('customer', '304')][0] / results[('customer', 'full render')][0]:.0f}x, partner {results[('partner', '304')][0] / results[('partner', 'full render')][0]:.0f}x faster than a full render.")
+    else:
+        print(f"FAILED: {results}")
+
+def bench_startup(args):
+    # Module import in a fresh interpreter, then create_app() on a new in-memory database (full
+    # bootstrap), on an up-to-date file database (version check only) and with a stale version
+    import app as app_module
+    from sqlalchemy.engine import Engine
+    print(f"Startup: {args.runs} runs per case")
+    imports = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import app'], check=True, cwd=os.path.dirname(os.path.abspath(app_module.__file__)))
+        imports.append(time.perf_counter() - start)
+    baseline = []
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', 'import flask, flask_sqlalchemy, sqlalchemy'], check=True)
+        baseline.append(time.perf_counter() - start)
+    print(f"   - {'import app':>18}: {percentile(imports, 50) * 1000:7.1f}ms median process ({(percentile(imports, 50) - percentile(baseline, 50)) * 1000:.1f}ms over importing flask + SQLAlchemy)")
+
+    statements = [0]
+    event.listen(Engine, 'before_cursor_execute', lambda *rest: statements.__setitem__(0, statements[0] + 1))
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'startup.db')
+        make_app(path, METRICS_ENABLED=False)
+
+        def boot(label, db_path, before=None):
+            times, counts = [], []
+            for _ in range(args.runs):
+                if before: before()
+                statements[0] = 0
+                start = time.perf_counter()
+                app = make_app(db_path, METRICS_ENABLED=False) if db_path else create_app({'TESTING': True, 'SQLALCHEMY_DATABASE_URI': 'sqlite:///:memory:', 'SECRET_KEY': 'bench', 'METRICS_ENABLED': False})
+                times.append(time.perf_counter() - start)
+                counts.append(statements[0])
+                with app.app_context(): db.engine.dispose()
+            results[label] = (percentile(times, 50), max(counts))
+            print(f"   - {label:>18}: {results[label][0] * 1000:7.1f}ms median create_app(), {results[label][1]} SQL statements")
+
+        def make_stale():
+            with make_app(path, METRICS_ENABLED=False).app_context():
+                db.session.execute(db.text("UPDATE data_versions SET version = 0 WHERE name = 'bootstrap'"))
+                db.session.commit()
+                db.engine.dispose()
+
+        boot('fresh :memory:', None)
+        boot('up-to-date file', path)
+        boot('stale version', path, make_stale)
+    if results['up-to-date file'][1] <= 4:
+        print(f"SUCCESS: An up-to-date database boots with {results['up-to-date file'][1]} statements (1 version check + the dispatch index load).")
+    else:
+        print(f"FAILED: Warm boot ran {results['up-to-date file'][1]} statements")
+
+def bench_seed(args):
+    # flask seed-large into a fresh file: order insert rate untraced, then traced peak memory at
+    # two sizes to show it is bounded by the chunk and the user counts rather than the order count
+    sizes = [int(size) for size in args.memory.split(',')]
+    print(f"Large seeding: {args.areas} areas, {args.partners} partners, {args.customers} customers, chunk {args.chunk}")
+
+    def run(orders, traced):
+        with tempfile.TemporaryDirectory() as tmp:
+            app = make_app(os.path.join(tmp, 'seed.db'), METRICS_ENABLED=False)
+            marks = {}
+
+            def mark(message):
+                # Last word of each progress line: charges, customers, orders, rebuilt, total
+                marks[message.split(' (')[0].rsplit(' ', 1)[-1]] = time.perf_counter()
+
+            with app.app_context():
+                if traced: tracemalloc.start()
+                start = time.perf_counter()
+                seed_large(args.areas, args.partners, args.customers, orders, seed=args.seed, chunk=args.chunk, progress=mark)
+                total = time.perf_counter() - start
+                peak = tracemalloc.get_traced_memory()[1] if traced else 0
+                if traced: tracemalloc.stop()
+                db.engine.dispose()
+        return marks['orders'] - marks['customers'], total, peak
+
+    inserting, total, _ = run(args.orders, traced=False)
+    rate = args.orders / inserting * 60
+    print(f"   - {args.orders} orders inserted in {inserting:.1f}s ({rate:,.0f} rows/min), {total:.1f}s including indexes, stats, rollups and wallets")
+    peaks = {}
+    for orders in sizes:
+        peaks[orders] = run(orders, traced=True)[2]
+        print(f"   - {orders:>9} orders: peak traced memory {peaks[orders] / 2**20:.1f}MB")
+    if rate >= 1000000 and peaks[sizes[-1]] <= peaks[sizes[0]] * 1.5 + 2**20:
+        print("SUCCESS: seed-large inserts over a million orders per minute with memory bounded by the chunk size.")
+    else:
+        print(f"FAILED: {rate:,.0f} rows/min, peaks {peaks}")
+
+def bench_archive(args):
+    # Hot-path reads (best of several rounds) and the live orders table + index footprint on a
+    # year of seeded history, then again after archive-orders has moved everything older than
+    # --days out of the live table; plus the archive move rate
+    print(f"Order archive: {args.orders} orders over 365 days, archiving after {args.days} days in batches of {args.batch}")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(os.path.join(tmp, 'archive.db'), METRICS_ENABLED=False)
+        with app.app_context():
+            seed_large(args.areas, args.partners, args.customers, args.orders, days=365, seed=args.seed)
+            area_id = db.session.query(Order.pickup_area_id).filter(Order.status == 'pending').group_by(Order.pickup_area_id).order_by(func.count().desc()).limit(1).scalar()
+            customer_id, partner_id = db.session.query(Order.customer_id, Order.partner_id).filter(Order.status == 'completed').order_by(Order.id.desc()).first()
+            hot = {
+                'pending in area': lambda: pending_orders_in_area(area_id).limit(20).all(),
+                'partner active': lambda: active_orders_for_partner(partner_id).all(),
+                'customer history': lambda: history_page(customer_history(customer_id), limit=20),
+                'live count': lambda: db.session.query(func.count(Order.id)).scalar(),
+            }
+
+            def measure():
+                db.session.commit()
+                live_bytes = db.session.execute(db.text("SELECT SUM(pgsize) FROM dbstat WHERE name IN (SELECT name FROM sqlite_master WHERE tbl_name = 'orders')")).scalar()
+                return live_bytes, {name: min(time_per_call(fn, 3 if name == 'live count' else 100) for _ in range(5)) for name, fn in hot.items()}
+
+            bytes_before, before = measure()
+            start = time.perf_counter()
+            moved = archive_orders(args.days, args.batch)
+            elapsed = time.perf_counter() - start
+            bytes_after, after = measure()
+            live = db.session.query(func.count(Order.id)).scalar()
+            db.engine.dispose()
+    print(f"   - archived {moved} orders in {elapsed:.1f}s ({moved / elapsed:,.0f} rows/s); {live} live orders remain")
+    print(f"   - live orders table + indexes {bytes_before / 2**20:.1f}MB -> {bytes_after / 2**20:.1f}MB")
+    for name in hot:
+        print(f"   - {name:<17} {before[name] * 1000:8.2f}ms -> {after[name] * 1000:8.2f}ms")
+    if moved and bytes_after < bytes_before and all(after[name] <= before[name] * 1.5 for name in hot):
+        print("SUCCESS: The live orders table shrinks to the hot window and hot-path reads get no slower.")
+    else:
+        print(f"FAILED: Moved {moved}; {bytes_before} -> {bytes_after} bytes, before {before}, after {after}")
+
+def seed_suite(areas, partners, customers, orders, seed=42, chunk=50000):
+    # Deterministic dataset: full charge matrix, online partners spread over areas, customers
+    # and an order history that is mostly completed with a pending tail to claim from
+    rng = random.Random(seed)
+    missing = [{'name': f'Suite Area {i}'} for i in range(areas - Area.query.count())]
+    if missing: db.session.execute(insert(Area), missing)
+    area_ids = [area_id for (area_id,) in db.session.query(Area.id).order_by(Area.id)]
+    db.session.query(Charge).delete()
+    db.session.execute(insert(Charge), [{'from_area_id': f, 'to_area_id': t, 'amount': 30.0 if f == t else 40.0 + (f * 31 + t * 17) % 60} for f in area_ids for t in area_ids])
+    db.session.execute(insert(User), [{'username': f'suite_partner_{i}', 'password_hash': 'password', 'role': 'partner', 'status': 'active', 'is_online': True, 'current_area_id': area_ids[i % len(area_ids)]} for i in range(partners)])
+    db.session.execute(insert(User), [{'username': f'suite_customer_{i}', 'password_hash': 'password', 'role': 'customer', 'status': 'active'} for i in range(customers)])
+    db.session.commit()
+    partner_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.username.like('suite_partner_%'))]
+    customer_ids = [user_id for (user_id,) in db.session.query(User.id).filter(User.username.like('suite_customer_%'))]
+    start = datetime.utcnow() - timedelta(days=365)
+    for offset in range(0, orders, chunk):
+        rows = []
+        for i in range(offset, min(orders, offset + chunk)):
+            pickup, drop = rng.choice(area_ids), rng.choice(area_ids)
+            completed = i < orders - 2 * len(area_ids) * 10
+            amount = 30.0 if pickup == drop else 40.0 + (pickup * 31 + drop * 17) % 60
+            rows.append({'customer_id': rng.choice(customer_ids), 'partner_id': rng.choice(partner_ids) if completed else None, 'pickup_area_id': pickup, 'drop_area_id': drop,
+                         'pickup_address': 'Suite St', 'drop_address': 'Drop St', 'status': 'completed' if completed else 'pending', 'amount': amount, 'commission': amount * 0.1,
+                         'rating': rng.choice((None, None, 3, 4, 5, 5)) if completed else None, 'created_at': start + timedelta(seconds=i * 365 * 86400 / max(orders, 1))})
+        db.session.execute(insert(Order), rows)
+        db.session.commit()
+    rebuild_admin_stats()
+    rebuild_rollups()
+    return area_ids
+
+SUITE_MIX = {
+    'customer': [('customer.create_order', 3), ('customer.dashboard', 2), ('customer.quote', 3), ('customer.order_history', 1)],
+    'partner': [('partner.work', 4), ('partner.dashboard', 3), ('partner.feed', 2), ('partner.order_history', 1)],
+    'admin': [('admin.dashboard', 2), ('admin.analytics', 1), ('admin.charge_tile', 2)],
+}
+
+def run_suite_workload(app, area_ids, workers, duration, seed):
+    # workers: {'customer': n, 'partner': n, 'admin': n}. Each thread loops over its role's weighted
+    # mix and records client-side latency per endpoint; partners walk claim -> completed.
+    samples, errors = {}, {}
+    lock = threading.Lock()
+    index = app.extensions['dispatch_index']
+    with app.app_context():
+        users = {role: [(user.id, user.username, user.current_area_id) for user in User.query.filter(User.username.like(f'suite_{role}_%')).order_by(User.id).limit(count)]
+                 for role, count in workers.items() if role != 'admin'}
+    deadline = time.perf_counter() + duration
+
+    def loop(role, number):
+        rng = random.Random(seed * 1000 + number)
+        if role == 'admin':
+            client, area_id = login(app, 'admin', 'admin', 'admin123'), None
+        else:
+            _, username, area_id = users[role][number]
+            client = login(app, role, username, 'password')
+        names, weights = zip(*SUITE_MIX[role])
+        local, failed, active, steps = {}, {}, None, iter(())
+
+        def call(name, method, path, **kwargs):
+            start = time.perf_counter()
+            try:
+                response = getattr(client, method)(path, **kwargs)
+                if name == 'partner.feed':
+                    next(response.iter_encoded())
+                    response.close()
+                ok = response.status_code < 500
+            except Exception:
+                ok = False
+            local.setdefault(name, []).append(time.perf_counter() - start)
+            if not ok: failed[name] = failed.get(name, 0) + 1
+            return response if ok else None
+
+        while time.perf_counter() < deadline:
+            name = rng.choices(names, weights)[0]
+            if name == 'customer.create_order':
+                call(name, 'post', '/customer/create_order', data={'pickup_area_id': rng.choice(area_ids), 'pickup_address': 'Load St', 'drop_area_id': rng.choice(area_ids), 'drop_address': 'Drop St'})
+            elif name == 'customer.quote':
+                call(name, 'get', f'/customer/quote?pickup_area_id={rng.choice(area_ids)}&drop_area_id={rng.choice(area_ids)}')
+            elif name == 'admin.charge_tile':
+                call(name, 'get', f'/admin/charges/tile?row={rng.randrange(len(area_ids) // 50 + 1)}&col=0')
+            elif name == 'partner.work':
+                if active is None:
+                    order_id = index.next_pending_order(area_id)
+                    if order_id and call('partner.accept_order', 'get', f'/partner/accept_order/{order_id}') and 'Order accepted.' in pop_flashes(client):
+                        active, steps = order_id, iter(('picked_up', 'arrived', 'completed'))
+                else:
+                    status = next(steps, None)
+                    call('partner.update_status', 'get', f'/partner/update_status/{active}/{status}')
+                    if status == 'completed': active = None
+            else:
+                blueprint, view = name.split('.')
+                call(name, 'get', f'/{blueprint}/' + {'dashboard': 'dashboard', 'order_history': 'orders/history', 'feed': 'feed', 'analytics': 'analytics'}[view])
+        with lock:
+            for name, latencies in local.items(): samples.setdefault(name, []).extend(latencies)
+            for name, count in failed.items(): errors[name] = errors.get(name, 0) + count
+
+    threads = [threading.Thread(target=loop, args=(role, number), daemon=True) for role, count in workers.items() for number in range(count)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    return samples, errors
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare_baseline(report, baseline, tolerance):
+    # Returns regressions: p95 slower or throughput lower by more than tolerance, or more SQL per request
+    regressions = []
+    print(f"   Compared with {baseline.get('revision') or 'baseline'} (tolerance {tolerance:.0%}):")
+    for name, now in sorted(report['endpoints'].items()):
+        before = baseline['endpoints'].get(name)
+        if not before:
+            print(f"   - {name:>24}: new")
+            continue
+        p95 = now['p95_ms'] / before['p95_ms'] - 1 if before['p95_ms'] else 0.0
+        rate = now['throughput'] / before['throughput'] - 1 if before['throughput'] else 0.0
+        sql = now['sql_per_request'] - before['sql_per_request'] if now['sql_per_request'] is not None and before['sql_per_request'] is not None else 0.0
+        flags = [label for label, bad in (('p95', p95 > tolerance), ('throughput', rate < -tolerance), ('sql', sql > 0.5)) if bad]
+        regressions += [(name, flag) for flag in flags]
+        print(f"   - {name:>24}: p95 {p95:+6.1%} | throughput {rate:+6.1%} | sql/request {sql:+5.1f}" + (f"  <- REGRESSION ({', '.join(flags)})" if flags else ''))
+    return regressions
+
+def bench_suite(args):
+    workers = {'customer': args.customers_active, 'partner': args.partners_active, 'admin': args.admins_active}
+    print(f"Suite: {args.areas} areas, {args.partners} partners, {args.customers} customers, {args.orders} historical orders; "
+          f"{workers} concurrent users for {args.duration}s")
+    with tempfile.TemporaryDirectory() as tmp:
+        app = make_app(args.db or os.path.join(tmp, 'suite.db'), METRICS_SLOW_QUERY_SECONDS=args.slow_query)
+        with app.app_context():
+            start = time.perf_counter()
+            area_ids = seed_suite(args.areas, args.partners, args.customers, args.orders, args.seed)
+            app.extensions['dispatch_index'].rebuild()
+            print(f"   - seeded in {time.perf_counter() - start:.1f}s")
+        before = {name: list(stats) for name, stats in app.extensions['metrics'].endpoints.items()}
+        samples, errors = run_suite_workload(app, area_ids, workers, args.duration, args.seed)
+        after = app.extensions['metrics'].endpoints
+
+    report = {'revision': git_revision(), 'created_at': datetime.utcnow().isoformat(), 'config': {k: v for k, v in vars(args).items() if k not in ('command', 'save', 'compare', 'db')}, 'endpoints': {}}
+    print(f"   {'endpoint':>24}  {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'sql/req':>8} {'errors':>7}")
+    for name, latencies in sorted(samples.items()):
+        requests = after.get(name, [None, 0])[1] - before.get(name, [None, 0])[1]
+        statements = after.get(name, [None, 0, 0, 0])[3] - before.get(name, [None, 0, 0, 0])[3]
+        entry = {'count': len(latencies), 'throughput': len(latencies) / args.duration, 'p50_ms': percentile(latencies, 50) * 1000, 'p95_ms': percentile(latencies, 95) * 1000,
+                 'p99_ms': percentile(latencies, 99) * 1000, 'sql_per_request': statements / requests if requests else None, 'errors': errors.get(name, 0)}
+        report['endpoints'][name] = entry
+        sql = f"{entry['sql_per_request']:8.1f}" if entry['sql_per_request'] is not None else f"{'-':>8}"
+        print(f"   {name:>24}  {entry['throughput']:8.1f} {entry['p50_ms']:8.2f} {entry['p95_ms']:8.2f} {entry['p99_ms']:8.2f} {sql} {entry['errors']:7}")
+    if args.save:
+        with open(args.save, 'w') as f: json.dump(report, f, indent=2)
+        print(f"   - baseline saved to {args.save}")
+    regressions = []
+    if args.compare:
+        with open(args.compare) as f: regressions = compare_baseline(report, json.load(f), args.tolerance)
+    total_errors = sum(errors.values())
+    if total_errors or regressions:
+        print(f"FAILED: {total_errors} errors, {len(regressions)} regressions")
+        sys.exit(1)
+    print(f"SUCCESS: {sum(len(l) for l in samples.values())} requests over {len(samples)} endpoints without errors.")
+
+COMMANDS = {
+    'claims': stress_claims,
+    'feed': load_feed,
+    'dispatch': bench_dispatch,
+    'dispatch-sim': bench_dispatch_sim,
+    'asgi': bench_asgi,
+    'identity': bench_identity,
+    'history': bench_history,
+    'archive': bench_archive,
+    'storage': bench_storage,
+    'ingest': bench_ingest,
+    'export': bench_export,
+    'analytics': bench_analytics,
+    'charges': bench_charges,
+    'matrix': bench_matrix,
+    'metrics': bench_metrics,
+    'suite': bench_suite,
+    'seed': bench_seed,
+    'heartbeat': bench_heartbeat,
+    'startup': bench_startup,
+    'etag': bench_etag,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='RouteX load tests and benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+    claims = sub.add_parser('claims', help='Concurrent accept_order stress test')
+    claims.add_argument('--partners', type=int, default=200)
+    claims.add_argument('--orders', type=int, default=50)
+    feed = sub.add_parser('feed', help='SSE order feed fan-out with many concurrent subscribers')
+    feed.add_argument('--subscribers', type=int, default=500)
+    feed.add_argument('--orders', type=int, default=20)
+    dispatch = sub.add_parser('dispatch', help='Dispatch index lookup cost as order history grows')
+    dispatch.add_argument('--history', default='1000,10000,100000,1000000')
+    dispatch.add_argument('--partners', type=int, default=1000)
+    dispatch.add_argument('--pending', type=int, default=500)
+    dispatch_sim = sub.add_parser('dispatch-sim', help='Simulated shift: pull-model accepts vs batch dispatch ticks, throughput and order wait')
+    dispatch_sim.add_argument('--partners', type=int, default=40)
+    dispatch_sim.add_argument('--areas', type=int, default=4)
+    dispatch_sim.add_argument('--rate', type=float, default=20.0, help='Orders per second')
+    dispatch_sim.add_argument('--duration', type=float, default=15.0)
+    dispatch_sim.add_argument('--service', type=float, default=1.0, help='Seconds per delivery')
+    dispatch_sim.add_argument('--poll', type=float, default=0.5, help='Pull-model dashboard refresh interval')
+    dispatch_sim.add_argument('--browse', type=float, default=1.0, help='Pull-model seconds to pick an order before accepting')
+    dispatch_sim.add_argument('--tick', type=float, default=0.25, help='Batch dispatch interval')
+    dispatch_sim.add_argument('--seed', type=int, default=1)
+    asgi = sub.add_parser('asgi', help='Threaded WSGI vs the ASGI gateway: idle SSE connections held and req/s in one process')
+    asgi.add_argument('--idle', type=int, default=2000)
+    asgi.add_argument('--workers', type=int, default=32)
+    asgi.add_argument('--duration', type=float, default=10.0)
+    asgi.add_argument('--threads', type=int, default=32, help='ASGI_THREADS for the gateway')
+    asgi.add_argument('--timeout', type=float, default=10.0, help='Seconds to wait for each feed to open')
+    asgi.add_argument('--port', type=int, default=5301)
+    identity = sub.add_parser('identity', help='Requests per second on /partner/dashboard with and without the identity cache')
+    identity.add_argument('--requests', type=int, default=2000)
+    history = sub.add_parser('history', help='Keyset vs OFFSET pagination over a large order history')
+    history.add_argument('--orders', type=int, default=1000000)
+    storage = sub.add_parser('storage', help='Mixed read/write throughput for the default and tuned SQLite profiles')
+    storage.add_argument('--writers', type=int, default=8)
+    storage.add_argument('--claimers', type=int, default=8)
+    storage.add_argument('--readers', type=int, default=16)
+    storage.add_argument('--duration', type=float, default=10.0)
+    ingest = sub.add_parser('ingest', help='Streamed CSV/JSON Lines bulk order ingestion throughput and memory')
+    ingest.add_argument('--rows', type=int, default=100000)
+    ingest.add_argument('--baseline', type=int, default=1000)
+    export = sub.add_parser('export', help='Streaming CSV export throughput and memory on a large order table')
+    export.add_argument('--orders', type=int, default=5000000)
+    analytics = sub.add_parser('analytics', help='Rollup-backed analytics latency and backfill speed as order count grows')
+    analytics.add_argument('--orders', default='10000,100000,1000000')
+    analytics.add_argument('--days', type=int, default=30)
+    charges = sub.add_parser('charges', help='Bulk charge matrix repricing vs per-cell set_charge')
+    charges.add_argument('--areas', type=int, default=300)
+    charges.add_argument('--sample', type=int, default=300)
+    matrix = sub.add_parser('matrix', help='Admin dashboard payload and charge tile latency as areas grow')
+    matrix.add_argument('--areas', default='10,100,300,1000')
+    metrics = sub.add_parser('metrics', help='Per-request overhead of the metrics layer')
+    metrics.add_argument('--requests', type=int, default=3000)
+    suite = sub.add_parser('suite', help='Seeded mixed workload with per-endpoint latency, SQL per request and JSON baselines')
+    suite.add_argument('--areas', type=int, default=50)
+    suite.add_argument('--partners', type=int, default=1000)
+    suite.add_argument('--customers', type=int, default=5000)
+    suite.add_argument('--orders', type=int, default=1000000)
+    suite.add_argument('--customers-active', type=int, default=8, help='Concurrent customer sessions')
+    suite.add_argument('--partners-active', type=int, default=16, help='Concurrent partner sessions')
+    suite.add_argument('--admins-active', type=int, default=1, help='Concurrent admin sessions')
+    suite.add_argument('--duration', type=float, default=30.0)
+    suite.add_argument('--seed', type=int, default=42)
+    suite.add_argument('--db', help='Keep the seeded database at this path instead of a temporary file')
+    suite.add_argument('--save', help='Write the report as a JSON baseline')
+    suite.add_argument('--compare', help='Diff against a saved JSON baseline; exits 1 on regressions')
+    suite.add_argument('--tolerance', type=float, default=0.2)
+    suite.add_argument('--slow-query', type=float, default=2.0, help='Seconds before a statement is logged as slow')
+    seed = sub.add_parser('seed', help='flask seed-large insert rate and memory')
+    seed.add_argument('--areas', type=int, default=500)
+    seed.add_argument('--partners', type=int, default=50000)
+    seed.add_argument('--customers', type=int, default=200000)
+    seed.add_argument('--orders', type=int, default=2000000)
+    seed.add_argument('--memory', default='200000,1000000', help='Order counts to compare peak memory at')
+    seed.add_argument('--chunk', type=int, default=100000)
+    seed.add_argument('--seed', type=int, default=1)
+    heartbeat = sub.add_parser('heartbeat', help='Buffered JSON heartbeats vs set_area form posts')
+    heartbeat.add_argument('--partners', type=int, default=500)
+    heartbeat.add_argument('--threads', type=int, default=16)
+    heartbeat.add_argument('--duration', type=float, default=10.0)
+    heartbeat.add_argument('--interval', type=float, default=2.0)
+    startup = sub.add_parser('startup', help='Import time and create_app() cost with and without bootstrap work')
+    startup.add_argument('--runs', type=int, default=20)
+    etag = sub.add_parser('etag', help='Dashboard polls: full render vs 304 Not Modified')
+    etag.add_argument('--areas', type=int, default=500)
+    etag.add_argument('--orders', type=int, default=200)
+    etag.add_argument('--requests', type=int, default=500)
+    archive = sub.add_parser('archive', help='Hot-path reads before/after moving cold orders to orders_archive, and archive rate')
+    archive.add_argument('--areas', type=int, default=200)
+    archive.add_argument('--partners', type=int, default=5000)
+    archive.add_argument('--customers', type=int, default=50000)
+    archive.add_argument('--orders', type=int, default=1000000)
+    archive.add_argument('--days', type=int, default=90)
+    archive.add_argument('--batch', type=int, default=5000)
+    archive.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    COMMANDS[args.command](args)
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,50 @@
 import sys
 import os
+import csv
+import io
+import json
+import tempfile
+import time
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, insert
 
 # Ensure we can import delivery_app
 sys.path.append(os.getcwd())
 
 try:
-    from app import create_app, db, User, Area, Charge, Order, Setting
+    from app import create_app, db, User, Area, Charge, Order, Setting, AdminStats, PartnerStats, rebuild_admin_stats, bump_version, DispatchIndex
+    from app import fold_wallets, reconcile_wallets, wallet_balance_minor, DailyRouteStats, DailyPartnerStats, rebuild_rollups, seed_large, pricing_changed
+    from app import OrderArchive, archive_orders, order_export_statement, customer_history, partner_history, history_page, dispatch_tick
+    from app import pending_orders_in_area, active_orders_for_partner, customer_orders, partners_with_status, ACTIVE_ORDER_STATUSES, WalletEntry
     # from delivery_app.models import User, Area, Charge, Order, Setting # REMOVED
 except ImportError as e:
     print(f"Import Error: {e}")
     sys.exit(1)
 
+def explain_query_plan(query):
+    compiled = query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'render_postcompile': True})
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    with db.engine.connect() as conn:
+        return [row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params)]
+
+# Maximum SQL statements per dashboard request, however many rows it lists
+# The customer dashboard's history page is one keyset scan over live and one over archived orders
+QUERY_BUDGETS = {'/admin/dashboard': 7, '/partner/dashboard': 4, '/customer/dashboard': 4}
+
+class QueryCounter:
+    def __init__(self, app):
+        self.count = 0
+        with app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', self._count)
+
+    def _count(self, *args):
+        self.count += 1
+
+    def measure(self, client, path):
+        self.count = 0
+        client.get(path)
+        return self.count
+
 def run_test():
     print("Setting up app...")
     test_config = {
@@ -209,6 +243,593 @@ def run_test():
              print("FAILED: No warning message found.")
              # Double check DB?
 
+    print("14. Verifying Admin Stats Snapshot...")
+    client.post('/customer/login', data={'username': 'cust1', 'password': 'password'}, follow_redirects=True)
+    client.post('/customer/rate_order/1', data={'rating': '4'}, follow_redirects=True)
+    with app.app_context():
+        snapshot = db.session.get(AdminStats, 1)
+        incremental = (snapshot.total_orders, round(snapshot.total_earnings, 2), {(ps.partner_id, ps.completed_orders, ps.rating_total, ps.rating_count) for ps in PartnerStats.query.all()})
+        rebuilt = rebuild_admin_stats()
+        expected = (rebuilt.total_orders, round(rebuilt.total_earnings, 2), {(ps.partner_id, ps.completed_orders, ps.rating_total, ps.rating_count) for ps in PartnerStats.query.all()})
+    if incremental == expected:
+        print("SUCCESS: Incremental stats snapshot matches full rebuild.")
+    else:
+        print(f"FAILED: Stats snapshot drifted: {incremental} != {expected}")
+
+    print("15. Verifying Hot-Path Query Plans Use Indexes...")
+    with app.app_context():
+        hot_queries = {
+            'partner feed': pending_orders_in_area(1),
+            'partner active orders': active_orders_for_partner(partner_id),
+            'customer active orders': customer_orders(1, ('pending',) + ACTIVE_ORDER_STATUSES),
+            'customer completed orders': customer_orders(1, ('completed',)),
+            'admin partner lists': partners_with_status('pending'),
+            'charge lookup': Charge.query.filter_by(from_area_id=1, to_area_id=2),
+        }
+        full_scans = {}
+        for name, query in hot_queries.items():
+            plan = explain_query_plan(query)
+            scans = [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step]
+            if scans: full_scans[name] = plan
+    if full_scans:
+        for name, plan in full_scans.items():
+            print(f"FAILED: {name} does a full scan: {plan}")
+    else:
+        print("SUCCESS: All hot-path queries are served by an index.")
+
+    print("16. Verifying Fare Quotes Track Pricing Changes...")
+    client.post('/customer/login', data={'username': 'cust1', 'password': 'password'}, follow_redirects=True)
+    before = client.get('/customer/quote?pickup_area_id=1&drop_area_id=2').get_json()
+    client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'}, follow_redirects=True)
+    client.post('/admin/set_charge', data={'from_area_id': 1, 'to_area_id': 2, 'amount': 60.0}, follow_redirects=True)
+    after = client.get('/customer/quote?pickup_area_id=1&drop_area_id=2').get_json()
+    with app.app_context():
+        # Simulate another worker repricing: only the shared version counter tells us
+        Charge.query.filter_by(from_area_id=1, to_area_id=2).update({'amount': 70.0})
+        bump_version('pricing')
+        db.session.commit()
+        app.extensions['fare_engine'].check_interval = 0
+    remote = client.get('/customer/quote?pickup_area_id=1&drop_area_id=2').get_json()
+    with app.app_context():
+        # The local snapshot is only dropped once the pricing change commits
+        engine = app.extensions['fare_engine']
+        engine.current()
+        pricing_changed()
+        held = engine.snapshot is not None
+        db.session.commit()
+        dropped = engine.snapshot is None
+    if (before['amount'], after['amount'], remote['amount']) == (50.0, 60.0, 70.0) and after['commission'] == 12.0 and held and dropped:
+        print("SUCCESS: Quotes follow local and cross-worker pricing changes.")
+    else:
+        print(f"FAILED: Stale fare quotes: {before}, {after}, {remote}, snapshot held until commit {held}, dropped after {dropped}")
+
+    print("17. Verifying Dispatch Index Matches Database...")
+    with app.app_context():
+        live = app.extensions['dispatch_index']
+        rebuilt = DispatchIndex()
+        rebuilt.rebuild()
+        area_ids = [area.id for area in Area.query.all()]
+        live_view = {a: (live.idle_partners(a), live.pending_orders(a)) for a in area_ids}
+        rebuilt_view = {a: (rebuilt.idle_partners(a), rebuilt.pending_orders(a)) for a in area_ids}
+    if live_view == rebuilt_view:
+        print("SUCCESS: Incrementally maintained dispatch index matches a rebuild.")
+    else:
+        print(f"FAILED: Dispatch index drifted: {live_view} != {rebuilt_view}")
+
+    print("18. Verifying Dashboard Query Budgets...")
+    client.post('/partner/login', data={'username': 'partner', 'password': 'partner123'}, follow_redirects=True)
+    client.post('/partner/set_area', data={'area_id': 1}, follow_redirects=True)
+    client.get('/partner/toggle_status', follow_redirects=True)
+    counter = QueryCounter(app)
+    small = {path: counter.measure(client, path) for path in QUERY_BUDGETS}
+    with app.app_context():
+        customer_id = User.query.filter_by(username='cust1').first().id
+        rows = [{'customer_id': customer_id, 'pickup_area_id': 1 + i % 2, 'drop_area_id': 2 - i % 2, 'pickup_address': f'{i} Bulk St', 'drop_address': 'Drop St',
+                 'status': 'completed' if i % 2 else 'pending', 'amount': 50.0, 'commission': 5.0, 'rating': 1 + i % 5 if i % 4 == 1 else None} for i in range(400)]
+        db.session.execute(insert(Order), rows)
+        db.session.commit()
+    large = {path: counter.measure(client, path) for path in QUERY_BUDGETS}
+    over = {path: (small[path], large[path]) for path, budget in QUERY_BUDGETS.items() if max(small[path], large[path]) > budget}
+    if over:
+        print(f"FAILED: Dashboards over query budget (statements with few rows, with 400 more orders): {over}")
+    else:
+        print(f"SUCCESS: Dashboards stay within query budget regardless of row count: {large}")
+
+    print("19. Verifying Keyset-Paginated Order History...")
+    client.post('/customer/login', data={'username': 'cust1', 'password': 'password'}, follow_redirects=True)
+    seen, cursor, pages = [], None, 0
+    while True:
+        page = client.get('/customer/orders/history' + (f'?limit=50&cursor={cursor}' if cursor else '?limit=50')).get_json()
+        seen.extend(order['id'] for order in page['orders'])
+        pages += 1
+        cursor = page['next_cursor']
+        if not cursor: break
+    with app.app_context():
+        expected = [o.id for o in Order.query.filter_by(customer_id=customer_id, status='completed').order_by(Order.created_at.desc(), Order.id.desc())]
+    bad_cursor = client.get('/customer/orders/history?cursor=garbage').status_code
+    if seen == expected and bad_cursor == 400:
+        print(f"SUCCESS: {len(seen)} completed orders paged exactly once over {pages} pages.")
+    else:
+        print(f"FAILED: History pagination returned {len(seen)} orders ({len(set(seen))} unique), expected {len(expected)}; bad cursor -> {bad_cursor}")
+
+    print("20. Verifying Wallet Ledger Reconciles...")
+    with app.app_context():
+        partner1_id = User.query.filter_by(username='partner1').first().id
+        before_fold = wallet_balance_minor(partner1_id)
+        fold_wallets()
+        after_fold = wallet_balance_minor(partner1_id)
+        mirrored = db.session.get(User, partner1_id).wallet_balance
+        mismatches = reconcile_wallets()
+        # A partner with a pre-ledger float balance keeps it both before and after its first fold
+        legacy = User(username='legacy_wallet', password_hash='x', role='partner', status='active', wallet_balance=12.5)
+        db.session.add(legacy)
+        db.session.commit()
+        legacy_before = wallet_balance_minor(legacy.id)
+        fold_wallets()
+        legacy_after = wallet_balance_minor(legacy.id)
+    if before_fold == after_fold == 4000 and mirrored == 40.0 and not mismatches and legacy_before == legacy_after == 1250:
+        print("SUCCESS: Ledger, folded balance and completed orders agree ($40.00); legacy balance carried over.")
+    else:
+        print(f"FAILED: Wallet mismatch: before fold {before_fold}, after fold {after_fold}, mirror {mirrored}, {mismatches}, legacy {legacy_before} -> {legacy_after}")
+
+    print("21. Verifying Bulk Order Ingestion...")
+    with app.app_context():
+        total_before = db.session.get(AdminStats, 1).total_orders
+    csv_body = 'pickup_area_id,drop_area_id,pickup_address,drop_address\n1,2,1 Merchant Rd,2 Shop St\n1,999,1 Merchant Rd,Nowhere\n1,,1 Merchant Rd,Missing Area\n1,2,5 Short Row Rd\n'
+    csv_report = client.post('/customer/orders/bulk', data=csv_body, content_type='text/csv').get_data(as_text=True).splitlines()
+    jsonl_body = '{"pickup_area_id": 2, "drop_area_id": 1, "pickup_address": "3 Depot Ln", "drop_address": "4 Home Ave"}\nnot json\n{"pickup_area_id": 2, "drop_area_id": 1, "pickup_address": null, "drop_address": "4 Home Ave"}\n'
+    jsonl_report = client.post('/customer/orders/bulk', data=jsonl_body, content_type='application/x-ndjson').get_data(as_text=True).splitlines()
+    # Rejections are reported as they are read, acceptances when their chunk commits
+    results = [sorted((json.loads(line) for line in report[:-1]), key=lambda r: r['row']) for report in (csv_report, jsonl_report)]
+    statuses = [r['status'] for result in results for r in result]
+    accepted_ids = [r['order_id'] for result in results for r in result if r['status'] == 'accepted']
+    with app.app_context():
+        total_after = db.session.get(AdminStats, 1).total_orders
+        imported = Order.query.filter(Order.id.in_(accepted_ids), Order.status == 'pending', Order.customer_id == customer_id).count()
+        queued = all(order_id in app.extensions['dispatch_index'].order_areas for order_id in accepted_ids)
+    if statuses == ['accepted', 'rejected', 'rejected', 'rejected', 'accepted', 'rejected', 'rejected'] and imported == 2 and total_after == total_before + 2 and queued:
+        print("SUCCESS: CSV and JSON Lines imports priced, inserted and reported per row.")
+    else:
+        print(f"FAILED: Bulk import report {statuses}, imported {imported}, stats {total_before}->{total_after}, queued {queued}")
+
+    print("22. Verifying Streaming Order Export...")
+    client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'}, follow_redirects=True)
+    per_order = list(csv.DictReader(io.StringIO(client.get('/admin/export/orders.csv').get_data(as_text=True))))
+    per_partner = list(csv.DictReader(io.StringIO(client.get('/admin/export/orders.csv?group=partner').get_data(as_text=True))))
+    per_day = list(csv.DictReader(io.StringIO(client.get('/admin/export/orders.csv?group=day&status=all&area_id=1').get_data(as_text=True))))
+    bad_date = client.get('/admin/export/orders.csv?start=yesterday').status_code
+    with app.app_context():
+        completed = Order.query.filter_by(status='completed').count()
+        earnings = db.session.query(func.sum(Order.commission)).filter(Order.status == 'completed').scalar()
+        area_orders = Order.query.filter((Order.pickup_area_id == 1) | (Order.drop_area_id == 1)).count()
+    if (len(per_order) == completed and sum(int(r['orders']) for r in per_partner) == completed
+            and abs(sum(float(r['commission']) for r in per_partner) - earnings) < 0.01 and sum(int(r['orders']) for r in per_day) == area_orders and bad_date == 400):
+        print(f"SUCCESS: Per-order, per-partner and per-day exports agree on {completed} completed orders.")
+    else:
+        print(f"FAILED: Export mismatch: {len(per_order)} order rows, partner rows {per_partner}, day rows {per_day}, expected {completed}/{area_orders}; bad date -> {bad_date}")
+
+    print("23. Verifying Daily Rollups Match a Backfill...")
+    def rollup_snapshot():
+        routes = sorted((r.day, r.pickup_area_id, r.drop_area_id, r.orders_created, r.orders_completed, round(r.revenue, 2), round(r.commission, 2)) for r in DailyRouteStats.query)
+        partners = sorted((r.day, r.partner_id, r.deliveries, round(r.revenue, 2), round(r.commission, 2), r.rating_total, r.rating_count) for r in DailyPartnerStats.query)
+        return routes, partners
+    with app.app_context():
+        rebuild_rollups(chunk=50)
+    client.post('/customer/login', data={'username': 'cust1', 'password': 'password'}, follow_redirects=True)
+    client.post('/customer/create_order', data={'pickup_area_id': 2, 'pickup_address': 'Rollup St', 'drop_area_id': 1, 'drop_address': 'Drop St'})
+    client.post('/customer/orders/bulk', data='{"pickup_area_id": 1, "drop_area_id": 1, "pickup_address": "Rollup Ave", "drop_address": "Drop St"}\n', content_type='application/x-ndjson').get_data()
+    client.post('/partner/login', data={'username': 'partner', 'password': 'partner123'}, follow_redirects=True)
+    with app.app_context():
+        rollup_order_id = Order.query.filter_by(pickup_address='Rollup St').first().id
+    client.get(f'/partner/accept_order/{rollup_order_id}')
+    client.get(f'/partner/update_status/{rollup_order_id}/completed')
+    client.post(f'/customer/rate_order/{rollup_order_id}', data={'rating': '4'})
+    client.post(f'/customer/rate_order/{rollup_order_id}', data={'rating': '2'})
+    with app.app_context():
+        delivered = db.session.get(Order, rollup_order_id)
+        delivered_status, delivered_rating = delivered.status, delivered.rating
+        incremental = rollup_snapshot()
+        rebuild_rollups(chunk=50)
+        rebuilt = rollup_snapshot()
+    client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'}, follow_redirects=True)
+    analytics = client.get('/admin/analytics?days=7')
+    if incremental == rebuilt and delivered_status == 'completed' and delivered_rating == 2 and analytics.status_code == 200 and b'Daily Volume' in analytics.data:
+        print(f"SUCCESS: Incremental rollups match a chunked backfill ({len(rebuilt[0])} route days, {len(rebuilt[1])} partner days).")
+    else:
+        print(f"FAILED: Rollups drifted (order {delivered_status}, rating {delivered_rating}, analytics {analytics.status_code}): {incremental} != {rebuilt}")
+
+    print("24. Verifying Bulk Charge Matrix Updates...")
+    client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'}, follow_redirects=True)
+    client.post('/admin/add_area', data={'name': 'Area Bulk', 'self_charge': '20', 'distance_1': '60', 'distance_2': '70'})
+    with app.app_context():
+        bulk_area = Area.query.filter_by(name='Area Bulk').first().id
+        version_before = app.extensions['fare_engine'].current()[0]
+    matrix = client.post('/admin/charges', json={'area_ids': [1, bulk_area], 'amounts': [[35.0, 65.0], [65.0, None]]})
+    sparse = client.post('/admin/charges', json={'charges': [{'from_area_id': 2, 'to_area_id': bulk_area, 'amount': 75}, {'from_area_id': 2, 'to_area_id': 1, 'amount': None}]})
+    unknown = client.post('/admin/charges', json={'charges': [{'from_area_id': 1, 'to_area_id': 9999, 'amount': 5}]}).status_code
+    # Resending the same matrix writes nothing; the missing route was already removed
+    repeat = client.post('/admin/charges', json={'area_ids': [1, bulk_area], 'amounts': [[35.0, 65.0], [65.0, None]]}).get_json()
+    with app.app_context():
+        pairs = {(c.from_area_id, c.to_area_id): c.amount for c in Charge.query}
+        duplicates = db.session.query(Charge.from_area_id, Charge.to_area_id).group_by(Charge.from_area_id, Charge.to_area_id).having(func.count() > 1).count()
+        engine = app.extensions['fare_engine']
+        quotes = (engine.quote(1, bulk_area), engine.quote(bulk_area, bulk_area), engine.quote(2, 1))
+        version_after = engine.current()[0]
+    expected = {(1, 1): 35.0, (1, bulk_area): 65.0, (bulk_area, 1): 65.0, (2, bulk_area): 75.0, (bulk_area, 2): 70.0}
+    if (all(pairs.get(pair) == amount for pair, amount in expected.items()) and (bulk_area, bulk_area) not in pairs and (2, 1) not in pairs and not duplicates
+            and matrix.get_json()['updated'] == 3 and sparse.get_json()['removed'] == 1 and unknown == 400 and (repeat['updated'], repeat['removed']) == (0, 0)
+            and quotes[0][0] == 65.0 and quotes[1] is None and quotes[2] is None and version_after > version_before):
+        print("SUCCESS: Matrix and sparse charge updates upsert in place and reprice quotes.")
+    else:
+        print(f"FAILED: Charge matrix {pairs}, duplicates {duplicates}, responses {matrix.get_json()} {sparse.get_json()} {repeat} {unknown}, quotes {quotes}, versions {version_before}->{version_after}")
+    # Restore the pairs earlier steps price against
+    client.post('/admin/charges', json={'charges': [{'from_area_id': 1, 'to_area_id': 1, 'amount': 30.0}, {'from_area_id': 2, 'to_area_id': 1, 'amount': 50.0}]})
+
+    print("25. Verifying Charge Matrix Tiles...")
+    client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'}, follow_redirects=True)
+    before_html = len(client.get('/admin/dashboard').data)
+    with app.app_context():
+        db.session.execute(insert(Area), [{'name': f'Tile Area {i}'} for i in range(60)])
+        pricing_changed()
+        db.session.commit()
+    tiled = client.get('/admin/charges/areas').get_json()
+    tile_size = tiled['tile_size']
+    positions = {area_id: i for i, (area_id, _) in enumerate(tiled['areas'])}
+    served = {}
+    for row in range(-(-len(positions) // tile_size)):
+        for col in range(-(-len(positions) // tile_size)):
+            tile = client.get(f'/admin/charges/tile?row={row}&col={col}').get_json()
+            for i, amounts in enumerate(tile['amounts']):
+                for j, amount in enumerate(amounts):
+                    if amount is not None: served[(tiled['areas'][row * tile_size + i][0], tiled['areas'][col * tile_size + j][0])] = amount
+    after_html = len(client.get('/admin/dashboard').data)
+    with app.app_context():
+        stored = {(c.from_area_id, c.to_area_id): c.amount for c in Charge.query}
+        area_total = Area.query.count()
+    if served == stored and len(positions) == area_total and abs(after_html - before_html) < 16:
+        print(f"SUCCESS: {area_total} areas served once and the matrix in {tile_size}x{tile_size} tiles; dashboard HTML unchanged in size ({after_html} bytes).")
+    else:
+        print(f"FAILED: Tiles {served} != {stored}, {len(positions)}/{area_total} areas, dashboard {before_html} -> {after_html} bytes")
+
+    print("26. Verifying Request and SQL Metrics...")
+    client.post('/customer/login', data={'username': 'cust1', 'password': 'password'}, follow_redirects=True)
+    counter = QueryCounter(app)
+    before = app.extensions['metrics'].endpoints.get('customer.dashboard', [None, 0, 0.0, 0])
+    before_count, before_sql = before[1], before[3]
+    expected_sql = sum(counter.measure(client, '/customer/dashboard') for _ in range(3))
+    exposition = client.get('/metrics').get_data(as_text=True)
+    samples = dict(line.rsplit(' ', 1) for line in exposition.splitlines() if not line.startswith('#'))
+    requests_seen = int(samples['routex_request_duration_seconds_count{endpoint="customer.dashboard"}']) - before_count
+    sql_seen = int(samples['routex_sql_statements_total{endpoint="customer.dashboard"}']) - before_sql
+    inf_bucket = samples['routex_request_duration_seconds_bucket{endpoint="customer.dashboard",le="+Inf"}']
+    disabled = create_app({**test_config, 'METRICS_ENABLED': False})
+    disabled_status = disabled.test_client().get('/metrics').status_code
+    if requests_seen == 3 and sql_seen == expected_sql and inf_bucket == samples['routex_request_duration_seconds_count{endpoint="customer.dashboard"}'] and disabled_status == 404:
+        print(f"SUCCESS: /metrics reports {requests_seen} dashboard requests and their {sql_seen} SQL statements; disabled by config.")
+    else:
+        print(f"FAILED: Metrics saw {requests_seen} requests/{sql_seen} statements (expected 3/{expected_sql}), +Inf {inf_bucket}, disabled -> {disabled_status}")
+
+    print("27. Verifying Deterministic Large Seeding...")
+    digests = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for run in range(2):
+            seeded = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/seed{run}.db', 'METRICS_ENABLED': False})
+            with seeded.app_context():
+                seed_large(areas=12, partners=200, customers=500, orders=20000, days=30, seed=7, chunk=3000)
+                rows = db.session.query(Order.customer_id, Order.partner_id, Order.pickup_area_id, Order.drop_area_id, Order.status, Order.amount, Order.rating, Order.created_at).order_by(Order.id).all()
+                index_names = {row[0] for row in db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'orders'"))}
+                statuses = {status for _, _, _, _, status, *_ in rows}
+                try:
+                    seed_large(areas=1, partners=1, customers=1, orders=1)
+                    refused = False
+                except ValueError:
+                    refused = True
+                digests.append((hash(tuple(rows)), len(rows), reconcile_wallets(), {index.name for index in Order.__table__.indexes} <= index_names, statuses, refused))
+                db.engine.dispose()
+    first, second = digests
+    if first == second and first[1] == 20000 and first[2] == {} and first[3] and {'completed', 'pending'} <= first[4] and first[5]:
+        print(f"SUCCESS: Same seed, same {first[1]} orders; wallets reconcile, indexes rebuilt and reseeding refused.")
+    else:
+        print(f"FAILED: Seeded runs differ or are inconsistent: {first[1:]} vs {second[1:]}")
+
+    print("28. Verifying Buffered Partner Heartbeats...")
+    with tempfile.TemporaryDirectory() as tmp:
+        buffered = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/heartbeat.db', 'HEARTBEAT_FLUSH_INTERVAL': 3600})
+        partner_client = buffered.test_client()
+        partner_client.post('/partner/login', data={'username': 'partner', 'password': 'partner123'})
+        writes = []
+        with buffered.app_context():
+            area_a, area_b = [area.id for area in Area.query.order_by(Area.id).limit(2)]
+            partner_id = User.query.filter_by(username='partner').first().id
+            event.listen(db.engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: writes.append(statement) if statement.startswith('UPDATE users') else None)
+        statuses = [partner_client.post('/partner/heartbeat', json={'area_id': area_id, 'is_online': True}).status_code for area_id in (area_a, area_b, area_a, area_b)]
+        rejected = [partner_client.post('/partner/heartbeat', json=body).status_code for body in ({'area_id': 9999}, {'is_online': 'yes'}, [1])]
+        dashboard = partner_client.get('/partner/dashboard').get_data(as_text=True)
+        with buffered.app_context():
+            stored_before = db.session.query(User.current_area_id, User.is_online).filter(User.id == partner_id).one()
+            idle_before = partner_id in buffered.extensions['dispatch_index'].idle_partners(area_b)
+            writes_before = len(writes)
+            flushed = buffered.extensions['heartbeats'].flush()
+            stored_after = db.session.query(User.current_area_id, User.is_online).filter(User.id == partner_id).one()
+        partner_client.get('/partner/toggle_status')
+        bad_area = partner_client.post('/partner/set_area', data={'area_id': 9999}).status_code
+        with buffered.app_context():
+            toggled = db.session.query(User.current_area_id, User.is_online).filter(User.id == partner_id).one()
+            toggle_writes = len(writes)
+            # A row the users FK rejects is dropped on flush; other partners' rows still land
+            other_id = User.query.filter_by(username='partner').first().id
+            customer_id = User.query.filter_by(role='customer').first().id
+            db.session.execute(db.update(User).where(User.id == customer_id).values(role='partner'))
+            db.session.commit()
+            buffer = buffered.extensions['heartbeats']
+            buffer.record(customer_id, 9999, True)
+            buffer.record(other_id, area_a, True)
+            written = buffer.flush()
+            mixed = (written, db.session.query(User.current_area_id).filter(User.id == other_id).scalar(), dict(buffer.pending), buffer.flush(),
+                     buffered.extensions['dispatch_index'].partners[customer_id][0])
+            db.engine.dispose()
+    if (statuses == [200] * 4 and rejected == [400] * 3 and 'Area B' in dashboard and stored_before[0] is None and idle_before and writes_before == 0
+            and flushed == 1 and toggle_writes == 2 and tuple(stored_after) == (area_b, True) and tuple(toggled) == (area_b, False)
+            and bad_area == 400 and mixed == (1, area_a, {}, 0, None)):
+        print("SUCCESS: Four heartbeats coalesced into one batched UPDATE; reads served from the buffer meanwhile.")
+    else:
+        print(f"FAILED: Heartbeats {statuses} {rejected}, stored {stored_before} -> {stored_after} -> {toggled}, idle {idle_before}, UPDATEs {writes_before}/{toggle_writes}, flushed {flushed}, bad area {bad_area}, mixed flush {mixed}")
+
+    print("29. Verifying Dashboard ETags and Fragment Cache...")
+    customer_client, partner_client, admin_client = app.test_client(), app.test_client(), app.test_client()
+    customer_client.post('/customer/login', data={'username': 'cust1', 'password': 'password'})
+    partner_client.post('/partner/login', data={'username': 'partner1', 'password': 'password'})
+    admin_client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'})
+
+    def poll(client, path, etag):
+        counter.count = 0
+        response = client.get(path, headers={'If-None-Match': etag} if etag else {})
+        return response.status_code, response.headers.get('ETag', '').strip('"'), counter.count, response.get_data(as_text=True)
+
+    _, customer_etag, _, _ = poll(customer_client, '/customer/dashboard', None)
+    _, partner_etag, _, _ = poll(partner_client, '/partner/dashboard', None)
+    unchanged = [poll(customer_client, '/customer/dashboard', customer_etag)[::2], poll(partner_client, '/partner/dashboard', partner_etag)[::2]]
+    customer_client.post('/customer/create_order', data={'pickup_area_id': 1, 'pickup_address': 'ETag St', 'drop_area_id': 2, 'drop_address': 'Drop St'})
+    after_order = [poll(customer_client, '/customer/dashboard', customer_etag), poll(partner_client, '/partner/dashboard', partner_etag)]
+    admin_client.post('/admin/add_area', data={'name': 'ETag Area', 'self_charge': 25}, follow_redirects=True)
+    after_area = poll(customer_client, '/customer/dashboard', after_order[0][1])
+    partner_client.post('/partner/set_area', data={'area_id': 2})
+    partner_client.get('/partner/accept_order/999999')
+    flashed = poll(partner_client, '/partner/dashboard', after_order[1][1])
+    # The partner's current area is the selected option, rendered as markup
+    selected = '<option value="2" selected>Area B</option>' in flashed[3] and '&lt;option' not in flashed[3]
+    _, tile_etag, _, _ = poll(admin_client, '/admin/charges/tile?row=0&col=0', None)
+    tile = poll(admin_client, '/admin/charges/tile?row=0&col=0', tile_etag)
+    if (unchanged == [(304, 1), (304, 1)] and [status for status, *_ in after_order] == [200, 200] and after_order[0][1] != customer_etag and after_order[1][1] != partner_etag
+            and after_area[0] == 200 and 'ETag Area</option>' in after_area[3] and flashed[0] == 200 and selected and tile[0] == 304 and tile[2] <= 1):
+        print("SUCCESS: Unchanged dashboards answer 304 with one version query; orders, areas and flashes invalidate them.")
+    else:
+        print(f"FAILED: Unchanged {unchanged}, after order {[r[:3] for r in after_order]}, after area {after_area[:3]}, flashed {flashed[:3]}, selected area rendered {selected}, tile {tile[:3]}")
+
+    print("30. Verifying Archived Orders Stay Visible...")
+    with tempfile.TemporaryDirectory() as tmp:
+        archived = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/archive.db', 'METRICS_ENABLED': False})
+        with archived.app_context():
+            seed_large(areas=8, partners=50, customers=100, orders=6000, days=30, seed=3, chunk=2000)
+            customer_id, partner_id = db.session.query(Order.customer_id, Order.partner_id).filter(Order.status == 'completed', Order.rating.isnot(None)).order_by(Order.id).first()
+
+            def walk(queries):
+                ids, cursor = [], None
+                while True:
+                    page, cursor = history_page(queries(), cursor, limit=7)
+                    ids += [order.id for order in page]
+                    if not cursor: return ids
+
+            def snapshot():
+                rebuild_admin_stats()
+                rebuild_rollups(chunk=1500)
+                stats = db.session.get(AdminStats, 1)
+                return {'stats': (stats.total_orders, round(stats.total_earnings, 2), sorted(db.session.query(PartnerStats.partner_id, PartnerStats.completed_orders, PartnerStats.rating_total).all())),
+                        'exports': [db.session.execute(order_export_statement(group)).all() for group in ('order', 'partner', 'day')],
+                        'rollups': sorted(db.session.query(DailyRouteStats.day, DailyRouteStats.pickup_area_id, DailyRouteStats.drop_area_id, DailyRouteStats.orders_created, DailyRouteStats.orders_completed, func.round(DailyRouteStats.revenue, 2)).all()),
+                        'wallets': reconcile_wallets(),
+                        'history': (walk(lambda: customer_history(customer_id)), walk(lambda: partner_history(partner_id)))}
+
+            live_before = db.session.query(func.count(Order.id)).scalar()
+            before = snapshot()
+            moved = archive_orders(10, batch=500)
+            live_after = db.session.query(func.count(Order.id)).scalar()
+            after = snapshot()
+            archived_count = db.session.query(func.count(OrderArchive.id)).scalar()
+            history_archived = db.session.query(func.count(OrderArchive.id)).filter(OrderArchive.customer_id == customer_id).scalar()
+            db.engine.dispose()
+    differs = [name for name in before if before[name] != after[name]]
+    if moved > 0 and archived_count == moved and live_after == live_before - moved and history_archived and not differs and before['wallets'] == {}:
+        print(f"SUCCESS: Archived {moved} of {live_before} orders; stats, exports, rollups, wallets and history unchanged.")
+    else:
+        print(f"FAILED: Moved {moved} ({archived_count} archived), live {live_before} -> {live_after}, customer archived {history_archived}, changed {differs}")
+
+    print("31. Verifying Batch Dispatch...")
+    with tempfile.TemporaryDirectory() as tmp:
+        batch = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/dispatch.db', 'METRICS_ENABLED': False})
+        with batch.app_context():
+            area_a, area_b = [area.id for area in Area.query.order_by(Area.id).limit(2)]
+            customer_id = User.query.filter_by(username='customer').first().id
+            partners = [User(username=f'dispatch{i}', password_hash='x', role='partner', status='active', is_online=True, current_area_id=area_a if i < 3 else area_b) for i in range(5)]
+            db.session.add_all(partners)
+            db.session.commit()
+            best, good, loaded, other, stale = [partner.id for partner in partners]
+            db.session.add_all([PartnerStats(partner_id=best, rating_total=25, rating_count=5), PartnerStats(partner_id=good, rating_total=20, rating_count=5),
+                                DailyPartnerStats(day=datetime.utcnow().date(), partner_id=loaded, deliveries=6)])
+            orders = [Order(customer_id=customer_id, pickup_area_id=area_a if i < 3 else area_b, drop_area_id=area_a, pickup_address=f'{i} Tick St', drop_address='Drop St',
+                            amount=50.0, commission=5.0, status='pending', created_at=datetime(2026, 1, 1) + timedelta(minutes=i)) for i in range(5)]
+            # Another process made `stale` busy; this process's index still lists them as idle
+            db.session.add_all(orders + [Order(customer_id=customer_id, pickup_area_id=area_b, drop_area_id=area_a, pickup_address='Busy St', drop_address='Drop St',
+                                               amount=50.0, commission=5.0, status='accepted', partner_id=stale)])
+            db.session.commit()
+            batch.extensions['dispatch_index'].rebuild()
+            batch.extensions['dispatch_index'].update_partner(stale, is_busy=False)
+            writes = []
+            event.listen(db.engine, 'before_cursor_execute', lambda conn, cursor, statement, *args: writes.append(statement) if 'UPDATE orders' in statement else None)
+            claimed = {row.id: row.partner_id for row in dispatch_tick()}
+            expected = {orders[0].id: best, orders[1].id: good, orders[2].id: loaded, orders[3].id: other}
+            repeat = dispatch_tick()
+            still_pending = batch.extensions['dispatch_index'].pending_count(area_b)
+            db.engine.dispose()
+        ticking = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/ticking.db', 'METRICS_ENABLED': False, 'DISPATCH_MODE': 'batch', 'DISPATCH_TICK_INTERVAL': 0.05})
+        with ticking.app_context():
+            area_id = Area.query.order_by(Area.id).first().id
+            partner = User.query.filter_by(username='partner').first()
+            partner.is_online, partner.current_area_id, partner_id = True, area_id, partner.id
+            order = Order(customer_id=User.query.filter_by(username='customer').first().id, pickup_area_id=area_id, drop_area_id=area_id, pickup_address='Tick St', drop_address='Drop St', amount=30.0, commission=3.0)
+            db.session.add(order)
+            db.session.commit()
+            ticking.extensions['dispatch_index'].rebuild()
+            deadline = time.time() + 5
+            while ticking.extensions['dispatcher'].assigned == 0 and time.time() < deadline: time.sleep(0.02)
+            ticking.extensions['dispatcher'].stop()
+            background = db.session.query(Order.partner_id, Order.status).filter(Order.id == order.id).one()
+            db.engine.dispose()
+    if claimed == expected and len(writes) == 1 and repeat == [] and still_pending == 1 and tuple(background) == (partner_id, 'accepted'):
+        print("SUCCESS: Oldest orders went to the best-rated, least-loaded idle partners in one UPDATE; busy partners skipped; the ticker assigns in the background.")
+    else:
+        print(f"FAILED: Claimed {claimed} (expected {expected}), {len(writes)} UPDATEs, repeat {repeat}, pending {still_pending}, background {tuple(background)}")
+
+    print("32. Verifying ASGI Gateway...")
+    import asyncio
+    from asgi import AsgiGateway
+    with tempfile.TemporaryDirectory() as tmp:
+        served = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/asgi.db', 'FEED_KEEPALIVE_INTERVAL': 0.2})
+        gateway = AsgiGateway(served)
+        login_client = served.test_client()
+        login_client.post('/partner/login', data={'username': 'partner', 'password': 'partner123'})
+        cookie = f"session={login_client.get_cookie('session').value}"
+
+        async def call(method, path, body=b'', disconnect_after=None):
+            scope = {'type': 'http', 'method': method, 'path': path, 'root_path': '', 'query_string': b'', 'http_version': '1.1', 'scheme': 'http',
+                     'server': ('localhost', 80), 'headers': [(b'cookie', cookie.encode()), (b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]}
+            inbox = [{'type': 'http.request', 'body': body}]
+            sent, done = [], asyncio.Event()
+
+            async def receive():
+                if inbox: return inbox.pop(0)
+                await done.wait()
+                return {'type': 'http.disconnect'}
+
+            async def send(message):
+                sent.append(message)
+                if disconnect_after and sum(1 for m in sent if m.get('body')) >= disconnect_after: done.set()
+
+            await gateway(scope, receive, send)
+            return sent[0]['status'], b''.join(m.get('body', b'') for m in sent[1:])
+
+        async def scenario():
+            heartbeat = await call('POST', '/partner/heartbeat', json.dumps({'area_id': 1, 'is_online': True}).encode())
+            stream = asyncio.ensure_future(call('GET', '/partner/feed', disconnect_after=3))
+            while served.extensions['order_feed'].subscriber_count(1) == 0: await asyncio.sleep(0.01)
+            subscribed = served.extensions['order_feed'].subscriber_count(1)
+            await asyncio.get_running_loop().run_in_executor(None, lambda: served.extensions['order_feed'].publish(1, 'order_created', {'id': 42}))
+            feed = await asyncio.wait_for(stream, 5)
+            dashboard = await call('GET', '/partner/dashboard')
+            return heartbeat, subscribed, feed, dashboard
+
+        heartbeat, subscribed, feed, dashboard = asyncio.run(scenario())
+        remaining = served.extensions['order_feed'].subscriber_count()
+        with served.app_context():
+            served.extensions['heartbeats'].flush()
+            db.engine.dispose()
+    if (heartbeat[0] == 200 and subscribed == 1 and feed[0] == 200 and b'event: order_created' in feed[1] and b'"id": 42' in feed[1]
+            and remaining == 0 and dashboard[0] == 200 and b'Area A' in dashboard[1]):
+        print("SUCCESS: Heartbeats and the SSE feed run on the ASGI gateway; blueprints work through the WSGI fallback; disconnects unsubscribe.")
+    else:
+        print(f"FAILED: Heartbeat {heartbeat}, subscribers {subscribed}/{remaining}, feed {feed}, dashboard {dashboard[0]}")
+
+    print("33. Verifying Partner Removal With Archived Orders...")
+    with tempfile.TemporaryDirectory() as tmp:
+        archived = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/remove.db', 'METRICS_ENABLED': False})
+        with archived.app_context():
+            area_id = Area.query.order_by(Area.id).first().id
+            customer_id = User.query.filter_by(username='customer').first().id
+            leaving = User(username='leaving', password_hash='x', role='partner', status='active')
+            db.session.add(leaving)
+            db.session.commit()
+            leaving_id = leaving.id
+            db.session.add_all([Order(customer_id=customer_id, partner_id=leaving_id, pickup_area_id=area_id, drop_area_id=area_id, pickup_address=f'{i} Old St', drop_address='Drop St',
+                                      amount=30.0, commission=3.0, status='completed', rating=5, created_at=datetime.utcnow() - timedelta(days=200)) for i in range(3)])
+            db.session.commit()
+            moved = archive_orders(90)
+        admin_client = archived.test_client()
+        admin_client.post('/admin/login', data={'username': 'admin', 'password': 'admin123'})
+        status = admin_client.get(f'/admin/remove_partner/{leaving_id}').status_code
+        with archived.app_context():
+            gone = db.session.get(User, leaving_id) is None
+            orphaned = db.session.query(func.count(OrderArchive.id)).filter(OrderArchive.partner_id.is_(None)).scalar()
+            foreign_keys = db.session.execute(db.text('PRAGMA foreign_keys')).scalar()
+            db.engine.dispose()
+    if moved == 2 and status == 302 and gone and orphaned == 2 and foreign_keys == 1:
+        print("SUCCESS: Partners with archived orders can be removed; their archived orders keep the history without the partner.")
+    else:
+        print(f"FAILED: Moved {moved}, remove -> {status}, user gone {gone}, archived without partner {orphaned}, foreign_keys {foreign_keys}")
+
+    print("34. Verifying Startup On A Pre-Index Database...")
+    import sqlite3
+    with tempfile.TemporaryDirectory() as tmp:
+        # The original schema, with a route priced twice the way older add_area calls left it
+        legacy = sqlite3.connect(f'{tmp}/legacy.db')
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'database', 'schema.sql')) as schema:
+            legacy.executescript(schema.read())
+        legacy.executescript("""
+            INSERT INTO areas (name) VALUES ('Area A'), ('Area B');
+            INSERT INTO charges (from_area_id, to_area_id, amount) VALUES (1, 2, 55.0), (1, 2, 99.0);
+        """)
+        legacy.commit()
+        legacy.close()
+        try:
+            upgraded = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/legacy.db', 'METRICS_ENABLED': False})
+            with upgraded.app_context():
+                prices = [amount for (amount,) in db.session.query(Charge.amount).filter_by(from_area_id=1, to_area_id=2)]
+                quote = upgraded.extensions['fare_engine'].quote(1, 2)
+                index_names = {row[0] for row in db.session.execute(db.text("SELECT name FROM sqlite_master WHERE type = 'index'"))}
+                declared = {index.name for table in db.metadata.sorted_tables for index in table.indexes}
+                defaults = Charge.query.count()
+                # A database bootstrapped before the order archive existed gets the table on the next start
+                db.session.execute(db.text('DROP TABLE orders_archive'))
+                db.session.execute(db.text("UPDATE data_versions SET version = 1 WHERE name = 'bootstrap'"))
+                db.session.commit()
+                db.engine.dispose()
+            restarted = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/legacy.db', 'METRICS_ENABLED': False})
+            with restarted.app_context():
+                archive_rows = db.session.query(func.count(OrderArchive.id)).scalar()
+                db.engine.dispose()
+            booted = None
+        except Exception as e:
+            booted, prices, quote, index_names, declared, defaults, archive_rows = e, None, None, set(), {'?'}, 0, None
+    if booted is None and prices == [55.0] and quote and quote[0] == 55.0 and declared <= index_names and defaults == 4 and archive_rows == 0:
+        print("SUCCESS: An existing pre-index database boots: duplicate charge removed (oldest price kept), indexes added, defaults filled in, archive table added.")
+    else:
+        print(f"FAILED: Boot error {booted!r}, prices {prices}, quote {quote}, missing indexes {declared - index_names}, {defaults} charges, archive rows {archive_rows}")
+
+    print("35. Verifying Finished Orders Keep Their Status...")
+    with tempfile.TemporaryDirectory() as tmp:
+        finished = create_app({**test_config, 'SQLALCHEMY_DATABASE_URI': f'sqlite:///{tmp}/finished.db', 'METRICS_ENABLED': False})
+        with finished.app_context():
+            area_id = Area.query.order_by(Area.id).first().id
+            customer_id = User.query.filter_by(username='customer').first().id
+            order = Order(customer_id=customer_id, pickup_area_id=area_id, drop_area_id=area_id, pickup_address='1 Done St', drop_address='2 Done St', amount=30.0, commission=3.0, status='pending')
+            db.session.add(order)
+            db.session.commit()
+            order_id = order.id
+            finished.extensions['dispatch_index'].rebuild()
+        partner_client = finished.test_client()
+        partner_client.post('/partner/login', data={'username': 'partner', 'password': 'partner123'})
+        partner_client.get(f'/partner/accept_order/{order_id}')
+        steps = [partner_client.get(f'/partner/update_status/{order_id}/{status}').status_code for status in ('picked_up', 'completed', 'picked_up', 'completed', 'declined', 'completed')]
+        with finished.app_context():
+            final = db.session.get(Order, order_id)
+            credits = db.session.query(func.count(WalletEntry.id)).filter_by(order_id=order_id).scalar()
+            requeued = order_id in finished.extensions['dispatch_index'].pending_orders(area_id)
+            state = (final.status, final.partner_id is not None)
+            db.engine.dispose()
+    if steps == [302] * 6 and state == ('completed', True) and credits == 1 and not requeued:
+        print("SUCCESS: A completed order can't be reopened, declined back into the queue or credited twice.")
+    else:
+        print(f"FAILED: Responses {steps}, order {state}, {credits} credits, requeued {requeued}")
+
 if __name__ == '__main__':
     try:
         run_test()